@@ -45,19 +45,33 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # Busca textual e trigramas (core.busca_medicos)
     'core',
     'rest_framework',
     'rest_framework_simplejwt.token_blacklist',
     "corsheaders",
 ]
-CACHES = {
-    "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-        "LOCATION": "cadastro-verificacao",
+# Com vários workers o cache precisa ser compartilhado (limites de requisição,
+# códigos de verificação, versões de ETag): defina REDIS_URL em produção.
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "core.instrumentacao.RedisCacheMedido",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "core.instrumentacao.LocMemCacheMedido",
+            "LOCATION": "cadastro-verificacao",
+        }
     }
-}
 
 MIDDLEWARE = [
+    # Primeiro, para a medição (core.instrumentacao) cobrir a requisição inteira
+    'core.middleware.ActivityMiddleware',
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -66,7 +80,6 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'core.middleware.ActivityMiddleware',
 ]
 
 # Configurações de CORS
@@ -190,8 +203,23 @@ from datetime import timedelta
 
 REST_FRAMEWORK = {
      'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWT do simplejwt, com o usuário lido do cache em vez do banco
+        'core.authentication.JWTUsuarioEmCacheAuthentication',
     ),
+    # Proxies reversos à frente da aplicação: o IP do cliente (limites por IP) é
+    # lido do X-Forwarded-For só até essa profundidade. Com 0 vale o REMOTE_ADDR;
+    # atrás do balanceador do Render, use NUM_PROXIES=1.
+    'NUM_PROXIES': config('NUM_PROXIES', default=0, cast=int),
+    # Endpoints públicos de cadastro/verificação (core.throttling): N requisições
+    # de uma vez, reabastecidas aos poucos ao longo do período
+    'DEFAULT_THROTTLE_RATES': {
+        'enviar_codigo_ip': '10/hour',
+        'enviar_codigo_email': '3/hour',
+        'verificar_codigo_ip': '30/min',
+        'verificar_codigo_email': '10/min',
+        'validar_cadastro_ip': '30/min',
+        'validar_cadastro_valor': '10/min',
+    },
 }
 
 SIMPLE_JWT =  {
@@ -216,7 +244,49 @@ SIMPLE_JWT =  {
     # --- Configurações de renovação automática ---
     "AUTH_COOKIE_REFRESH": True,                     # Permite renovação automática do token
     "AUTH_COOKIE_REFRESH_THRESHOLD": 300,            # Renova quando faltar 5 minutos
+
+    # Checa a blacklist pelo filtro em memória antes de ir ao banco (core.tokens)
+    "TOKEN_REFRESH_SERIALIZER": "core.tokens.RenovarTokenSerializer",
 }
+# Intervalo de reconstrução do filtro de tokens revogados em cada processo. O
+# filtro só é usado com cache compartilhado (REDIS_URL); sem ele a blacklist é
+# sempre checada no banco.
+# Limpe os tokens expirados com `python manage.py purgar_tokens`.
+MEDAGENDA_FILTRO_TOKENS_SEGUNDOS = 300
+# Por quantos segundos o refresh token que acabou de ser renovado pelo cookie
+# ainda devolve o mesmo par novo (abas abertas ao mesmo tempo)
+MEDAGENDA_RENOVACAO_GRACA_SEGUNDOS = 10
+# Tabela materializada de vagas (core.Slot). Quando ativa, a disponibilidade
+# é lida da tabela; rode `python manage.py estender_slots` uma vez por noite.
+MEDAGENDA_SLOTS_MATERIALIZADOS = False
+MEDAGENDA_SLOTS_HORIZONTE_DIAS = 90
+# Registros de agendamentos removidos (sincronização incremental) ficam este
+# tempo; tokens de sincronização mais antigos exigem nova carga inicial.
+# Limpe os vencidos com `python manage.py purgar_removidos`.
+MEDAGENDA_SINCRONIZACAO_RETENCAO_DIAS = 30
+
+# Medição de cada requisição (core.instrumentacao): header Server-Timing e uma
+# linha de log por requisição; acima do limite, warning com o SQL mais lento.
+MEDAGENDA_INSTRUMENTACAO = True
+MEDAGENDA_REQUISICAO_LENTA_MS = 500
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        # Por padrão só as requisições lentas; LOG_REQUISICOES=INFO registra
+        # uma linha por requisição
+        "core.instrumentacao": {
+            "handlers": ["console"],
+            "level": config('LOG_REQUISICOES', default='WARNING'),
+            "propagate": False,
+        },
+    },
+}
+
 # settings.py
 GOOGLE_CLIENT_ID = config('GOOGLE_CLIENT_ID')
 GOOGLE_CLIENT_SECRET = config('GOOGLE_CLIENT_SECRET')
@@ -230,3 +300,14 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = 'medagendasistema@gmail.com'
 EMAIL_HOST_PASSWORD = 'lmac gnzs fucb nljf'  # Não sua senha normal
 DEFAULT_FROM_EMAIL = 'medagendasistema@gmail.com'
+
+# Fila de emails (core.EmailOutbox). As views só gravam na fila; o envio é
+# feito por `python manage.py enviar_emails --continuo`. Depois de cada falha
+# a próxima tentativa espera BACKOFF * 2^(tentativas - 1) segundos. Um lote
+# reservado por um worker que morreu volta para a fila depois de RESERVA segundos.
+# Os enviados são apagados depois de RETENCAO_DIAS por `python manage.py purgar_emails`.
+MEDAGENDA_EMAIL_LOTE = 100
+MEDAGENDA_EMAIL_MAX_TENTATIVAS = 6
+MEDAGENDA_EMAIL_BACKOFF_SEGUNDOS = 60
+MEDAGENDA_EMAIL_RESERVA_SEGUNDOS = 600
+MEDAGENDA_EMAIL_RETENCAO_DIAS = 30
@@ -5,16 +5,17 @@ from core.views import (
     TestViewSet, home_view, CustomTokenObtainPairView,
     enviar_codigo, validar_codigo, criar_superusuario,
     resetar_senha, HorarioAtendimentoViewSet, ListarMedicosView,
-    AgendamentoViewSet, enviar_email_agendamento
+    AgendamentoViewSet, enviar_email_agendamento, DisponibilidadeMedicoView, PrimeirasVagasView, ExcecaoHorarioViewSet
 )
 from core.views_auth import (
     MinhaContaView, MedicoMeView, FotoUsuarioView,
-    verificar_senha, verificar_sessao, register, validar_email
+    verificar_senha, verificar_sessao, register, validar_email, LoginComCookieView
 )
 from core.views_agendamento import (
     AtualizarStatusAgendamentoView, UploadAnexoView,
     DownloadAnexoEspecificoView, DeletarAnexoView,
-    CriarAgendamentoView, MeusAgendamentosView, CancelarAgendamentoView
+    CriarAgendamentoView, MeusAgendamentosView, CancelarAgendamentoView,
+    ExportarAgendamentosView, SincronizarAgendamentosView
 )
 from rest_framework_simplejwt.views import TokenRefreshView
 from django.conf import settings
@@ -24,6 +25,7 @@ from django.views.decorators.csrf import csrf_exempt
 router = DefaultRouter()
 router.register(r'test', TestViewSet, basename='test')
 router.register(r'horarios-atendimento', HorarioAtendimentoViewSet, basename='horarios-atendimento')
+router.register(r'excecoes-horario', ExcecaoHorarioViewSet, basename='excecoes-horario')
 # Removendo a rota de agendamentos do router para evitar conflito
 # router.register(r'agendamentos', AgendamentoViewSet, basename='agendamentos')
 
@@ -36,6 +38,7 @@ urlpatterns = [
     
     # Autenticação e Usuário
     path('api/token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/token/cookie/', LoginComCookieView.as_view(), name='token_obtain_cookie'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('register/', register, name='register'),
     path('validar-email/', validar_email, name='validar_email'),
@@ -43,6 +46,7 @@ urlpatterns = [
     path('verificar-codigo/', validar_codigo, name='verificar_codigo'),
     path('minha-conta/', MinhaContaView.as_view(), name='minha_conta'),
     path('usuarios/me/foto/', FotoUsuarioView.as_view(), name='usuario_foto'),
+    path('usuarios/verificar-sessao/', verificar_sessao, name='verificar_sessao'),
     
     # Recuperação de Senha
     path('recuperar-senha/', resetar_senha, name='resetar_senha'),
@@ -54,6 +58,8 @@ urlpatterns = [
     path('agendamentos/<uuid:pk>/status/', AtualizarStatusAgendamentoView.as_view(), name='atualizar_status_agendamento'),
     path('agendamentos/<uuid:pk>/cancelar/', CancelarAgendamentoView.as_view(), name='cancelar_agendamento'),
     path('meus-agendamentos/', MeusAgendamentosView.as_view(), name='meus_agendamentos'),
+    path('meus-agendamentos/export/', ExportarAgendamentosView.as_view(), name='exportar_agendamentos'),
+    path('meus-agendamentos/sync/', SincronizarAgendamentosView.as_view(), name='sincronizar_agendamentos'),
     path('enviar-email/', enviar_email_agendamento, name='enviar_email'),
     
     # Anexos
@@ -66,6 +72,8 @@ urlpatterns = [
     
     # Especialistas
     path('medicos/', ListarMedicosView.as_view(), name='listar_medicos'),
+    path('medicos/primeiras-vagas/', PrimeirasVagasView.as_view(), name='primeiras_vagas'),
+    path('medicos/<uuid:pk>/disponibilidade/', DisponibilidadeMedicoView.as_view(), name='disponibilidade_medico'),
 ]
 
 # Serve media files during development
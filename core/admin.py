@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import Usuario, HorarioAtendimento, Agendamento, AnexoAgendamento
+from django.utils import timezone
+from .models import Usuario, HorarioAtendimento, Agendamento, AnexoAgendamento, ExcecaoHorario, EmailOutbox
 
 # Inlines para HorarioAtendimento e Agendamento
 class HorarioAtendimentoInline(admin.TabularInline):
@@ -8,6 +9,11 @@ class HorarioAtendimentoInline(admin.TabularInline):
     extra = 1 # Quantidade de formulários extras em branco para adicionar
     fields = ['dia_semana', 'local', 'horarios', 'indisponivel', 'duracao_consulta_minutos', 'intervalo_consulta_minutos'] # Adicione os novos campos aqui
 
+class ExcecaoHorarioInline(admin.TabularInline):
+    model = ExcecaoHorario
+    extra = 0
+    fields = ['data_inicio', 'data_fim', 'tipo', 'horarios', 'local', 'duracao_consulta_minutos', 'intervalo_consulta_minutos', 'motivo']
+
 # Inline para AnexoAgendamento no Agendamento
 class AnexoAgendamentoInline(admin.TabularInline):
     model = AnexoAgendamento
@@ -60,7 +66,7 @@ class UsuarioAdmin(UserAdmin):
     def get_inline(self, request, obj=None):
         # Se for um superusuário ou um usuário médico, inclua o inline de horários
         if obj and obj.tipo == 'medico':
-            return [HorarioAtendimentoInline, AgendamentoMedicoInline]
+            return [HorarioAtendimentoInline, ExcecaoHorarioInline, AgendamentoMedicoInline]
         # Para outros usuários, apenas o inline de agendamentos como paciente (se você criar um)
         # Por enquanto, para usuários comuns, nenhum inline relacionado a agendamentos como médico
         return [AgendamentoMedicoInline] if obj and obj.tipo == 'medico' else []
@@ -90,6 +96,26 @@ class AgendamentoAdmin(admin.ModelAdmin):
     readonly_fields = ['id']
 
 
+# Fila de emails: permite reenviar os que esgotaram as tentativas
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ['assunto', 'destinatarios', 'estado', 'tentativas', 'proxima_tentativa', 'criado_em']
+    list_filter = ['estado']
+    search_fields = ['assunto']
+    readonly_fields = ['criado_em', 'enviado_em', 'ultimo_erro']
+    actions = ['reenviar']
+
+    def get_exclude(self, request, obj=None):
+        # Emails com código de verificação não mostram a mensagem
+        if obj is not None and obj.confidencial:
+            return ['mensagem']
+        return super().get_exclude(request, obj)
+
+    @admin.action(description='Colocar de novo na fila')
+    def reenviar(self, request, queryset):
+        queryset.exclude(estado__in=['enviado', 'enviando']).update(estado='pendente', tentativas=0, proxima_tentativa=timezone.now())
+
+
 # Manter AnexoAgendamentoAdmin se ainda quiser gerenciar anexos diretamente, caso contrário remova
 # @admin.register(AnexoAgendamento)
 # class AnexoAgendamentoAdmin(admin.ModelAdmin):
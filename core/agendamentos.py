@@ -0,0 +1,103 @@
+"""
+Criação de agendamentos sem reserva dupla.
+
+Cada consulta ocupa [data_hora, data_hora + duração + intervalo), com a
+duração e o intervalo do HorarioAtendimento daquele dia da semana (o mesmo
+critério do motor de disponibilidade). A verificação de sobreposição e o
+INSERT rodam na mesma transação, com a linha do médico bloqueada
+(SELECT ... FOR UPDATE): pedidos simultâneos para o mesmo médico entram em
+fila, e os de médicos diferentes não esperam um pelo outro.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .disponibilidade import agenda_semanal, carregar_excecoes, excecoes_por_dia, ocupacao_por_dia
+from .models import Agendamento, HorarioAtendimento, STATUS_ATIVOS, Usuario
+
+
+class ConflitoDeHorario(Exception):
+    """O médico já tem um agendamento ativo que se sobrepõe ao horário pedido."""
+
+    def __init__(self, agendamento):
+        self.agendamento = agendamento
+        super().__init__('O médico já possui um agendamento neste horário.')
+
+
+def converter_data_hora(valor):
+    """Aceita datetime ou texto ISO 8601; datas sem fuso usam o fuso do projeto."""
+    if isinstance(valor, str):
+        valor = parse_datetime(valor)
+    if valor is None:
+        raise ValueError('O campo data_hora é inválido. Use o formato ISO 8601.')
+    if timezone.is_naive(valor):
+        valor = timezone.make_aware(valor)
+    return valor
+
+
+def conflito_de_horario(medico_id, data_hora, ignorar_id=None):
+    """Primeiro agendamento ativo do médico que se sobrepõe a `data_hora`, ou None."""
+    tz = timezone.get_current_timezone()
+    dia = timezone.localtime(data_hora, tz).date()
+    # Horários extras do dia podem ter outra duração
+    excecoes = excecoes_por_dia(carregar_excecoes([medico_id], dia, dia)[medico_id], dia, dia)
+    ocupacao = ocupacao_por_dia(agenda_semanal(HorarioAtendimento.objects.filter(medico_id=medico_id)), excecoes)
+    fim = data_hora + timedelta(seconds=ocupacao[timezone.localtime(data_hora, tz).weekday()])
+
+    candidatos = Agendamento.objects.filter(
+        medico_id=medico_id,
+        status__in=STATUS_ATIVOS,
+        data_hora__gt=data_hora - timedelta(seconds=max(ocupacao.values())),
+        data_hora__lt=fim,
+    ).order_by('data_hora')
+    if ignorar_id is not None:
+        candidatos = candidatos.exclude(pk=ignorar_id)
+
+    for existente in candidatos:
+        dia = timezone.localtime(existente.data_hora, tz).weekday()
+        if existente.data_hora + timedelta(seconds=ocupacao[dia]) > data_hora:
+            return existente
+    return None
+
+
+def reservar_horario(paciente, medico, data_hora, status='solicitado', observacoes=''):
+    """
+    Cria o agendamento se o horário estiver livre.
+    Levanta ConflitoDeHorario se houver sobreposição.
+    """
+    data_hora = converter_data_hora(data_hora)
+    with transaction.atomic():
+        # Serializa as reservas do mesmo médico até o commit
+        Usuario.objects.select_for_update().only('id').get(pk=medico.pk)
+
+        existente = conflito_de_horario(medico.pk, data_hora)
+        if existente is not None:
+            raise ConflitoDeHorario(existente)
+
+        return Agendamento.objects.create(
+            paciente=paciente,
+            medico=medico,
+            data_hora=data_hora,
+            status=status,
+            observacoes=observacoes,
+        )
+
+
+def alterar_status(agendamento, novo_status):
+    """
+    Grava o novo status do agendamento. Reativar um agendamento (de um status
+    inativo, como 'cancelado', para um ativo) passa pela mesma checagem da
+    reserva, com a linha do médico bloqueada: o horário pode ter sido
+    ocupado por outro paciente depois do cancelamento.
+    Levanta ConflitoDeHorario se houver sobreposição.
+    """
+    with transaction.atomic():
+        if novo_status in STATUS_ATIVOS and agendamento.status not in STATUS_ATIVOS:
+            Usuario.objects.select_for_update().only('id').get(pk=agendamento.medico_id)
+            existente = conflito_de_horario(agendamento.medico_id, agendamento.data_hora, ignorar_id=agendamento.pk)
+            if existente is not None:
+                raise ConflitoDeHorario(existente)
+        agendamento.status = novo_status
+        agendamento.save()
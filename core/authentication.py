@@ -0,0 +1,96 @@
+"""
+Autenticação JWT sem consultar o banco a cada requisição.
+
+O simplejwt carrega o Usuario do banco em toda requisição autenticada. Os
+tokens do projeto já trazem user_id, email e tipo (ver os serializers de
+token), então:
+
+- JWTUsuarioEmCacheAuthentication (padrão em REST_FRAMEWORK): devolve o
+  Usuario, guardado no cache sob a versão do usuário (cache_versoes), que
+  muda a cada save/delete dele (signals). Com o cache quente, nenhuma
+  consulta. O hash da senha não vai para o cache (compartilhado, Redis): o
+  campo fica adiado e só views como verificar_senha, que o leem, fazem a
+  consulta.
+- JWTClaimsAuthentication: para views que só usam id, email e tipo. Monta
+  o Usuario a partir dos claims, com os demais campos adiados: se a view
+  ler outro campo, o Django o busca no banco nesse momento. Como não há
+  consulta, um usuário desativado continua aceito até o token expirar.
+
+Sem header Authorization, as duas aceitam o token de acesso do cookie
+SIMPLE_JWT['AUTH_COOKIE'] (renovado pelo ActivityMiddleware). Nesse caso,
+como na sessão do Django, POST/PUT/PATCH/DELETE exigem o token CSRF
+(header X-CSRFToken).
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import SessionAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .cache_versoes import versao_usuario
+from .models import Usuario
+
+TEMPO_CACHE_USUARIO = 60 * 60
+CLAIMS_DO_USUARIO = ('email', 'tipo')
+
+
+def usuario_em_cache(usuario_id):
+    """Usuario pelo id, do cache quando possível. None se não existir."""
+    chave = f'usuario:{usuario_id}:{versao_usuario(usuario_id)}'
+    usuario = cache.get(chave)
+    if usuario is None:
+        usuario = Usuario.objects.defer('password').filter(pk=usuario_id).first()
+        if usuario is None:
+            return None
+        cache.set(chave, usuario, TEMPO_CACHE_USUARIO)
+    return usuario
+
+
+def _id_do_token(validated_token):
+    try:
+        return uuid.UUID(str(validated_token[api_settings.USER_ID_CLAIM]))
+    except (KeyError, ValueError):
+        raise InvalidToken(_('Token contained no recognizable user identification'))
+
+
+class JWTUsuarioEmCacheAuthentication(JWTAuthentication):
+    def authenticate(self, request):
+        if self.get_header(request) is not None:
+            return super().authenticate(request)
+        raw_token = request.COOKIES.get(settings.SIMPLE_JWT.get('AUTH_COOKIE', 'access_token'))
+        if not raw_token:
+            return None
+        try:
+            validated_token = self.get_validated_token(raw_token)
+        except InvalidToken:
+            # O cookie vai em toda requisição: vencido, vale como anônimo (endpoints públicos seguem abertos)
+            return None
+        usuario = self.get_user(validated_token)
+        # O navegador manda o cookie sozinho: métodos que alteram dados exigem o token CSRF
+        SessionAuthentication().enforce_csrf(request)
+        return usuario, validated_token
+
+    def get_user(self, validated_token):
+        usuario = usuario_em_cache(_id_do_token(validated_token))
+        if usuario is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if not usuario.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return usuario
+
+
+class JWTClaimsAuthentication(JWTUsuarioEmCacheAuthentication):
+    def get_user(self, validated_token):
+        if any(claim not in validated_token for claim in CLAIMS_DO_USUARIO):
+            # Token sem os claims do projeto: usa o usuário completo
+            return super().get_user(validated_token)
+
+        campos = ['id', *CLAIMS_DO_USUARIO]
+        valores = [_id_do_token(validated_token), *(validated_token[claim] for claim in CLAIMS_DO_USUARIO)]
+        # Como se viesse de um .only(): os outros campos ficam adiados
+        return Usuario.from_db(router.db_for_read(Usuario), campos, valores)
@@ -0,0 +1,109 @@
+"""
+Busca de médicos por nome, especialidade, cidade e local de atendimento.
+
+No PostgreSQL usa busca textual por prefixo em uma coluna tsvector gerada
+e similaridade por trigramas, as duas cobertas por índices GIN (migração
+0009), com ranking. Sem a extensão pg_trgm fica só a busca textual (e
+icontains no local). Nos outros bancos a busca é só icontains, suficiente
+para os testes e para bases pequenas.
+"""
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest
+
+from .models import HorarioAtendimento
+
+# Configuração de idioma usada no índice de texto (precisa ser igual à da migração)
+CONFIGURACAO_TEXTO = 'portuguese'
+
+_trigramas_disponiveis = {}
+
+
+def trigramas_disponiveis(alias):
+    """Se a extensão pg_trgm está instalada no banco (verificado uma vez por processo)."""
+    if alias not in _trigramas_disponiveis:
+        with connections[alias].cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigramas_disponiveis[alias] = cursor.fetchone() is not None
+    return _trigramas_disponiveis[alias]
+
+
+def buscar_medicos(queryset, termo):
+    """Filtra e ordena `queryset` (médicos) pelo termo de busca."""
+    termo = termo.strip()
+    if not termo:
+        return queryset
+    if connections[queryset.db].vendor == 'postgresql':
+        return _buscar_postgres(queryset, termo)
+    return _buscar_simples(queryset, termo)
+
+
+def _por_local(termo, lookup):
+    return HorarioAtendimento.objects.filter(**{f'local__{lookup}': termo}).values('medico_id')
+
+
+def _filtro_contem(termo):
+    return (
+        Q(nome__icontains=termo)
+        | Q(especialidade__icontains=termo)
+        | Q(cidade__icontains=termo)
+        | Q(pk__in=_por_local(termo, 'icontains'))
+    )
+
+
+def _buscar_simples(queryset, termo):
+    return queryset.filter(_filtro_contem(termo)).order_by('nome', 'id')
+
+
+def documento_busca():
+    """Coluna tsvector gerada pelo PostgreSQL (migração 0009), fora do modelo."""
+    from django.contrib.postgres.search import SearchVectorField
+    return RawSQL('busca_documento', [], output_field=SearchVectorField())
+
+
+def consulta_texto(termo):
+    """Todas as palavras do termo, cada uma como prefixo ("cardio" acha "cardiologia")."""
+    from django.contrib.postgres.search import SearchQuery
+    palavras = re.findall(r'\w+', termo)
+    if not palavras:
+        return None
+    return SearchQuery(' & '.join(f'{palavra}:*' for palavra in palavras), config=CONFIGURACAO_TEXTO, search_type='raw')
+
+
+def _buscar_postgres(queryset, termo):
+    from django.contrib.postgres.search import SearchRank, TrigramWordSimilarity
+
+    consulta = consulta_texto(termo)
+    trigramas = trigramas_disponiveis(queryset.db)
+
+    # Todas as condições ficam na própria tabela de usuários, cada uma com um
+    # índice GIN (ou a PK), para o planejador juntar com BitmapOr. Os médicos
+    # encontrados pelo local vêm antes, em uma consulta pequena.
+    por_local = list(_por_local(termo, 'trigram_word_similar' if trigramas else 'icontains')[:500])
+    condicoes = Q(pk__in=[linha['medico_id'] for linha in por_local])
+    if consulta is not None:
+        condicoes |= Q(documento=consulta)
+    if trigramas:
+        condicoes |= (
+            Q(nome__trigram_word_similar=termo)
+            | Q(especialidade__trigram_word_similar=termo)
+            | Q(cidade__trigram_word_similar=termo)
+        )
+
+    resultado = queryset.annotate(documento=documento_busca()).filter(condicoes)
+    ordem = []
+    if consulta is not None:
+        resultado = resultado.annotate(relevancia=SearchRank(documento_busca(), consulta))
+        ordem.append('-relevancia')
+    if trigramas:
+        resultado = resultado.annotate(similaridade=Greatest(
+            TrigramWordSimilarity(Value(termo), 'nome'),
+            TrigramWordSimilarity(Value(termo), 'especialidade'),
+            TrigramWordSimilarity(Value(termo), 'cidade'),
+            output_field=FloatField(),
+        ))
+        ordem.append('-similaridade')
+    return resultado.order_by(*ordem, 'nome', 'id')
@@ -0,0 +1,95 @@
+"""
+Contadores de versão guardados no cache.
+
+Cada escopo (agendamentos de um usuário, diretório de médicos) tem um
+número que muda sempre que os dados dele mudam. As views usam esse número
+para montar ETags e chaves de cache sem precisar consultar o banco.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+ESCOPO_AGENDAMENTOS = 'agendamentos'
+ESCOPO_DIRETORIO_MEDICOS = 'diretorio_medicos'
+ESCOPO_USUARIO = 'usuario'
+
+
+def _chave(escopo, identificador=None):
+    if identificador is None:
+        return f'versao:{escopo}'
+    return f'versao:{escopo}:{identificador}'
+
+
+def _versao_inicial():
+    # Baseada no relógio: se a chave for despejada do cache, a nova versão
+    # não repete um valor já entregue aos clientes em uma ETag antiga.
+    return time.time_ns()
+
+
+def obter_versao(escopo, identificador=None):
+    chave = _chave(escopo, identificador)
+    versao = cache.get(chave)
+    if versao is None:
+        cache.add(chave, _versao_inicial(), None)
+        versao = cache.get(chave)
+    return versao
+
+
+def _incrementar(chave):
+    try:
+        cache.incr(chave)
+    except ValueError:
+        # Chave ainda não existe (ou foi despejada)
+        cache.add(chave, _versao_inicial(), None)
+
+
+def incrementar_versao(escopo, identificador=None):
+    """
+    Muda a versão quando a transação atual for confirmada (na hora, fora de
+    transação). Antes do commit, uma requisição concorrente ainda leria os
+    dados antigos e os guardaria no cache sob a versão nova.
+    """
+    chave = _chave(escopo, identificador)
+    transaction.on_commit(lambda: _incrementar(chave))
+
+
+def versao_agendamentos(usuario_id):
+    return obter_versao(ESCOPO_AGENDAMENTOS, usuario_id)
+
+
+def invalidar_agendamentos(*usuario_ids):
+    for usuario_id in set(usuario_ids):
+        incrementar_versao(ESCOPO_AGENDAMENTOS, usuario_id)
+
+
+def versao_diretorio_medicos():
+    return obter_versao(ESCOPO_DIRETORIO_MEDICOS)
+
+
+def invalidar_diretorio_medicos():
+    incrementar_versao(ESCOPO_DIRETORIO_MEDICOS)
+
+
+def versao_usuario(usuario_id):
+    return obter_versao(ESCOPO_USUARIO, usuario_id)
+
+
+def invalidar_usuario(usuario_id):
+    incrementar_versao(ESCOPO_USUARIO, usuario_id)
+
+
+def gerar_etag(request, *partes):
+    """
+    ETag forte a partir das versões e da URL completa da requisição.
+    Host e Accept entram porque mudam o corpo (URLs absolutas de fotos, renderer).
+    """
+    conteudo = '|'.join([
+        *(str(parte) for parte in partes),
+        request.get_host(),
+        request.scheme,
+        request.get_full_path(),
+        request.META.get('HTTP_ACCEPT', ''),
+    ])
+    return hashlib.sha1(conteudo.encode('utf-8')).hexdigest()
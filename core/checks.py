@@ -0,0 +1,27 @@
+"""Checagens de configuração do projeto (rodam em `manage.py check` e no início do servidor)."""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Tags, Warning, register
+
+
+def cache_compartilhado():
+    """True se o cache padrão é visto por todos os processos (Redis), e não local a cada um."""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+@register(Tags.caches)
+def checar_cache_compartilhado(app_configs, **kwargs):
+    if settings.DEBUG or cache_compartilhado():
+        return []
+    return [
+        Warning(
+            'O cache padrão é local a cada processo.',
+            hint=(
+                'Com vários workers, os limites de requisição (core.throttling) e as tentativas '
+                'de código de verificação (core.codigos) passam a valer por worker. Defina REDIS_URL.'
+            ),
+            id='core.W001',
+        )
+    ]
@@ -0,0 +1,135 @@
+"""
+Códigos de verificação por email (cadastro e recuperação de senha).
+
+O código fica no cache, só como HMAC, com TTL nativo de
+VALIDADE_CODIGO: expirou, sumiu. Cada email tem no máximo um código e um
+contador de tentativas; depois de MAX_TENTATIVAS erros o código deixa de
+valer e é preciso pedir outro.
+
+O banco (CodigoVerificacao) guarda uma cópia do HMAC para quando o cache
+não tiver a chave (reinício, despejo ou cache local de outro processo). A
+leitura é por email (indexado) e as linhas vencidas são apagadas pelo
+comando `purgar_codigos`, então a tabela não cresce sem limite.
+
+Em texto o código só existe no email da fila (EmailOutbox com
+confidencial=True): a mensagem é apagada logo depois do envio e a linha é
+excluída pelo mesmo `purgar_codigos` quando o código vence.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, get_random_string, salted_hmac
+
+from .models import CodigoVerificacao, EmailOutbox, VALIDADE_CODIGO
+
+MAX_TENTATIVAS = 5
+
+VALIDO = 'valido'
+INVALIDO = 'invalido'
+EXPIRADO = 'expirado'
+BLOQUEADO = 'bloqueado'
+
+
+def _normalizar(email):
+    return (email or '').strip().lower()
+
+
+# As funções internas recebem o email já normalizado pelas públicas
+
+def _chaves(email):
+    sufixo = hashlib.sha256(email.encode()).hexdigest()
+    return f'codigo_verificacao:{sufixo}', f'codigo_verificacao_tentativas:{sufixo}'
+
+
+def _hash(email, codigo):
+    return salted_hmac('core.codigos', f'{email}:{codigo}', algorithm='sha256').hexdigest()
+
+
+def _ttl():
+    return int(VALIDADE_CODIGO.total_seconds())
+
+
+def criar_codigo(email):
+    """Gera um código novo para o email (o anterior deixa de valer) e o devolve em texto."""
+    email = _normalizar(email)
+    codigo = get_random_string(length=6, allowed_chars='0123456789')
+    codigo_hash = _hash(email, codigo)
+    chave, chave_tentativas = _chaves(email)
+
+    CodigoVerificacao.objects.filter(email=email).delete()
+    CodigoVerificacao.objects.create(email=email, codigo=codigo_hash)
+    cache.set(chave, codigo_hash, _ttl())
+    cache.set(chave_tentativas, 0, _ttl())
+    return codigo
+
+
+def descartar_codigo(email):
+    email = _normalizar(email)
+    CodigoVerificacao.objects.filter(email=email).delete()
+    cache.delete_many(_chaves(email))
+
+
+def _hash_guardado(email, chave):
+    codigo_hash = cache.get(chave)
+    if codigo_hash is not None:
+        return codigo_hash, VALIDO
+
+    # Sem cache: cópia do banco, devolvida ao cache pelo tempo que ainda resta
+    registro = CodigoVerificacao.objects.filter(email=email).order_by('-criado_em').first()
+    if registro is None:
+        return None, INVALIDO
+    restante = (registro.criado_em + VALIDADE_CODIGO - timezone.now()).total_seconds()
+    if restante <= 0:
+        return None, EXPIRADO
+    cache.set(chave, registro.codigo, int(restante) + 1)
+    return registro.codigo, VALIDO
+
+
+def _registrar_tentativa(chave_tentativas):
+    try:
+        return cache.incr(chave_tentativas)
+    except ValueError:
+        cache.add(chave_tentativas, 0, _ttl())
+        return cache.incr(chave_tentativas)
+
+
+def verificar_codigo(email, codigo, consumir=False):
+    """
+    Confere o código do email. Retorna VALIDO, INVALIDO, EXPIRADO ou BLOQUEADO.
+    Com `consumir=True` um código válido é descartado (uso único).
+    """
+    email = _normalizar(email)
+    if not email or not codigo:
+        return INVALIDO
+    chave, chave_tentativas = _chaves(email)
+    codigo_hash, situacao = _hash_guardado(email, chave)
+    if codigo_hash is None:
+        return situacao
+
+    if _registrar_tentativa(chave_tentativas) > MAX_TENTATIVAS:
+        descartar_codigo(email)
+        return BLOQUEADO
+    if not constant_time_compare(codigo_hash, _hash(email, str(codigo).strip())):
+        return INVALIDO
+
+    if consumir:
+        descartar_codigo(email)
+    else:
+        # Acertar não conta como tentativa: o código ainda será usado em seguida
+        try:
+            cache.decr(chave_tentativas)
+        except ValueError:
+            pass
+    return VALIDO
+
+
+def purgar_codigos_expirados():
+    """
+    Apaga do banco os códigos vencidos (índice em criado_em) e os emails que
+    os levaram. Retorna a quantidade de códigos.
+    """
+    limite = timezone.now() - VALIDADE_CODIGO
+    EmailOutbox.objects.filter(confidencial=True, criado_em__lt=limite).delete()
+    removidos, _ = CodigoVerificacao.objects.filter(criado_em__lt=limite).delete()
+    return removidos
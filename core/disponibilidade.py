@@ -0,0 +1,323 @@
+"""
+Motor de disponibilidade: horários livres de um médico em um intervalo de datas.
+
+Os horários semanais (HorarioAtendimento) são expandidos em vagas concretas
+e os agendamentos ativos do período são subtraídos com uma única consulta por
+faixa de data_hora e uma varredura intercalada (sorted merge) das duas listas
+ordenadas, sem uma consulta por vaga. Internamente tudo é feito com inteiros
+(segundos desde a época); só as vagas livres viram datetime no final.
+
+Exceções por data (ExcecaoHorario) são aplicadas dia a dia sobre a agenda
+semanal: bloqueios removem as vagas que cruzam a janela bloqueada e horários
+extras são somados, mesmo em dias bloqueados.
+"""
+import heapq
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+
+from .faixas import hhmm_para_minutos  # noqa: F401 (reexportado)
+from .models import Agendamento, ExcecaoHorario, HorarioAtendimento, STATUS_ATIVOS
+
+# Índice = date.weekday()
+DIAS_SEMANA = ['segunda', 'terca', 'quarta', 'quinta', 'sexta', 'sabado', 'domingo']
+
+DURACAO_PADRAO_MINUTOS = 30
+
+# Uma vaga ocupa [inicio, fim) e exige `intervalo` minutos livres antes da próxima consulta
+Vaga = namedtuple('Vaga', ['inicio', 'fim', 'local', 'intervalo'])
+
+
+def agenda_semanal(horarios):
+    """
+    Agrupa os HorarioAtendimento por dia da semana.
+    Retorna {weekday: [(minuto_inicio, duracao, intervalo, local), ...]} ordenado.
+    """
+    semana = {dia: [] for dia in range(7)}
+    for horario in horarios:
+        if horario.indisponivel:
+            continue
+        try:
+            dia = DIAS_SEMANA.index(horario.dia_semana.lower())
+        except ValueError:
+            continue
+        for minuto in horario.inicios_em_minutos():
+            semana[dia].append((
+                minuto,
+                horario.duracao_consulta_minutos,
+                horario.intervalo_consulta_minutos,
+                horario.local,
+            ))
+    for entradas in semana.values():
+        entradas.sort()
+    return semana
+
+
+def carregar_excecoes(medico_ids, de, ate):
+    """
+    Exceções que cruzam as datas [de, ate], agrupadas por médico.
+    Uma consulta pelo índice (medico, data_inicio, data_fim).
+    """
+    por_medico = defaultdict(list)
+    excecoes = ExcecaoHorario.objects.filter(
+        medico_id__in=medico_ids, data_inicio__lte=ate, data_fim__gte=de,
+    ).order_by('data_inicio')
+    for excecao in excecoes:
+        por_medico[excecao.medico_id].append(excecao)
+    return por_medico
+
+
+def excecoes_por_dia(excecoes, de, ate):
+    """
+    {data: (bloqueios, extras)} para os dias de [de, ate] com alguma exceção.
+    bloqueios: [(minuto_inicio, minuto_fim, local)]; local vazio vale para todos.
+    extras: [(minuto_inicio, duracao, intervalo, local)], no formato de agenda_semanal.
+    """
+    dias = {}
+    for excecao in excecoes:
+        if excecao.tipo == 'bloqueio':
+            itens = [(inicio, fim, excecao.local) for inicio, fim in excecao.faixas] or [(0, 24 * 60, excecao.local)]
+        else:
+            itens = [
+                (minuto, excecao.duracao_consulta_minutos, excecao.intervalo_consulta_minutos, excecao.local)
+                for minuto in excecao.inicios_em_minutos()
+            ]
+        dia = max(excecao.data_inicio, de)
+        while dia <= min(excecao.data_fim, ate):
+            bloqueios, extras = dias.setdefault(dia, ([], []))
+            (bloqueios if excecao.tipo == 'bloqueio' else extras).extend(itens)
+            dia += timedelta(days=1)
+    return dias
+
+
+def _bloqueada(entrada, bloqueios):
+    minuto, duracao, _, local = entrada
+    return any(
+        inicio < minuto + duracao and fim > minuto and (not local_bloqueado or local_bloqueado == local)
+        for inicio, fim, local_bloqueado in bloqueios
+    )
+
+
+def entradas_do_dia(semana, excecoes, dia):
+    """Entradas da agenda semanal para `dia`, com as exceções da data aplicadas."""
+    entradas = semana[dia.weekday()]
+    if excecoes and dia in excecoes:
+        bloqueios, extras = excecoes[dia]
+        entradas = sorted({*(e for e in entradas if not _bloqueada(e, bloqueios)), *extras})
+    return entradas
+
+
+def _epoch(valor):
+    return int(valor.timestamp())
+
+
+def inicio_do_dia(dia, tz):
+    return timezone.make_aware(datetime.combine(dia, time.min), tz)
+
+
+def expandir_vagas(semana, de, ate, excecoes=None):
+    """
+    Gera as vagas de `de` até `ate` (datas, inclusive) em ordem de início,
+    como tuplas (inicio, fim, fim_com_intervalo, local) em segundos.
+    `excecoes` é o dicionário de excecoes_por_dia.
+    """
+    tz = timezone.get_current_timezone()
+    dia = de
+    while dia <= ate:
+        entradas = entradas_do_dia(semana, excecoes, dia)
+        if entradas:
+            meia_noite = inicio_do_dia(dia, tz)
+            base = _epoch(meia_noite)
+            # Dia com mudança de fuso (horário de verão): converte vaga a vaga
+            troca_de_fuso = meia_noite.utcoffset() != inicio_do_dia(dia + timedelta(days=1), tz).utcoffset()
+            for minuto, duracao, intervalo, local in entradas:
+                if troca_de_fuso:
+                    inicio = _epoch(timezone.make_aware(datetime.combine(dia, time(minuto // 60, minuto % 60)), tz))
+                else:
+                    inicio = base + minuto * 60
+                fim = inicio + duracao * 60
+                yield (inicio, fim, fim + intervalo * 60, local)
+        dia += timedelta(days=1)
+
+
+def ocupacao_por_dia(semana, excecoes=None):
+    """Segundos ocupados (duração + intervalo) por um agendamento em cada dia da semana."""
+    por_dia = {dia: list(entradas) for dia, entradas in semana.items()}
+    # Horários extras podem ter duração diferente da agenda daquele dia da semana
+    for data, (_, extras) in (excecoes or {}).items():
+        por_dia[data.weekday()].extend(extras)
+    ocupacao = {}
+    for dia, entradas in por_dia.items():
+        if entradas:
+            ocupacao[dia] = max(duracao + intervalo for _, duracao, intervalo, _ in entradas) * 60
+        else:
+            ocupacao[dia] = DURACAO_PADRAO_MINUTOS * 60
+    return ocupacao
+
+
+def carregar_reservas(medico_id, semana, inicio, fim, excecoes=None):
+    """
+    Agendamentos ativos que podem ocupar vagas em [inicio, fim), como
+    intervalos (inicio, fim) em segundos, ordenados. Uma única consulta por faixa.
+    """
+    ocupacao = ocupacao_por_dia(semana, excecoes)
+    folga = timedelta(seconds=max(ocupacao.values()))
+    datas = (
+        Agendamento.objects.filter(
+            medico_id=medico_id,
+            status__in=STATUS_ATIVOS,
+            data_hora__gt=inicio - folga,
+            data_hora__lt=fim,
+        )
+        .order_by('data_hora')
+        .values_list('data_hora', flat=True)
+    )
+    # Dia da semana local calculado pela distância (em dias) até o início da janela
+    base = _epoch(inicio)
+    dia_base = inicio.weekday()
+    reservas = []
+    for data_hora in datas:
+        segundos = _epoch(data_hora)
+        dia = (dia_base + (segundos - base) // 86400) % 7
+        reservas.append((segundos, segundos + ocupacao[dia]))
+    return reservas
+
+
+def marcar_ocupacao(vagas, reservas):
+    """
+    Percorre vagas e reservas (ambas ordenadas por início) de uma vez só.
+    Gera (vaga, livre) para cada vaga.
+    """
+    j = 0
+    total = len(reservas)
+    for vaga in vagas:
+        inicio, _, fim_ocupado, _ = vaga
+        # Reservas que terminam antes desta vaga não ocupam nenhuma das próximas
+        while j < total and reservas[j][1] <= inicio:
+            j += 1
+        livre = True
+        k = j
+        while k < total and reservas[k][0] < fim_ocupado:
+            if reservas[k][1] > inicio:
+                livre = False
+                break
+            k += 1
+        yield vaga, livre
+
+
+def para_vaga(vaga, tz):
+    inicio, fim, fim_ocupado, local = vaga
+    return Vaga(
+        datetime.fromtimestamp(inicio, dt_timezone.utc).astimezone(tz),
+        datetime.fromtimestamp(fim, dt_timezone.utc).astimezone(tz),
+        local,
+        (fim_ocupado - fim) // 60,
+    )
+
+
+def calcular_disponibilidade(medico_id, de, ate, horarios=None, agora=None):
+    """
+    Vagas livres do médico entre as datas `de` e `ate` (inclusive).
+    `horarios` pode ser passado já carregado (ex.: via prefetch).
+    """
+    if horarios is None:
+        horarios = HorarioAtendimento.objects.filter(medico_id=medico_id)
+    semana = agenda_semanal(horarios)
+    excecoes = excecoes_por_dia(carregar_excecoes([medico_id], de, ate)[medico_id], de, ate)
+    if not any(semana.values()) and not excecoes:
+        return []
+
+    tz = timezone.get_current_timezone()
+    inicio = inicio_do_dia(de, tz)
+    fim = inicio_do_dia(ate + timedelta(days=1), tz)
+    reservas = carregar_reservas(medico_id, semana, inicio, fim, excecoes)
+
+    agora = _epoch(agora or timezone.now())
+    return [
+        para_vaga(vaga, tz)
+        for vaga, livre in marcar_ocupacao(expandir_vagas(semana, de, ate, excecoes), reservas)
+        if livre and vaga[0] >= agora
+    ]
+
+
+class _FluxoMedico:
+    """
+    Vagas livres de um médico em ordem, geradas sob demanda. As candidatas
+    vêm só dos horários semanais (sem banco); os agendamentos são carregados
+    por janelas de `janela_dias`, apenas quando uma candidata daquela janela
+    chega ao topo do heap.
+    """
+    janela_dias = 7
+
+    def __init__(self, medico_id, semana, de, ate, agora, excecoes=None):
+        self.medico_id = medico_id
+        self.semana = semana
+        self.excecoes = excecoes
+        self.candidatas = expandir_vagas(semana, de, ate, excecoes)
+        self.agora = agora
+        self.tz = timezone.get_current_timezone()
+        self.carregado_ate = None
+        self.reservas = []
+        self.inicios = []
+
+    def proxima(self):
+        for vaga in self.candidatas:
+            if vaga[0] >= self.agora:
+                return vaga
+        return None
+
+    def livre(self, vaga):
+        if self.carregado_ate is None or vaga[0] >= self.carregado_ate:
+            dia = datetime.fromtimestamp(vaga[0], dt_timezone.utc).astimezone(self.tz).date()
+            inicio = inicio_do_dia(dia, self.tz)
+            fim = inicio_do_dia(dia + timedelta(days=self.janela_dias), self.tz)
+            self.reservas = carregar_reservas(self.medico_id, self.semana, inicio, fim, self.excecoes)
+            self.inicios = [reserva[0] for reserva in self.reservas]
+            self.carregado_ate = _epoch(fim)
+        # Só as reservas que começam antes do fim da vaga (com intervalo) podem ocupá-la
+        limite = bisect_left(self.inicios, vaga[2])
+        return not any(fim > vaga[0] for _, fim in self.reservas[:limite])
+
+
+def primeiras_vagas(horarios, k, de, ate, agora=None, excecoes=None):
+    """
+    As `k` primeiras vagas livres entre todos os médicos dos `horarios`
+    informados, como lista de (medico_id, Vaga) em ordem de início.
+    `excecoes` é o resultado de carregar_excecoes para esses médicos.
+
+    Os fluxos de cada médico são intercalados com um heap e a busca para
+    assim que `k` vagas livres são encontradas: os agendamentos só são
+    consultados para os médicos cujas vagas chegam ao topo.
+    """
+    excecoes = excecoes or {}
+    por_medico = defaultdict(list)
+    for horario in horarios:
+        por_medico[horario.medico_id].append(horario)
+    # Médicos só com horários extras no período também entram
+    for medico_id in excecoes:
+        por_medico.setdefault(medico_id, [])
+
+    agora = _epoch(agora or timezone.now())
+    heap = []
+    for ordem, (medico_id, lista) in enumerate(por_medico.items()):
+        mapa = excecoes_por_dia(excecoes.get(medico_id, ()), de, ate)
+        fluxo = _FluxoMedico(medico_id, agenda_semanal(lista), de, ate, agora, mapa)
+        vaga = fluxo.proxima()
+        if vaga is not None:
+            heap.append((vaga[0], ordem, vaga, fluxo))
+    heapq.heapify(heap)
+
+    tz = timezone.get_current_timezone()
+    resultado = []
+    while heap and len(resultado) < k:
+        _, ordem, vaga, fluxo = heap[0]
+        if fluxo.livre(vaga):
+            resultado.append((fluxo.medico_id, para_vaga(vaga, tz)))
+        proxima = fluxo.proxima()
+        if proxima is None:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (proxima[0], ordem, proxima, fluxo))
+    return resultado
@@ -0,0 +1,194 @@
+"""
+Envio de emails pela caixa de saída (EmailOutbox).
+
+As views não falam com o servidor SMTP: `enfileirar_email` só grava uma
+linha, na mesma transação da mudança de estado que gerou o email (se a
+transação for desfeita, o email some junto). O comando `enviar_emails`
+lê a fila em lotes e envia tudo por uma única conexão.
+
+O worker reserva o lote numa transação curta (estado 'enviando', com
+proxima_tentativa como prazo da reserva), envia fora de qualquer transação
+e grava os resultados numa segunda transação curta: as linhas não ficam
+travadas enquanto o SMTP responde.
+
+Cada falha reagenda o email com backoff exponencial; depois de
+MEDAGENDA_EMAIL_MAX_TENTATIVAS tentativas ele fica com estado 'falhou'.
+A entrega é "pelo menos uma vez": se o worker morrer no meio de um lote,
+os emails reservados voltam a ser enviados quando a reserva vence
+(MEDAGENDA_EMAIL_RESERVA_SEGUNDOS).
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+
+def _config(nome, padrao):
+    return getattr(settings, f'MEDAGENDA_EMAIL_{nome}', padrao)
+
+
+MENSAGEM_REMOVIDA = '[conteúdo confidencial removido após o envio]'
+
+
+def _novo_email(assunto, mensagem, destinatarios, remetente=None, confidencial=False):
+    return EmailOutbox(
+        assunto=assunto[:255],
+        mensagem=mensagem,
+        remetente=remetente or settings.DEFAULT_FROM_EMAIL,
+        destinatarios=list(destinatarios),
+        confidencial=confidencial,
+    )
+
+
+def enfileirar_email(assunto, mensagem, destinatarios, remetente=None, confidencial=False):
+    """
+    Grava o email na fila. Chame dentro da transação da mudança de estado.
+    Com `confidencial=True` a mensagem é apagada da fila assim que sai (ou falha de vez).
+    """
+    email = _novo_email(assunto, mensagem, destinatarios, remetente, confidencial)
+    email.save()
+    return email
+
+
+def enfileirar_emails(emails):
+    """Grava vários emails de uma vez. `emails`: iterável de dicts com os argumentos de `enfileirar_email`."""
+    return EmailOutbox.objects.bulk_create([_novo_email(**email) for email in emails])
+
+
+def proxima_tentativa(tentativas, agora=None):
+    """Momento da próxima tentativa depois de `tentativas` falhas."""
+    espera = _config('BACKOFF_SEGUNDOS', 60) * 2 ** (max(tentativas, 1) - 1)
+    return (agora or timezone.now()) + timedelta(seconds=espera)
+
+
+def _mensagem(email):
+    return EmailMessage(
+        subject=email.assunto,
+        body=email.mensagem,
+        from_email=email.remetente,
+        to=email.destinatarios,
+    )
+
+
+def _reservar(lote, agora):
+    """Marca como 'enviando' até `lote` emails prontos para envio (ou com a reserva vencida) e os devolve."""
+    with transaction.atomic():
+        # skip_locked: vários workers podem rodar juntos sem pegar o mesmo email
+        emails = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(Q(estado='pendente') | Q(estado='enviando'), proxima_tentativa__lte=agora)
+            .order_by('proxima_tentativa')[:lote]
+        )
+        if emails:
+            EmailOutbox.objects.filter(pk__in=[email.pk for email in emails]).update(
+                estado='enviando',
+                proxima_tentativa=agora + timedelta(seconds=_config('RESERVA_SEGUNDOS', 600)),
+            )
+            for email in emails:
+                email.estado = 'enviando'
+    return emails
+
+
+def enviar_pendentes(lote=None, conexao=None):
+    """
+    Envia um lote de emails pendentes cuja hora já chegou.
+    Retorna (enviados, reagendados, falharam).
+    """
+    lote = lote or _config('LOTE', 100)
+    max_tentativas = _config('MAX_TENTATIVAS', 6)
+    agora = timezone.now()
+
+    emails = _reservar(lote, agora)
+    if not emails:
+        return 0, 0, 0
+
+    conexao = conexao or get_connection(fail_silently=False)
+    erro_conexao = None
+    try:
+        conexao.open()
+    except Exception as e:
+        erro_conexao = e
+
+    enviados = reagendados = falharam = 0
+    try:
+        for email in emails:
+            erro = erro_conexao
+            if erro is None:
+                try:
+                    # Um email por chamada, sempre pela mesma conexão, para
+                    # uma falha não derrubar a contagem do lote inteiro
+                    conexao.send_messages([_mensagem(email)])
+                except Exception as e:
+                    erro = e
+                    _reabrir(conexao)
+
+            if erro is None:
+                email.estado = 'enviado'
+                email.enviado_em = timezone.now()
+                email.ultimo_erro = ''
+                enviados += 1
+                continue
+
+            email.estado = 'pendente'
+            email.tentativas += 1
+            email.ultimo_erro = str(erro)[:1000]
+            if email.tentativas >= max_tentativas:
+                email.estado = 'falhou'
+                falharam += 1
+                logger.error(f"Email {email.pk} descartado após {email.tentativas} tentativas: {erro}")
+            else:
+                email.proxima_tentativa = proxima_tentativa(email.tentativas, agora)
+                reagendados += 1
+    finally:
+        if erro_conexao is None:
+            conexao.close()
+        # Grava o que já foi tentado mesmo se o lote for interrompido; o resto volta quando a reserva vencer
+        tentados = [email for email in emails if email.estado != 'enviando']
+        encerrados = [email.pk for email in tentados if email.confidencial and email.estado != 'pendente']
+        with transaction.atomic():
+            EmailOutbox.objects.bulk_update(
+                tentados, ['estado', 'enviado_em', 'tentativas', 'proxima_tentativa', 'ultimo_erro'],
+            )
+            if encerrados:
+                EmailOutbox.objects.filter(pk__in=encerrados).update(mensagem=MENSAGEM_REMOVIDA)
+
+    if erro_conexao is not None:
+        logger.error(f"Erro ao abrir conexão de email: {erro_conexao}")
+    return enviados, reagendados, falharam
+
+
+def purgar_enviados(lote=None):
+    """
+    Apaga, em lotes, os emails enviados há mais de MEDAGENDA_EMAIL_RETENCAO_DIAS
+    (índice email_enviado_idx). Retorna a quantidade.
+    """
+    lote = lote or 5000
+    limite = timezone.now() - timedelta(days=_config('RETENCAO_DIAS', 30))
+    removidos = 0
+    while True:
+        ids = list(
+            EmailOutbox.objects.filter(estado='enviado', enviado_em__lt=limite)
+            .order_by('enviado_em')
+            .values_list('id', flat=True)[:lote]
+        )
+        if not ids:
+            return removidos
+        EmailOutbox.objects.filter(id__in=ids).delete()
+        removidos += len(ids)
+
+
+def _reabrir(conexao):
+    """Depois de um erro a conexão pode ter caído; tenta de novo para o resto do lote."""
+    try:
+        conexao.close()
+        conexao.open()
+    except Exception as e:
+        logger.warning(f"Não foi possível reabrir a conexão de email: {e}")
@@ -0,0 +1,101 @@
+"""
+Forma compacta dos horários de atendimento.
+
+`HorarioAtendimento.horarios` aceita horários avulsos ("09:00") e faixas
+("07:00-12:00"). Uma faixa vira consultas a cada duração + intervalo, desde
+que a consulta termine até o fim da faixa. No save, a lista é convertida em
+`faixas`: pares [inicio, fim] em minutos do dia, ordenados, em que inícios
+igualmente espaçados ficam agrupados em um único par. Expansão e checagem
+de sobreposição passam a ser só contas com inteiros.
+"""
+
+
+def hhmm_para_minutos(valor):
+    hora, minuto = map(int, valor.split(':'))
+    if not (0 <= hora <= 23 and 0 <= minuto <= 59):
+        raise ValueError(valor)
+    return hora * 60 + minuto
+
+
+def minutos_para_hhmm(minutos):
+    return f'{minutos // 60:02d}:{minutos % 60:02d}'
+
+
+def _passo(duracao, intervalo):
+    duracao = max(duracao, 1)
+    return duracao, max(duracao + intervalo, duracao)
+
+
+def ler_horario(valor):
+    """
+    "HH:MM" -> (inicio, None); "HH:MM-HH:MM" -> (inicio, fim).
+    Levanta ValueError se o formato for inválido.
+    """
+    if not isinstance(valor, str):
+        raise ValueError(valor)
+    if '-' in valor:
+        inicio, fim = (hhmm_para_minutos(parte.strip()) for parte in valor.split('-', 1))
+        if fim <= inicio:
+            raise ValueError(valor)
+        return inicio, fim
+    return hhmm_para_minutos(valor.strip()), None
+
+
+def inicios_dos_horarios(horarios, duracao, intervalo):
+    """Minutos de início de todas as consultas, ordenados e sem repetição."""
+    duracao, passo = _passo(duracao, intervalo)
+    inicios = set()
+    for valor in horarios:
+        inicio, fim = ler_horario(valor)
+        if fim is None:
+            inicios.add(inicio)
+        else:
+            inicios.update(range(inicio, fim - duracao + 1, passo))
+    return sorted(inicios)
+
+
+def compactar(horarios, duracao, intervalo):
+    """Lista de horários/faixas em texto -> [[inicio, fim], ...] em minutos."""
+    duracao, passo = _passo(duracao, intervalo)
+    faixas = []
+    for inicio in inicios_dos_horarios(horarios, duracao, intervalo):
+        # Continua a faixa anterior se o início cair exatamente no próximo passo
+        if faixas and inicio == faixas[-1][1] - duracao + passo:
+            faixas[-1][1] = inicio + duracao
+        else:
+            faixas.append([inicio, inicio + duracao])
+    return faixas
+
+
+def janelas(horarios):
+    """
+    Janelas de tempo [inicio, fim] em minutos, ordenadas e unidas.
+    Um horário avulso "HH:MM" vira uma janela de um minuto.
+    """
+    lidas = []
+    for valor in horarios:
+        inicio, fim = ler_horario(valor)
+        lidas.append((inicio, fim if fim is not None else inicio + 1))
+    resultado = []
+    for inicio, fim in sorted(lidas):
+        if resultado and inicio <= resultado[-1][1]:
+            resultado[-1][1] = max(resultado[-1][1], fim)
+        else:
+            resultado.append([inicio, fim])
+    return resultado
+
+
+def expandir(faixas, duracao, intervalo):
+    """Gera os minutos de início das consultas de `faixas`, em ordem."""
+    duracao, passo = _passo(duracao, intervalo)
+    for inicio, fim in faixas:
+        yield from range(inicio, fim - duracao + 1, passo)
+
+
+def primeira_sobreposicao(inicios, duracao):
+    """Primeiro par de consultas (inicios ordenados) que se sobrepõem, ou None."""
+    duracao = max(duracao, 1)
+    for anterior, atual in zip(inicios, inicios[1:]):
+        if atual < anterior + duracao:
+            return anterior, atual
+    return None
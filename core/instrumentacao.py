@@ -0,0 +1,152 @@
+"""
+Medição de cada requisição: tempo total, consultas ao banco (quantidade e
+tempo), acertos e faltas no cache e tamanho da resposta.
+
+O ActivityMiddleware abre uma Medicao por requisição. As consultas são
+contadas por connection.execute_wrapper; o cache, pelos backends
+LocMemCacheMedido/RedisCacheMedido (configurados em CACHES), que registram
+na medição da requisição corrente (contextvar). Fora de uma requisição nada
+é registrado.
+
+O resultado sai no header Server-Timing (aparece no DevTools do navegador)
+e numa linha de log `core.instrumentacao` com campos chave=valor. Acima de
+MEDAGENDA_REQUISICAO_LENTA_MS a linha sai como warning, com o SQL (sem os
+parâmetros) das consultas mais lentas.
+"""
+import contextvars
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Consultas guardadas por requisição para o log de requisição lenta
+MAX_CONSULTAS_GUARDADAS = 200
+CONSULTAS_NO_LOG = 10
+
+_medicao_atual = contextvars.ContextVar('medicao_atual', default=None)
+_AUSENTE = object()
+
+
+class Medicao:
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.duracao = None
+        self.consultas = 0
+        self.tempo_db = 0.0
+        self.sql = []
+        self.acertos_cache = 0
+        self.faltas_cache = 0
+        self.tempo_cache = 0.0
+        self.bytes = 0
+
+    def _executar(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracao = time.perf_counter() - inicio
+            self.consultas += 1
+            self.tempo_db += duracao
+            if len(self.sql) < MAX_CONSULTAS_GUARDADAS:
+                self.sql.append((duracao, sql))
+
+    @contextmanager
+    def ativa(self):
+        """Registra nesta medição as consultas e o uso do cache feitos dentro do bloco."""
+        token = _medicao_atual.set(self)
+        try:
+            with ExitStack() as pilha:
+                for conexao in connections.all():
+                    pilha.enter_context(conexao.execute_wrapper(self._executar))
+                yield self
+        finally:
+            _medicao_atual.reset(token)
+
+    def encerrar(self):
+        self.duracao = time.perf_counter() - self.inicio
+
+    def server_timing(self):
+        decorrido = self.duracao if self.duracao is not None else time.perf_counter() - self.inicio
+        return ', '.join([
+            f'total;dur={decorrido * 1000:.1f}',
+            f'db;dur={self.tempo_db * 1000:.1f};desc="{self.consultas} consultas"',
+            f'cache;dur={self.tempo_cache * 1000:.1f};desc="{self.acertos_cache} acertos {self.faltas_cache} faltas"',
+        ])
+
+    def registrar(self, request, response):
+        """Escreve a linha de log da requisição (warning com o SQL se passou do limite)."""
+        if self.duracao is None:
+            self.encerrar()
+        limite = getattr(settings, 'MEDAGENDA_REQUISICAO_LENTA_MS', 500)
+        lenta = limite is not None and self.duracao * 1000 >= limite
+        if not lenta and not logger.isEnabledFor(logging.INFO):
+            return
+
+        match = getattr(request, 'resolver_match', None)
+        dados = {
+            'metodo': request.method,
+            'rota': match.route if match else request.path,
+            'status': response.status_code,
+            'duracao_ms': round(self.duracao * 1000, 1),
+            'consultas': self.consultas,
+            'db_ms': round(self.tempo_db * 1000, 1),
+            'cache_acertos': self.acertos_cache,
+            'cache_faltas': self.faltas_cache,
+            'bytes': self.bytes,
+        }
+        linha = ' '.join(f'{chave}={valor}' for chave, valor in dados.items())
+
+        if lenta:
+            lentas = sorted(self.sql, key=lambda consulta: consulta[0], reverse=True)[:CONSULTAS_NO_LOG]
+            sql = ''.join(f'\n  {duracao * 1000:.1f}ms {texto}' for duracao, texto in lentas)
+            logger.warning(f'requisicao_lenta {linha}{sql}', extra={'medicao': dados})
+        else:
+            logger.info(f'requisicao {linha}', extra={'medicao': dados})
+
+
+class CacheMedidoMixin:
+    """Conta acertos, faltas e tempo das leituras do cache na medição corrente."""
+
+    def get(self, key, default=None, version=None):
+        medicao = _medicao_atual.get()
+        if medicao is None:
+            return super().get(key, default, version)
+        inicio = time.perf_counter()
+        valor = super().get(key, _AUSENTE, version)
+        medicao.tempo_cache += time.perf_counter() - inicio
+        if valor is _AUSENTE:
+            medicao.faltas_cache += 1
+            return default
+        medicao.acertos_cache += 1
+        return valor
+
+    def get_many(self, keys, version=None):
+        medicao = _medicao_atual.get()
+        if medicao is None:
+            return super().get_many(keys, version)
+        keys = list(keys)
+        # O get_many padrão chama get() por chave: sem medição aqui dentro para não contar duas vezes
+        token = _medicao_atual.set(None)
+        inicio = time.perf_counter()
+        try:
+            valores = super().get_many(keys, version)
+        finally:
+            _medicao_atual.reset(token)
+        medicao.tempo_cache += time.perf_counter() - inicio
+        medicao.acertos_cache += len(valores)
+        medicao.faltas_cache += len(keys) - len(valores)
+        return valores
+
+
+class LocMemCacheMedido(CacheMedidoMixin, LocMemCache):
+    pass
+
+
+class RedisCacheMedido(CacheMedidoMixin, RedisCache):
+    pass
@@ -0,0 +1,91 @@
+"""
+Lembretes de consulta (24h e 2h antes de cada agendamento confirmado).
+
+O comando `enviar_lembretes` roda a cada poucos minutos. Para cada tipo de
+lembrete, os agendamentos devidos são os de status 'agendado' com data_hora
+dentro da janela do tipo, lidos por uma varredura de faixa no índice
+parcial agend_agendado_data_idx (só as próximas horas, nunca a tabela
+inteira). A tabela LembreteEnviado garante que cada lembrete sai uma vez
+só: ela é gravada na mesma transação que coloca os emails na fila.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .emails import enfileirar_emails
+from .models import Agendamento, LembreteEnviado
+
+# (tipo, antecedência), do mais cedo para o mais tarde. A janela de cada tipo
+# vai até a antecedência do tipo seguinte: quem marcou a consulta para daqui a
+# uma hora recebe só o lembrete de 2h, não os dois.
+LEMBRETES = [
+    ('24h', timedelta(hours=24)),
+    ('2h', timedelta(hours=2)),
+]
+
+
+def janela_do_lembrete(tipo, agora):
+    """Faixa (inicio, fim] de data_hora dos agendamentos que devem receber o lembrete `tipo`."""
+    tipos = [t for t, _ in LEMBRETES]
+    indice = tipos.index(tipo)
+    proximo = LEMBRETES[indice + 1][1] if indice + 1 < len(LEMBRETES) else timedelta(0)
+    return agora + proximo, agora + LEMBRETES[indice][1]
+
+
+def lembretes_pendentes(tipo, agora=None):
+    """Agendamentos confirmados na janela de `tipo` que ainda não receberam esse lembrete."""
+    inicio, fim = janela_do_lembrete(tipo, agora or timezone.now())
+    return (
+        Agendamento.objects.filter(status='agendado', data_hora__gt=inicio, data_hora__lte=fim)
+        .exclude(Exists(LembreteEnviado.objects.filter(agendamento=OuterRef('pk'), tipo=tipo)))
+        .order_by('data_hora')
+    )
+
+
+def _mensagem(agendamento, tipo):
+    quando = timezone.localtime(agendamento.data_hora)
+    return {
+        'assunto': f'Lembrete: consulta em {quando:%d/%m/%Y} às {quando:%H:%M}',
+        'mensagem': (
+            f"Olá {agendamento.paciente.nome},\n\n"
+            f"Lembramos que você tem uma consulta com Dr(a). {agendamento.medico.nome} "
+            f"em {quando:%d/%m/%Y} às {quando:%H:%M}.\n\n"
+            "Caso não possa comparecer, cancele pela plataforma.\n\n"
+            "Atenciosamente,\n"
+            "Equipe MedAgenda"
+        ),
+        'destinatarios': [agendamento.paciente.email],
+    }
+
+
+def enfileirar_lembretes(agora=None, lote=1000):
+    """
+    Coloca na fila os lembretes devidos. Retorna {tipo: quantidade}.
+    Várias execuções ao mesmo tempo não duplicam lembretes: as linhas já
+    travadas por outra execução são puladas, e a constraint única de
+    LembreteEnviado é a última barreira.
+    """
+    agora = agora or timezone.now()
+    totais = {}
+    for tipo, _ in LEMBRETES:
+        totais[tipo] = 0
+        while True:
+            with transaction.atomic():
+                agendamentos = list(
+                    lembretes_pendentes(tipo, agora)
+                    .select_related('paciente', 'medico')
+                    .only('id', 'data_hora', 'paciente__nome', 'paciente__email', 'medico__nome')
+                    .select_for_update(skip_locked=True, of=('self',))[:lote]
+                )
+                if not agendamentos:
+                    break
+                LembreteEnviado.objects.bulk_create([
+                    LembreteEnviado(agendamento=agendamento, tipo=tipo) for agendamento in agendamentos
+                ])
+                enfileirar_emails([_mensagem(agendamento, tipo) for agendamento in agendamentos])
+            totais[tipo] += len(agendamentos)
+            if len(agendamentos) < lote:
+                break
+    return totais
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.emails import enviar_pendentes
+
+
+class Command(BaseCommand):
+    help = 'Envia os emails pendentes da fila (EmailOutbox) em lotes, por uma única conexão SMTP por lote.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=None, help='Emails por lote (padrão: MEDAGENDA_EMAIL_LOTE)')
+        parser.add_argument('--continuo', action='store_true', help='Continua rodando e consultando a fila')
+        parser.add_argument(
+            '--intervalo', type=float, default=5,
+            help='Segundos de espera quando a fila está vazia (com --continuo)',
+        )
+
+    def handle(self, *args, **options):
+        totais = [0, 0, 0]
+        while True:
+            resultado = enviar_pendentes(lote=options['lote'])
+            for i, total in enumerate(resultado):
+                totais[i] += total
+            if any(resultado):
+                continue
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{totais[0]} emails enviados, {totais[1]} reagendados, {totais[2]} com falha definitiva.'
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.lembretes import enfileirar_lembretes
+
+
+class Command(BaseCommand):
+    help = 'Coloca na fila os lembretes de consulta (24h e 2h antes). Rodar a cada poucos minutos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Agendamentos por transação')
+
+    def handle(self, *args, **options):
+        totais = enfileirar_lembretes(lote=options['lote'])
+        resumo = ', '.join(f'{total} de {tipo}' for tipo, total in totais.items())
+        self.stdout.write(self.style.SUCCESS(f'Lembretes colocados na fila: {resumo}.'))
@@ -0,0 +1,122 @@
+from datetime import timedelta
+from itertools import groupby
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core.disponibilidade import inicio_do_dia
+from core.emails import enfileirar_emails
+from core.models import Agendamento, ResumoEnviado
+
+ROTULOS_STATUS = dict(Agendamento.STATUS_CHOICES)
+
+# Dias que uma execução recupera quando a anterior não rodou
+MAX_DIAS_ATRASADOS = 7
+
+
+def dias_pendentes():
+    """
+    Dias ainda sem resumo: do dia seguinte ao último resumo enviado até
+    ontem (no máximo MAX_DIAS_ATRASADOS). Sem nenhum resumo ainda, só ontem.
+    """
+    ontem = timezone.localdate() - timedelta(days=1)
+    ultimo = ResumoEnviado.objects.aggregate(ultimo=Max('data'))['ultimo']
+    if ultimo is None:
+        return ontem, ontem
+    return max(ultimo + timedelta(days=1), ontem - timedelta(days=MAX_DIAS_ATRASADOS - 1)), ontem
+
+
+def solicitacoes_do_periodo(de, ate):
+    """
+    Agendamentos criados de `de` até `ate` (datas locais, inclusive) dos
+    médicos que preferem o resumo, em uma única consulta (índice
+    agend_created_idx). A data de criação não muda: uma alteração depois da
+    meia-noite não tira o agendamento do resumo do dia em que foi pedido.
+    """
+    tz = timezone.get_current_timezone()
+    return (
+        Agendamento.objects.filter(
+            medico__preferencia_notificacao='resumo',
+            created_at__gte=inicio_do_dia(de, tz),
+            created_at__lt=inicio_do_dia(ate + timedelta(days=1), tz),
+        )
+        .order_by('medico_id', 'status', 'data_hora')
+        .values_list('medico_id', 'medico__nome', 'medico__email', 'status', 'data_hora', 'paciente__nome', 'created_at')
+    )
+
+
+def montar_resumo(dia, nome, linhas):
+    partes = [
+        f"Olá Dr(a). {nome},",
+        '',
+        f"Resumo das solicitações de agendamento recebidas em {dia:%d/%m/%Y}:",
+    ]
+    for status, do_status in groupby(linhas, key=lambda linha: linha[3]):
+        do_status = list(do_status)
+        partes += ['', f"{ROTULOS_STATUS.get(status, status)} ({len(do_status)}):"]
+        partes += [
+            f"- {timezone.localtime(data_hora):%d/%m/%Y %H:%M} - {paciente or 'Paciente'}"
+            for _, _, _, _, data_hora, paciente, _ in do_status
+        ]
+    partes += [
+        '',
+        'Acesse sua agenda para confirmar ou recusar as solicitações.',
+        '',
+        'Atenciosamente,',
+        'Equipe MedAgenda',
+    ]
+    return '\n'.join(partes)
+
+
+class Command(BaseCommand):
+    help = (
+        'Coloca na fila um email de resumo por médico e dia com as solicitações de agendamento '
+        'recebidas (médicos com preferencia_notificacao="resumo"). Rodar uma vez por dia, depois '
+        'da meia-noite; cobre também os dias em que não rodou, e rodar de novo não repete resumos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data', help='Dia do resumo (AAAA-MM-DD). Padrão: dias sem resumo até ontem')
+
+    def handle(self, *args, **options):
+        if options['data']:
+            de = ate = parse_date(options['data'])
+            if de is None:
+                raise CommandError('Data inválida. Use o formato AAAA-MM-DD.')
+        else:
+            de, ate = dias_pendentes()
+        if de > ate:
+            self.stdout.write(self.style.SUCCESS('Nenhum dia pendente de resumo.'))
+            return
+
+        # Agrupa por (médico, dia de criação), mantendo a ordem por status e horário
+        por_medico_e_dia = {}
+        for linha in solicitacoes_do_periodo(de, ate):
+            chave = (linha[0], timezone.localdate(linha[6]))
+            por_medico_e_dia.setdefault(chave, []).append(linha)
+
+        with transaction.atomic():
+            # Os resumos já enviados ficam de fora; a trava unique impede duas execuções simultâneas de repetir
+            enviados = set(
+                ResumoEnviado.objects.filter(data__range=(de, ate)).values_list('medico_id', 'data')
+            )
+            marcas, emails = [], []
+            for (medico_id, dia), linhas in por_medico_e_dia.items():
+                if (medico_id, dia) in enviados:
+                    continue
+                _, nome, email, *_ = linhas[0]
+                marcas.append(ResumoEnviado(medico_id=medico_id, data=dia))
+                emails.append({
+                    'assunto': f'Resumo dos agendamentos de {dia:%d/%m/%Y}',
+                    'mensagem': montar_resumo(dia, nome, linhas),
+                    'destinatarios': [email],
+                })
+            ResumoEnviado.objects.bulk_create(marcas)
+            # Um único INSERT; o worker enviar_emails entrega os resumos em lote, por uma única conexão
+            enfileirar_emails(emails)
+
+        periodo = f'{de:%d/%m/%Y}' if de == ate else f'{de:%d/%m/%Y} a {ate:%d/%m/%Y}'
+        self.stdout.write(self.style.SUCCESS(f'{len(emails)} resumos de {periodo} colocados na fila.'))
@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.disponibilidade import inicio_do_dia
+from core.models import HorarioAtendimento, HorizonteSlots, Slot
+from core.slots import horizonte_slots, sincronizar_slots
+
+
+class Command(BaseCommand):
+    help = 'Estende a tabela de slots até o horizonte configurado e remove slots passados. Rodar uma vez por noite.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--completo', action='store_true',
+            help='Recalcula todo o horizonte (use ao ativar a tabela pela primeira vez)',
+        )
+
+    def handle(self, *args, **options):
+        hoje = timezone.localdate()
+        horizonte = horizonte_slots()
+        tz = timezone.get_current_timezone()
+
+        # Slots de dias que já passaram não são mais consultados; os além do
+        # horizonte (se ele diminuiu) deixariam de ser mantidos
+        removidos, _ = Slot.objects.filter(fim__lt=timezone.now() - timedelta(days=1)).delete()
+        alem, _ = Slot.objects.filter(inicio__gte=inicio_do_dia(horizonte + timedelta(days=1), tz)).delete()
+
+        # Só os dias depois do horizonte da execução anterior: até ele, os
+        # signals já mantêm os slots de todos os médicos atualizados
+        anterior = None if options['completo'] else HorizonteSlots.objects.values_list('ate', flat=True).first()
+        de = max(hoje, anterior + timedelta(days=1)) if anterior else hoje
+
+        totais = [0, 0, 0]
+        if de <= horizonte:
+            medicos = HorarioAtendimento.objects.values_list('medico_id', flat=True).distinct()
+            for medico_id in medicos:
+                for i, total in enumerate(sincronizar_slots(medico_id, de, horizonte)):
+                    totais[i] += total
+        HorizonteSlots.objects.update_or_create(pk=1, defaults={'ate': horizonte})
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Slots até {horizonte}: {totais[0]} criados, {totais[1]} removidos, '
+            f'{totais[2]} atualizados; {removidos + alem} slots passados ou além do horizonte excluídos.'
+        ))
@@ -0,0 +1,63 @@
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from core.lembretes import lembretes_pendentes
+from core.models import Agendamento, CodigoVerificacao, HorarioAtendimento, STATUS_ATIVOS, Usuario
+
+
+class Command(BaseCommand):
+    help = 'Mostra o EXPLAIN das principais consultas das views para conferir o uso dos índices.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--medico', help='UUID do médico usado nas consultas (padrão: o primeiro médico cadastrado)')
+        parser.add_argument('--paciente', help='UUID do paciente usado nas consultas (padrão: o primeiro paciente cadastrado)')
+        parser.add_argument('--analyze', action='store_true', help='Executa as consultas (EXPLAIN ANALYZE, apenas PostgreSQL)')
+
+    def handle(self, *args, **options):
+        medico_id = options['medico'] or self.primeiro_usuario('medico')
+        paciente_id = options['paciente'] or self.primeiro_usuario('comum')
+        agora = timezone.now()
+        fim = agora + timedelta(days=30)
+
+        consultas = [
+            ('MeusAgendamentosView (médico)',
+             Agendamento.objects.filter(medico_id=medico_id).order_by('data_hora', 'id')[:21]),
+            ('MeusAgendamentosView (paciente)',
+             Agendamento.objects.filter(paciente_id=paciente_id).order_by('data_hora', 'id')[:21]),
+            ('MeusAgendamentosView (médico + status + faixa de data)',
+             Agendamento.objects.filter(
+                 medico_id=medico_id, status='agendado', data_hora__gte=agora, data_hora__lte=fim,
+             ).order_by('data_hora', 'id')[:21]),
+            ('Checagem de conflito de agenda (status ativos)',
+             Agendamento.objects.filter(
+                 medico_id=medico_id, status__in=STATUS_ATIVOS, data_hora__gte=agora, data_hora__lt=fim,
+             )),
+            ('enviar_lembretes (janela de 24h)',
+             lembretes_pendentes('24h', agora)),
+            ('validar_codigo / resetar_senha',
+             CodigoVerificacao.objects.filter(email='paciente@exemplo.com', codigo='000000')),
+            ('Horários de atendimento do médico por dia',
+             HorarioAtendimento.objects.filter(medico_id=medico_id, dia_semana='segunda')),
+        ]
+
+        explain_options = {}
+        if options['analyze']:
+            if connection.vendor != 'postgresql':
+                self.stderr.write('--analyze só é suportado no PostgreSQL; mostrando apenas o plano.')
+            else:
+                explain_options = {'analyze': True, 'buffers': True}
+
+        for titulo, queryset in consultas:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== {titulo}'))
+            self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain(**explain_options))
+            self.stdout.write('')
+
+    def primeiro_usuario(self, tipo):
+        pk = Usuario.objects.filter(tipo=tipo).values_list('pk', flat=True).first()
+        # Sem dados ainda: um UUID qualquer ainda mostra o plano escolhido
+        return pk or uuid.uuid4()
@@ -0,0 +1,63 @@
+import time
+import uuid
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede quantas requisições por segundo o endpoint de status da sessão atende '
+        'em um worker (handler WSGI completo: middlewares, URL, DRF e view) e confere '
+        'que nenhuma vai ao banco.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requisicoes', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        # Token montado só com os claims: o endpoint não procura o usuário
+        token = AccessToken()
+        token[api_settings.USER_ID_CLAIM] = str(uuid.uuid4())
+        token['email'] = 'medicao@medagenda.local'
+        token['tipo'] = 'paciente'
+
+        host = next((h for h in settings.ALLOWED_HOSTS if h and not h.startswith('.') and h != '*'), 'localhost')
+        ambiente = {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': '/usuarios/verificar-sessao/',
+            'HTTP_HOST': host,
+            'HTTP_AUTHORIZATION': f'Bearer {token}',
+        }
+        setup_testing_defaults(ambiente)
+        aplicacao = WSGIHandler()
+
+        def requisicao():
+            situacao = []
+            corpo = aplicacao(dict(ambiente), lambda status, headers: situacao.append(status))
+            b''.join(corpo)
+            corpo.close()
+            return situacao[0]
+
+        situacao = requisicao()  # aquece imports e caches de URL
+        if not situacao.startswith('200'):
+            self.stderr.write(f'Resposta inesperada: {situacao}')
+            return
+
+        total = options['requisicoes']
+        with CaptureQueriesContext(connection) as consultas:
+            inicio = time.perf_counter()
+            for _ in range(total):
+                requisicao()
+            duracao = time.perf_counter() - inicio
+
+        self.stdout.write(
+            f'{total} requisições em {duracao:.2f}s: {total / duracao:.0f} req/s, '
+            f'{duracao / total * 1e6:.0f} µs por requisição, {len(consultas)} consultas ao banco'
+        )
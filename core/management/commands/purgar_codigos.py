@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.codigos import purgar_codigos_expirados
+
+
+class Command(BaseCommand):
+    help = 'Apaga do banco os códigos de verificação vencidos. Rodar periodicamente (ex.: a cada hora).'
+
+    def handle(self, *args, **options):
+        removidos = purgar_codigos_expirados()
+        self.stdout.write(self.style.SUCCESS(f'{removidos} códigos vencidos removidos.'))
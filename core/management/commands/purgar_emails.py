@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core.emails import purgar_enviados
+
+
+class Command(BaseCommand):
+    help = (
+        'Apaga em lotes os emails já enviados há mais de MEDAGENDA_EMAIL_RETENCAO_DIAS. '
+        'Rodar uma vez por dia.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000, help='Emails apagados por transação')
+
+    def handle(self, *args, **options):
+        removidos = purgar_enviados(lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'{removidos} emails enviados removidos.'))
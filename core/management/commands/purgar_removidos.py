@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import AgendamentoRemovido
+
+
+class Command(BaseCommand):
+    help = (
+        'Apaga os registros de agendamentos removidos mais antigos que '
+        'MEDAGENDA_SINCRONIZACAO_RETENCAO_DIAS. Rodar uma vez por dia.'
+    )
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(days=settings.MEDAGENDA_SINCRONIZACAO_RETENCAO_DIAS)
+        # Tokens de sincronização anteriores ao limite já recebem 410, então ninguém mais precisa deles
+        removidos, _ = AgendamentoRemovido.objects.filter(removido_em__lt=limite).delete()
+        self.stdout.write(self.style.SUCCESS(f'{removidos} registros de remoção apagados.'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+
+class Command(BaseCommand):
+    help = (
+        'Apaga em lotes os refresh tokens expirados (e suas entradas na blacklist). '
+        'Rodar uma vez por dia.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000, help='Tokens apagados por transação')
+
+    def handle(self, *args, **options):
+        agora = aware_utcnow()
+        removidos = 0
+        ultimo_id = 0
+        while True:
+            # Percorre pela chave primária: os ids crescem com a emissão, então os
+            # expirados ficam no começo e cada lote é uma varredura curta no índice
+            ids = list(
+                OutstandingToken.objects.filter(id__gt=ultimo_id, expires_at__lte=agora)
+                .order_by('id')
+                .values_list('id', flat=True)[:options['lote']]
+            )
+            if not ids:
+                break
+            # A blacklist sai junto (ON DELETE CASCADE feito pelo Django)
+            OutstandingToken.objects.filter(id__in=ids).delete()
+            removidos += len(ids)
+            ultimo_id = ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'{removidos} tokens expirados removidos.'))
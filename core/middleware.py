@@ -1,10 +1,123 @@
+from django.conf import settings
+from django.middleware.csrf import get_token
 from django.utils.deprecation import MiddlewareMixin
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.utils import aware_utcnow, datetime_from_epoch
+
+from .instrumentacao import Medicao
+from .tokens import renovar_tokens
+
+COOKIE_REFRESH = 'refresh_token'
+
+
+def _config():
+    return getattr(settings, 'SIMPLE_JWT', {})
+
+
+def cookie_acesso():
+    return _config().get('AUTH_COOKIE', 'access_token')
+
+
+def _segundos_restantes(access):
+    try:
+        token = AccessToken(access)
+    except TokenError:
+        # Vencido ou inválido: o refresh token decide
+        return 0
+    return (datetime_from_epoch(token['exp']) - aware_utcnow()).total_seconds()
+
 
 class ActivityMiddleware(MiddlewareMixin):
+    """
+    Mede cada requisição (core.instrumentacao): header Server-Timing e uma
+    linha de log com tempo, consultas, cache e bytes. Em respostas streaming
+    o header só cobre o que aconteceu até o início do corpo; o log sai
+    quando o corpo termina de ser enviado, com os totais.
+
+    Renova também o cookie de acesso na própria requisição quando faltam
+    menos de AUTH_COOKIE_REFRESH_THRESHOLD segundos para ele vencer (ou já
+    venceu), usando o cookie do refresh token. O cliente não precisa chamar
+    api/token/refresh/: a requisição segue autenticada com o token novo e a
+    resposta traz os dois cookies atualizados.
+
+    Clientes que mandam o token no header Authorization não são afetados.
+    """
+    async_capable = False
+
+    def __call__(self, request):
+        if not getattr(settings, 'MEDAGENDA_INSTRUMENTACAO', True):
+            return super().__call__(request)
+
+        medicao = Medicao()
+        with medicao.ativa():
+            response = super().__call__(request)
+
+        if getattr(response, 'file_to_stream', None) is not None:
+            # FileResponse: o servidor envia o arquivo direto (wsgi.file_wrapper), sem passar por aqui
+            medicao.bytes = int(response.get('Content-Length') or 0)
+            medicao.encerrar()
+            response['Server-Timing'] = medicao.server_timing()
+            medicao.registrar(request, response)
+        elif response.streaming:
+            response.streaming_content = self._medir_corpo(request, response, response.streaming_content, medicao)
+            response['Server-Timing'] = medicao.server_timing()
+        else:
+            medicao.bytes = len(response.content)
+            medicao.encerrar()
+            response['Server-Timing'] = medicao.server_timing()
+            medicao.registrar(request, response)
+        return response
+
+    def _medir_corpo(self, request, response, conteudo, medicao):
+        # As consultas feitas durante a geração do corpo (ex.: .iterator() na exportação) entram na medição
+        try:
+            with medicao.ativa():
+                for parte in conteudo:
+                    medicao.bytes += len(parte)
+                    yield parte
+        finally:
+            medicao.registrar(request, response)
+
     def process_request(self, request):
-        # Aqui você pode adicionar lógica para rastrear atividade do usuário
-        pass
+        request.tokens_renovados = None
+        config = _config()
+        if not config.get('AUTH_COOKIE_REFRESH'):
+            return
+        refresh = request.COOKIES.get(COOKIE_REFRESH)
+        if not refresh:
+            return
+
+        limite = config.get('AUTH_COOKIE_REFRESH_THRESHOLD', 300)
+        access = request.COOKIES.get(cookie_acesso())
+        if access and _segundos_restantes(access) >= limite:
+            return
+
+        tokens = renovar_tokens(refresh, janela=limite)
+        if tokens:
+            # A autenticação desta mesma requisição já usa o token novo
+            request.COOKIES[cookie_acesso()] = tokens['access']
+            request.tokens_renovados = tokens
+            # Garante o cookie csrftoken (gravado pelo CsrfViewMiddleware) para as requisições que alteram dados
+            get_token(request)
 
     def process_response(self, request, response):
-        # Aqui você pode adicionar lógica para processar a resposta
-        return response 
\ No newline at end of file
+        tokens = getattr(request, 'tokens_renovados', None)
+        if tokens:
+            config = _config()
+            opcoes = {
+                'secure': config.get('AUTH_COOKIE_SECURE', False),
+                'httponly': config.get('AUTH_COOKIE_HTTP_ONLY', True),
+                'path': config.get('AUTH_COOKIE_PATH', '/'),
+                'samesite': config.get('AUTH_COOKIE_SAMESITE', 'Lax'),
+            }
+            response.set_cookie(
+                cookie_acesso(), tokens['access'],
+                max_age=int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()), **opcoes
+            )
+            response.set_cookie(
+                COOKIE_REFRESH, tokens['refresh'],
+                max_age=int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()), **opcoes
+            )
+        return response
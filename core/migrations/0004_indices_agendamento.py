@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-17 19:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_alter_horarioatendimento_medico_alter_usuario_foto'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['medico', 'data_hora'], name='agend_medico_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['paciente', 'data_hora'], name='agend_paciente_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(condition=models.Q(('status__in', ('solicitado', 'pendente', 'agendado'))), fields=['medico', 'data_hora'], name='agend_medico_ativos_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='codigoverificacao',
+            index=models.Index(fields=['email', 'codigo'], name='codigo_email_codigo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='horarioatendimento',
+            index=models.Index(fields=['medico', 'dia_semana'], name='horario_medico_dia_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-17 20:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_agendamento_updated_at_agendamentoremovido'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Slot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField()),
+                ('fim', models.DateTimeField()),
+                ('local', models.CharField(max_length=255)),
+                ('estado', models.CharField(choices=[('livre', 'Livre'), ('ocupado', 'Ocupado')], default='livre', max_length=10)),
+                ('medico', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('estado', 'livre')), fields=['inicio'], name='slot_livre_inicio_idx')],
+                'constraints': [models.UniqueConstraint(fields=('medico', 'inicio', 'local'), name='slot_medico_inicio_local_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2 on 2026-10-17 20:09
+
+from django.db import migrations, models
+
+
+# Cópia de core.faixas.compactar (e do que ela usa) como estava quando esta
+# migração foi escrita: mudanças futuras no módulo não alteram o que ela faz.
+
+def _minutos(valor):
+    hora, minuto = map(int, valor.split(':'))
+    if not (0 <= hora <= 23 and 0 <= minuto <= 59):
+        raise ValueError(valor)
+    return hora * 60 + minuto
+
+
+def _passo(duracao, intervalo):
+    duracao = max(duracao, 1)
+    return duracao, max(duracao + intervalo, duracao)
+
+
+def _ler_horario(valor):
+    if not isinstance(valor, str):
+        raise ValueError(valor)
+    if '-' in valor:
+        inicio, fim = (_minutos(parte.strip()) for parte in valor.split('-', 1))
+        if fim <= inicio:
+            raise ValueError(valor)
+        return inicio, fim
+    return _minutos(valor.strip()), None
+
+
+def _inicios(horarios, duracao, intervalo):
+    duracao, passo = _passo(duracao, intervalo)
+    inicios = set()
+    for valor in horarios:
+        inicio, fim = _ler_horario(valor)
+        if fim is None:
+            inicios.add(inicio)
+        else:
+            inicios.update(range(inicio, fim - duracao + 1, passo))
+    return sorted(inicios)
+
+
+def compactar(horarios, duracao, intervalo):
+    duracao, passo = _passo(duracao, intervalo)
+    faixas = []
+    for inicio in _inicios(horarios, duracao, intervalo):
+        if faixas and inicio == faixas[-1][1] - duracao + passo:
+            faixas[-1][1] = inicio + duracao
+        else:
+            faixas.append([inicio, inicio + duracao])
+    return faixas
+
+
+def preencher_faixas(apps, schema_editor):
+    HorarioAtendimento = apps.get_model('core', 'HorarioAtendimento')
+    for horario in HorarioAtendimento.objects.all().iterator():
+        try:
+            horario.faixas = compactar(horario.horarios or [], horario.duracao_consulta_minutos, horario.intervalo_consulta_minutos)
+        except (TypeError, ValueError):
+            # Horário fora do formato: fica sem faixas e continua sendo lido pela lista original
+            continue
+        horario.save(update_fields=['faixas'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_slot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='horarioatendimento',
+            name='faixas',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.RunPython(preencher_faixas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-17 20:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_horarioatendimento_faixas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExcecaoHorario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_inicio', models.DateField()),
+                ('data_fim', models.DateField()),
+                ('tipo', models.CharField(choices=[('bloqueio', 'Bloqueio'), ('extra', 'Horário extra')], max_length=10)),
+                ('horarios', models.JSONField(blank=True, default=list)),
+                ('faixas', models.JSONField(blank=True, default=list, editable=False)),
+                ('local', models.CharField(blank=True, max_length=255)),
+                ('duracao_consulta_minutos', models.IntegerField(default=30)),
+                ('intervalo_consulta_minutos', models.IntegerField(default=10)),
+                ('motivo', models.CharField(blank=True, max_length=255)),
+                ('medico', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='excecoes_horario', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['medico', 'data_inicio', 'data_fim'], name='excecao_medico_periodo_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+import logging
+
+from django.db import DatabaseError, migrations, transaction
+
+logger = logging.getLogger(__name__)
+
+# Só no PostgreSQL: em outros bancos a busca usa icontains (core.busca_medicos).
+# O documento de busca fica em uma coluna gerada (fora do modelo Django) para
+# o ranking não precisar recalcular o to_tsvector de cada linha.
+COLUNA_DOCUMENTO = (
+    "ALTER TABLE core_usuario ADD COLUMN IF NOT EXISTS busca_documento tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('portuguese'::regconfig, COALESCE(nome, '') || ' ' || "
+    "COALESCE(especialidade, '') || ' ' || COALESCE(cidade, ''))) STORED"
+)
+INDICE_TEXTO = (
+    'usuario_busca_documento_idx',
+    "CREATE INDEX IF NOT EXISTS usuario_busca_documento_idx ON core_usuario USING gin (busca_documento)",
+)
+INDICES_TRIGRAMA = [
+    ('usuario_nome_trgm_idx', "CREATE INDEX IF NOT EXISTS usuario_nome_trgm_idx ON core_usuario USING gin (nome gin_trgm_ops)"),
+    ('usuario_especialidade_trgm_idx', "CREATE INDEX IF NOT EXISTS usuario_especialidade_trgm_idx ON core_usuario USING gin (especialidade gin_trgm_ops)"),
+    ('usuario_cidade_trgm_idx', "CREATE INDEX IF NOT EXISTS usuario_cidade_trgm_idx ON core_usuario USING gin (cidade gin_trgm_ops)"),
+    ('horario_local_trgm_idx', "CREATE INDEX IF NOT EXISTS horario_local_trgm_idx ON core_horarioatendimento USING gin (local gin_trgm_ops)"),
+]
+
+
+def criar_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(COLUNA_DOCUMENTO)
+    schema_editor.execute(INDICE_TEXTO[1])
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError:
+        # Sem a extensão (ou sem permissão para criá-la) a busca usa texto + icontains
+        logger.warning('Extensão pg_trgm indisponível: índices de trigramas não foram criados.')
+        return
+    for _, sql in INDICES_TRIGRAMA:
+        schema_editor.execute(sql)
+
+
+def remover_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nome, _ in [INDICE_TEXTO, *INDICES_TRIGRAMA]:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {nome}')
+    schema_editor.execute('ALTER TABLE core_usuario DROP COLUMN IF EXISTS busca_documento')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_excecaohorario'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indices, remover_indices),
+    ]
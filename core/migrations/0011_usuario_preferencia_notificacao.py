@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 20:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usuario',
+            name='preferencia_notificacao',
+            field=models.CharField(choices=[('imediato', 'Imediato'), ('resumo', 'Resumo diário')], default='imediato', max_length=10),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-17 20:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_usuario_preferencia_notificacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LembreteEnviado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('24h', '24 horas antes'), ('2h', '2 horas antes')], max_length=3)),
+                ('enviado_em', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(condition=models.Q(('status', 'agendado')), fields=['data_hora'], name='agend_agendado_data_idx'),
+        ),
+        migrations.AddField(
+            model_name='lembreteenviado',
+            name='agendamento',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lembretes', to='core.agendamento'),
+        ),
+        migrations.AddConstraint(
+            model_name='lembreteenviado',
+            constraint=models.UniqueConstraint(fields=('agendamento', 'tipo'), name='lembrete_agendamento_tipo_uniq'),
+        ),
+    ]
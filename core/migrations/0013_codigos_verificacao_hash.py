@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-17 20:38
+
+from django.db import migrations, models
+
+
+def apagar_codigos_em_texto(apps, schema_editor):
+    # Os códigos antigos estão em texto e duram 30 minutos: basta pedir outro
+    apps.get_model('core', 'CodigoVerificacao').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_lembretes'),
+    ]
+
+    operations = [
+        migrations.RunPython(apagar_codigos_em_texto, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='codigoverificacao',
+            name='codigo',
+            field=models.CharField(max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='codigoverificacao',
+            index=models.Index(fields=['criado_em'], name='codigo_criado_em_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-17 21:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_codigos_verificacao_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agendamentoremovido',
+            index=models.Index(fields=['removido_em'], name='removido_em_idx'),
+        ),
+    ]
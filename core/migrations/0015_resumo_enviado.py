@@ -0,0 +1,52 @@
+# Generated by Django 5.2 on 2026-10-17 21:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def preencher_created_at(apps, schema_editor):
+    # Sem a data de criação dos agendamentos antigos, a melhor aproximação é a última alteração
+    # (senão todos cairiam no resumo do dia da migração)
+    Agendamento = apps.get_model('core', 'Agendamento')
+    Agendamento.objects.update(created_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_agendamento_removido_em_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoEnviado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('enviado_em', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='agendamento',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(preencher_created_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['created_at'], name='agend_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='resumoenviado',
+            name='medico',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumos_enviados', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='resumoenviado',
+            constraint=models.UniqueConstraint(fields=('medico', 'data'), name='resumo_medico_data_uniq'),
+        ),
+    ]
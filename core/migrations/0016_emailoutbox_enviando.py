@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-17 21:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_resumo_enviado'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='emailoutbox',
+            name='email_pendente_idx',
+        ),
+        migrations.AlterField(
+            model_name='emailoutbox',
+            name='estado',
+            field=models.CharField(choices=[('pendente', 'Pendente'), ('enviando', 'Enviando'), ('enviado', 'Enviado'), ('falhou', 'Falhou')], default='pendente', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='emailoutbox',
+            index=models.Index(condition=models.Q(('estado__in', ['pendente', 'enviando'])), fields=['proxima_tentativa'], name='email_pendente_idx'),
+        ),
+    ]
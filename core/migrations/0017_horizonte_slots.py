@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-17 21:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_emailoutbox_enviando'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HorizonteSlots',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ate', models.DateField()),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2 on 2026-10-17 22:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_horizonte_slots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailoutbox',
+            name='confidencial',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='emailoutbox',
+            index=models.Index(condition=models.Q(('confidencial', True)), fields=['criado_em'], name='email_confidencial_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-17 22:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_emailoutbox_confidencial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emailoutbox',
+            index=models.Index(condition=models.Q(('estado', 'enviado')), fields=['enviado_em'], name='email_enviado_idx'),
+        ),
+    ]
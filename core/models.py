@@ -1,11 +1,20 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.contrib.auth.models import BaseUserManager
 from django.utils import timezone
 from datetime import timedelta
 import uuid
 
+from .faixas import compactar, expandir, janelas, minutos_para_hhmm
+
+# Status que ocupam a agenda do médico (usados em índices parciais e checagens de conflito)
+STATUS_ATIVOS = ('solicitado', 'pendente', 'agendado')
+
+# Validade dos códigos de verificação enviados por email
+VALIDADE_CODIGO = timedelta(minutes=30)
+
 class UsuarioManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
         if not email:
@@ -44,6 +53,12 @@ class Usuario(AbstractUser):
     crm = models.CharField(max_length=20, blank=True)
     especialidade = models.CharField(max_length=100, blank=True)
     foto = models.ImageField(upload_to='fotos_usuarios/', null=True, blank=True)
+    # Médicos: um email por solicitação ou um resumo diário (comando enviar_resumo_medicos)
+    preferencia_notificacao = models.CharField(
+        max_length=10,
+        choices=[('imediato', 'Imediato'), ('resumo', 'Resumo diário')],
+        default='imediato',
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['tipo']
@@ -72,6 +87,15 @@ class Usuario(AbstractUser):
         verbose_name_plural = 'Usuários'
 
 
+class AgendamentoQuerySet(models.QuerySet):
+    def com_relacionados(self):
+        """
+        Carrega médico, paciente e anexos junto com os agendamentos,
+        evitando uma consulta por linha na serialização.
+        """
+        return self.select_related('medico', 'paciente').prefetch_related('anexos')
+
+
 # ✅ Modelo de Agendamento de consultas
 class Agendamento(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -82,6 +106,7 @@ class Agendamento(models.Model):
         ('cancelado', 'Cancelado'),
         ('concluido', 'Concluído'),
     ]
+    STATUS_ATIVOS = STATUS_ATIVOS
 
     paciente = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -98,17 +123,112 @@ class Agendamento(models.Model):
     data_hora = models.DateTimeField()
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='solicitado')
     observacoes = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)  # Usado pelo resumo diário dos médicos
+    updated_at = models.DateTimeField(auto_now=True)  # Usado pela sincronização incremental
+
+    objects = AgendamentoQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.paciente.email} com {self.medico.email} em {self.data_hora}"
 
+    class Meta:
+        indexes = [
+            # Listagens e checagens de agenda filtram por médico/paciente + faixa de data_hora
+            models.Index(fields=['medico', 'data_hora'], name='agend_medico_data_idx'),
+            models.Index(fields=['paciente', 'data_hora'], name='agend_paciente_data_idx'),
+            # Só os agendamentos que ocupam horário (bem menor que o histórico completo)
+            models.Index(
+                fields=['medico', 'data_hora'],
+                name='agend_medico_ativos_idx',
+                condition=models.Q(status__in=STATUS_ATIVOS),
+            ),
+            # Sincronização incremental: "o que mudou desde X" para cada usuário
+            models.Index(fields=['medico', 'updated_at'], name='agend_medico_updated_idx'),
+            models.Index(fields=['paciente', 'updated_at'], name='agend_paciente_updated_idx'),
+            # Lembretes: "consultas confirmadas nas próximas horas", sem passar pelo histórico
+            models.Index(fields=['data_hora'], name='agend_agendado_data_idx', condition=models.Q(status='agendado')),
+            # Resumo diário: "solicitações recebidas no dia"
+            models.Index(fields=['created_at'], name='agend_created_idx'),
+        ]
+
+
+# ✅ Registro (tombstone) de agendamentos excluídos, para a sincronização incremental
+class AgendamentoRemovido(models.Model):
+    agendamento_id = models.UUIDField()
+    # Sem constraint: o registro sobrevive à exclusão do usuário (cascata)
+    medico = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+'
+    )
+    paciente = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+'
+    )
+    removido_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Agendamento {self.agendamento_id} removido em {self.removido_em}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['medico', 'removido_em'], name='removido_medico_idx'),
+            models.Index(fields=['paciente', 'removido_em'], name='removido_paciente_idx'),
+            # Limpeza dos registros vencidos (purgar_removidos)
+            models.Index(fields=['removido_em'], name='removido_em_idx'),
+        ]
+
+# ✅ Lembretes já colocados na fila (um por agendamento e tipo)
+class LembreteEnviado(models.Model):
+    TIPO_CHOICES = [
+        ('24h', '24 horas antes'),
+        ('2h', '2 horas antes'),
+    ]
+
+    agendamento = models.ForeignKey(Agendamento, on_delete=models.CASCADE, related_name='lembretes')
+    tipo = models.CharField(max_length=3, choices=TIPO_CHOICES)
+    enviado_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Lembrete {self.tipo} de {self.agendamento_id}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['agendamento', 'tipo'], name='lembrete_agendamento_tipo_uniq'),
+        ]
+
+# Resumo diário já colocado na fila (enviar_resumo_medicos): no máximo um por médico e dia
+class ResumoEnviado(models.Model):
+    medico = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='resumos_enviados')
+    data = models.DateField()
+    enviado_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Resumo de {self.data} para {self.medico_id}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['medico', 'data'], name='resumo_medico_data_uniq'),
+        ]
+
+# Cópia no banco dos códigos de verificação (o principal fica no cache, ver core.codigos)
 class CodigoVerificacao(models.Model):
     email = models.EmailField()
-    codigo = models.CharField(max_length=6)
+    codigo = models.CharField(max_length=64)  # HMAC do código, nunca o código em texto
     criado_em = models.DateTimeField(auto_now_add=True)
 
     def esta_valido(self):
-        return timezone.now() < self.criado_em + timedelta(minutes=30)
+        return timezone.now() < self.criado_em + VALIDADE_CODIGO
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['email', 'codigo'], name='codigo_email_codigo_idx'),
+            # Limpeza dos códigos vencidos (comando purgar_codigos)
+            models.Index(fields=['criado_em'], name='codigo_criado_em_idx'),
+        ]
 
     
 class HorarioAtendimento(models.Model):
@@ -125,7 +245,9 @@ class HorarioAtendimento(models.Model):
         ('domingo', 'Domingo'),
     ]
     dia_semana = models.CharField(max_length=10, choices=DIAS_SEMANA)
-    horarios = models.JSONField()  # Salva os horários como lista de strings, ex: ["07:00", "07:40"]
+    horarios = models.JSONField()  # Salva os horários como lista de strings, ex: ["07:00", "07:40"] ou faixas ["07:00-12:00"]
+    # Forma compacta calculada no save: [[inicio, fim], ...] em minutos do dia
+    faixas = models.JSONField(default=list, blank=True, editable=False)
     indisponivel = models.BooleanField(default=False)
     duracao_consulta_minutos = models.IntegerField(default=30) # Campo para a duração da consulta em minutos
     intervalo_consulta_minutos = models.IntegerField(default=10) # Campo para o intervalo entre consultas em minutos
@@ -133,6 +255,173 @@ class HorarioAtendimento(models.Model):
     def __str__(self):
         return f"{self.medico.email} - {self.dia_semana}"
 
+    def clean(self):
+        try:
+            compactar(self.horarios or [], self.duracao_consulta_minutos, self.intervalo_consulta_minutos)
+        except (TypeError, ValueError):
+            raise ValidationError({'horarios': 'Use horários "HH:MM" ou faixas "HH:MM-HH:MM".'})
+
+    def atualizar_faixas(self):
+        # bulk_create/bulk_update não chamam o save: quem usa precisa chamar isto antes
+        self.faixas = compactar(self.horarios or [], self.duracao_consulta_minutos, self.intervalo_consulta_minutos)
+
+    def save(self, *args, **kwargs):
+        self.atualizar_faixas()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'faixas'}
+        super().save(*args, **kwargs)
+
+    def inicios_em_minutos(self):
+        """Minutos de início de cada consulta do dia, em ordem."""
+        faixas = self.faixas
+        if not faixas and self.horarios:
+            # Linha gravada por update() em massa, sem passar pelo save
+            faixas = compactar(self.horarios, self.duracao_consulta_minutos, self.intervalo_consulta_minutos)
+        return expandir(faixas, self.duracao_consulta_minutos, self.intervalo_consulta_minutos)
+
+    def horarios_expandidos(self):
+        """Horários de início em "HH:MM", com as faixas já expandidas."""
+        return [minutos_para_hhmm(minuto) for minuto in self.inicios_em_minutos()]
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['medico', 'dia_semana'], name='horario_medico_dia_idx'),
+        ]
+
+# ✅ Exceções por data (feriados, férias, plantões extras)
+class ExcecaoHorario(models.Model):
+    TIPO_CHOICES = [
+        ('bloqueio', 'Bloqueio'),
+        ('extra', 'Horário extra'),
+    ]
+
+    medico = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='excecoes_horario')
+    data_inicio = models.DateField()
+    data_fim = models.DateField()  # inclusive
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    # Bloqueio: vazio bloqueia o dia todo; senão só as faixas informadas ("12:00-14:00")
+    # Extra: horários ou faixas adicionados em cada dia do período
+    horarios = models.JSONField(default=list, blank=True)
+    faixas = models.JSONField(default=list, blank=True, editable=False)
+    local = models.CharField(max_length=255, blank=True)  # Bloqueio sem local vale para todos
+    duracao_consulta_minutos = models.IntegerField(default=30)
+    intervalo_consulta_minutos = models.IntegerField(default=10)
+    motivo = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        return f"{self.medico_id} - {self.tipo} {self.data_inicio} a {self.data_fim}"
+
+    def clean(self):
+        if self.data_inicio and self.data_fim and self.data_fim < self.data_inicio:
+            raise ValidationError({'data_fim': 'A data final deve ser igual ou posterior à inicial.'})
+        try:
+            self.atualizar_faixas()
+        except (TypeError, ValueError):
+            raise ValidationError({'horarios': 'Use horários "HH:MM" ou faixas "HH:MM-HH:MM".'})
+
+    def atualizar_faixas(self):
+        if self.tipo == 'bloqueio':
+            # Bloqueios guardam a janela de tempo bloqueada, não inícios de consulta
+            self.faixas = janelas(self.horarios or [])
+        else:
+            self.faixas = compactar(self.horarios or [], self.duracao_consulta_minutos, self.intervalo_consulta_minutos)
+
+    def save(self, *args, **kwargs):
+        self.atualizar_faixas()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'faixas'}
+        super().save(*args, **kwargs)
+
+    def inicios_em_minutos(self):
+        return expandir(self.faixas, self.duracao_consulta_minutos, self.intervalo_consulta_minutos)
+
+    def horarios_expandidos(self):
+        if self.tipo == 'bloqueio':
+            return [f"{minutos_para_hhmm(inicio)}-{minutos_para_hhmm(fim)}" for inicio, fim in self.faixas]
+        return [minutos_para_hhmm(minuto) for minuto in self.inicios_em_minutos()]
+
+    class Meta:
+        indexes = [
+            # "Quais exceções do médico cruzam [de, ate]": data_inicio <= ate AND data_fim >= de
+            models.Index(fields=['medico', 'data_inicio', 'data_fim'], name='excecao_medico_periodo_idx'),
+        ]
+
+# ✅ Vagas materializadas (opcional, ver MEDAGENDA_SLOTS_MATERIALIZADOS)
+class Slot(models.Model):
+    ESTADO_CHOICES = [
+        ('livre', 'Livre'),
+        ('ocupado', 'Ocupado'),
+    ]
+
+    medico = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='slots')
+    inicio = models.DateTimeField()
+    fim = models.DateTimeField()
+    local = models.CharField(max_length=255)
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='livre')
+
+    def __str__(self):
+        return f"{self.medico_id} - {self.inicio} ({self.estado})"
+
+    class Meta:
+        constraints = [
+            # Também serve de índice para as buscas por (médico, faixa de início)
+            models.UniqueConstraint(fields=['medico', 'inicio', 'local'], name='slot_medico_inicio_local_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['inicio'], name='slot_livre_inicio_idx', condition=models.Q(estado='livre')),
+        ]
+
+# Último dia até onde estender_slots materializou a tabela de slots (uma linha só)
+class HorizonteSlots(models.Model):
+    ate = models.DateField()
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Slots até {self.ate}"
+
+# ✅ Caixa de saída de emails (gravada na mesma transação da mudança de estado)
+class EmailOutbox(models.Model):
+    ESTADO_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('enviando', 'Enviando'),  # reservado por um worker até proxima_tentativa
+        ('enviado', 'Enviado'),
+        ('falhou', 'Falhou'),  # esgotou as tentativas; fica para análise manual
+    ]
+
+    assunto = models.CharField(max_length=255)
+    mensagem = models.TextField()
+    remetente = models.CharField(max_length=255)
+    destinatarios = models.JSONField(default=list)
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='pendente')
+    tentativas = models.PositiveIntegerField(default=0)
+    proxima_tentativa = models.DateTimeField(default=timezone.now)
+    ultimo_erro = models.TextField(blank=True, default='')
+    criado_em = models.DateTimeField(auto_now_add=True)
+    enviado_em = models.DateTimeField(null=True, blank=True)
+    # Mensagem com código de verificação: apagada depois do envio e a linha
+    # excluída quando o código vence (core.codigos.purgar_codigos_expirados)
+    confidencial = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.assunto} -> {', '.join(self.destinatarios)} ({self.estado})"
+
+    class Meta:
+        verbose_name = 'Email na fila'
+        verbose_name_plural = 'Emails na fila'
+        indexes = [
+            # O worker só lê os pendentes que já podem ser enviados e as reservas vencidas
+            models.Index(
+                fields=['proxima_tentativa'],
+                name='email_pendente_idx',
+                condition=models.Q(estado__in=['pendente', 'enviando']),
+            ),
+            models.Index(fields=['criado_em'], name='email_confidencial_idx', condition=models.Q(confidencial=True)),
+            # Limpeza dos já enviados (purgar_emails)
+            models.Index(fields=['enviado_em'], name='email_enviado_idx', condition=models.Q(estado='enviado')),
+        ]
+
 class AnexoAgendamento(models.Model):
     agendamento = models.ForeignKey(Agendamento, on_delete=models.CASCADE, related_name='anexos')
     arquivo = models.FileField(upload_to='anexos_agendamento/')
@@ -0,0 +1,170 @@
+import base64
+import json
+import uuid
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class PaginacaoSemContagem(BasePagination):
+    """Base das paginações sem COUNT: resposta com next, previous e results."""
+    page_size_query_param = 'page_size'
+    page_size = 20
+    max_page_size = 100
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class AgendamentoCursorPagination(PaginacaoSemContagem):
+    """
+    Paginação por cursor (keyset) ordenada por (data_hora, id).
+
+    Ao contrário do OFFSET, cada página é obtida com um filtro
+    "depois de (data_hora, id)", então o custo não cresce com a
+    profundidade do histórico. Os cursores são opacos para o cliente.
+    """
+    cursor_query_param = 'cursor'
+    ordering = ('data_hora', 'id')
+    invalid_cursor_message = 'Cursor inválido.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        cursor = self.decode_cursor(request)
+        anterior = bool(cursor and cursor['anterior'])
+
+        if cursor:
+            data_hora, pk = cursor['data_hora'], cursor['id']
+            if anterior:
+                queryset = queryset.filter(
+                    Q(data_hora__lt=data_hora) | Q(data_hora=data_hora, id__lt=pk)
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(data_hora__gt=data_hora) | Q(data_hora=data_hora, id__gt=pk)
+                )
+
+        if anterior:
+            queryset = queryset.order_by('-data_hora', '-id')
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        # Busca um registro a mais para saber se existe outra página
+        resultados = list(queryset[:self.page_size + 1])
+        tem_mais = len(resultados) > self.page_size
+        resultados = resultados[:self.page_size]
+
+        if anterior:
+            resultados.reverse()
+            self.tem_proxima = True
+            self.tem_anterior = tem_mais
+        else:
+            self.tem_proxima = tem_mais
+            self.tem_anterior = cursor is not None
+
+        self.page = resultados
+        return resultados
+
+    def get_next_link(self):
+        if not self.tem_proxima or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], anterior=False)
+
+    def get_previous_link(self):
+        if not self.tem_anterior or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], anterior=True)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            data_hora = parse_datetime(payload['d'])
+            if data_hora is None:
+                raise ValueError
+            return {
+                'data_hora': data_hora,
+                'id': uuid.UUID(payload['i']),
+                'anterior': bool(payload.get('a')),
+            }
+        except (TypeError, ValueError, KeyError, AttributeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, agendamento, anterior):
+        payload = {'d': agendamento.data_hora.isoformat(), 'i': str(agendamento.id)}
+        if anterior:
+            payload['a'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+
+class BuscaMedicosPagination(PaginacaoSemContagem):
+    """
+    Paginação por número de página para a busca de médicos.
+
+    A ordem é por relevância, então não dá para usar cursor em colunas;
+    em compensação não há COUNT: busca um registro a mais para saber se
+    existe próxima página.
+    """
+    page_query_param = 'page'
+    max_page_size = 50
+    invalid_page_message = 'Página inválida.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        try:
+            self.numero = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            raise NotFound(self.invalid_page_message)
+        if self.numero < 1:
+            raise NotFound(self.invalid_page_message)
+
+        inicio = (self.numero - 1) * self.page_size
+        resultados = list(queryset[inicio:inicio + self.page_size + 1])
+        self.tem_proxima = len(resultados) > self.page_size
+        return resultados[:self.page_size]
+
+    def get_next_link(self):
+        if not self.tem_proxima:
+            return None
+        return replace_query_param(self.base_url, self.page_query_param, self.numero + 1)
+
+    def get_previous_link(self):
+        if self.numero <= 1:
+            return None
+        return replace_query_param(self.base_url, self.page_query_param, self.numero - 1)
@@ -1,7 +1,9 @@
 from rest_framework import serializers
-from .models import Usuario, Agendamento, HorarioAtendimento, AnexoAgendamento
+from .models import Usuario, Agendamento, HorarioAtendimento, AnexoAgendamento, ExcecaoHorario
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 import re
+from .faixas import inicios_dos_horarios, ler_horario, minutos_para_hhmm, primeira_sobreposicao
+from django.utils import timezone
 
 class UsuarioSerializer(serializers.ModelSerializer):
     foto_url = serializers.SerializerMethodField()
@@ -9,7 +11,7 @@ class UsuarioSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Usuario
-        fields = ['id', 'email', 'tipo', 'cpf', 'data_nascimento', 'sexo', 'endereco', 'cidade', 'estado', 'telefone', 'crm', 'especialidade', 'nome', 'foto', 'foto_url']
+        fields = ['id', 'email', 'tipo', 'cpf', 'data_nascimento', 'sexo', 'endereco', 'cidade', 'estado', 'telefone', 'crm', 'especialidade', 'nome', 'foto', 'foto_url', 'preferencia_notificacao']
 
     def validate_email(self, value):
         """
@@ -77,7 +79,7 @@ class UsuarioUpdateSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Usuario
-        fields = ['id', 'email', 'tipo', 'cpf', 'data_nascimento', 'sexo', 'endereco', 'cidade', 'estado', 'telefone', 'crm', 'especialidade', 'nome', 'foto', 'foto_url']
+        fields = ['id', 'email', 'tipo', 'cpf', 'data_nascimento', 'sexo', 'endereco', 'cidade', 'estado', 'telefone', 'crm', 'especialidade', 'nome', 'foto', 'foto_url', 'preferencia_notificacao']
         read_only_fields = ['email', 'tipo', 'cpf']  # Campos que não podem ser alterados
 
     def get_foto_url(self, obj):
@@ -101,21 +103,29 @@ class AnexoAgendamentoSerializer(serializers.ModelSerializer):
         fields = ['id', 'arquivo', 'nome_arquivo']
 
 class AgendamentoSerializer(serializers.ModelSerializer):
-    paciente = UsuarioSerializer(read_only=True)
-    medico = UsuarioSerializer(read_only=True)
+    paciente = serializers.SerializerMethodField()
+    medico = serializers.SerializerMethodField()
     anexos = AnexoAgendamentoSerializer(many=True, read_only=True)
 
     class Meta:
         model = Agendamento
-        fields = ['id', 'paciente', 'medico', 'data_hora', 'status', 'observacoes', 'anexos']
+        fields = ['id', 'paciente', 'medico', 'data_hora', 'status', 'observacoes', 'anexos', 'updated_at']
 
-    def to_representation(self, instance):
-        data = super().to_representation(instance)
-        # Garante que o contexto seja passado para os serializers aninhados
-        if 'request' in self.context:
-            data['medico'] = UsuarioSerializer(instance.medico, context=self.context).data
-            data['paciente'] = UsuarioSerializer(instance.paciente, context=self.context).data
-        return data
+    def get_paciente(self, obj):
+        return self._serializar_usuario(obj.paciente)
+
+    def get_medico(self, obj):
+        return self._serializar_usuario(obj.medico)
+
+    def _serializar_usuario(self, usuario):
+        """
+        Serializa cada usuário uma única vez por resposta.
+        O cache fica no contexto, que é compartilhado por todos os itens de uma lista.
+        """
+        usuarios = self.context.setdefault('_usuarios_serializados', {})
+        if usuario.pk not in usuarios:
+            usuarios[usuario.pk] = UsuarioSerializer(usuario, context=self.context).data
+        return usuarios[usuario.pk]
 
 class MeuTokenSerializer(TokenObtainPairSerializer):
     @classmethod
@@ -180,11 +190,12 @@ class HorarioAtendimentoSerializer(serializers.ModelSerializer):
             'local',
             'dia_semana',
             'horarios',
+            'faixas',
             'indisponivel',
             'duracao_consulta_minutos',
             'intervalo_consulta_minutos'
         ]
-        read_only_fields = ['medico_id', 'medico_nome', 'medico_email', 'medico_especialidade']
+        read_only_fields = ['medico_id', 'medico_nome', 'medico_email', 'medico_especialidade', 'faixas']
 
     def validate_dia_semana(self, value):
         """Valida se o dia da semana é válido"""
@@ -194,7 +205,7 @@ class HorarioAtendimentoSerializer(serializers.ModelSerializer):
         return value.lower()
 
     def validate_horarios(self, value):
-        """Valida se os horários estão no formato correto"""
+        """Valida se os horários estão no formato correto (HH:MM ou faixa HH:MM-HH:MM)"""
         if not isinstance(value, list):
             raise serializers.ValidationError("Horários deve ser uma lista")
         
@@ -202,14 +213,18 @@ class HorarioAtendimentoSerializer(serializers.ModelSerializer):
             if not isinstance(horario, str):
                 raise serializers.ValidationError("Cada horário deve ser uma string")
             try:
-                hora, minuto = map(int, horario.split(':'))
-                if not (0 <= hora <= 23 and 0 <= minuto <= 59):
-                    raise ValueError
+                ler_horario(horario)
             except ValueError:
-                raise serializers.ValidationError(f"Horário inválido: {horario}. Use o formato HH:MM")
+                raise serializers.ValidationError(f"Horário inválido: {horario}. Use o formato HH:MM ou HH:MM-HH:MM")
         
         return value
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Faixas como "07:00-12:00" são devolvidas já expandidas
+        data['horarios'] = instance.horarios_expandidos()
+        return data
+
     def validate(self, data):
         """Validações adicionais"""
         if data.get('duracao_consulta_minutos', 0) <= 0:
@@ -217,16 +232,81 @@ class HorarioAtendimentoSerializer(serializers.ModelSerializer):
         
         if data.get('intervalo_consulta_minutos', 0) < 0:
             raise serializers.ValidationError("O intervalo entre consultas não pode ser negativo")
+
+        # Consultas que se sobrepõem dentro do mesmo dia
+        instancia = self.instance
+        horarios = data.get('horarios', instancia.horarios if instancia else [])
+        duracao = data.get('duracao_consulta_minutos', instancia.duracao_consulta_minutos if instancia else 30)
+        intervalo = data.get('intervalo_consulta_minutos', instancia.intervalo_consulta_minutos if instancia else 10)
+        sobreposicao = primeira_sobreposicao(inicios_dos_horarios(horarios, duracao, intervalo), duracao)
+        if sobreposicao:
+            anterior, atual = map(minutos_para_hhmm, sobreposicao)
+            raise serializers.ValidationError({
+                'horarios': f"A consulta das {atual} começa antes do fim da consulta das {anterior}."
+            })
         
         return data
 
+class ExcecaoHorarioSerializer(serializers.ModelSerializer):
+    medico_id = serializers.UUIDField(source='medico.id', read_only=True)
+
+    class Meta:
+        model = ExcecaoHorario
+        fields = [
+            'id',
+            'medico_id',
+            'data_inicio',
+            'data_fim',
+            'tipo',
+            'horarios',
+            'local',
+            'duracao_consulta_minutos',
+            'intervalo_consulta_minutos',
+            'motivo',
+        ]
+        read_only_fields = ['medico_id']
+
+    def validate_horarios(self, value):
+        """Mesmo formato dos horários de atendimento (HH:MM ou faixa HH:MM-HH:MM)"""
+        if not isinstance(value, list):
+            raise serializers.ValidationError("Horários deve ser uma lista")
+        for horario in value:
+            try:
+                ler_horario(horario)
+            except ValueError:
+                raise serializers.ValidationError(f"Horário inválido: {horario}. Use o formato HH:MM ou HH:MM-HH:MM")
+        return value
+
+    def validate(self, data):
+        instancia = self.instance
+        data_inicio = data.get('data_inicio', instancia.data_inicio if instancia else None)
+        data_fim = data.get('data_fim', instancia.data_fim if instancia else None)
+        if data_inicio and data_fim and data_fim < data_inicio:
+            raise serializers.ValidationError({'data_fim': "A data final deve ser igual ou posterior à inicial."})
+
+        tipo = data.get('tipo', instancia.tipo if instancia else None)
+        if tipo == 'extra':
+            if not data.get('horarios', instancia.horarios if instancia else []):
+                raise serializers.ValidationError({'horarios': "Informe os horários extras."})
+            if not data.get('local', instancia.local if instancia else ''):
+                raise serializers.ValidationError({'local': "Informe o local dos horários extras."})
+            if data.get('duracao_consulta_minutos', 1) <= 0:
+                raise serializers.ValidationError("A duração da consulta deve ser maior que zero")
+        return data
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['horarios'] = instance.horarios_expandidos()
+        return data
+
 class MedicoSerializer(serializers.ModelSerializer):
     foto_url = serializers.SerializerMethodField()
     horarios_atendimento = serializers.SerializerMethodField()
+    excecoes_horario = serializers.SerializerMethodField()
 
     class Meta:
         model = Usuario
-        fields = ['id', 'email', 'nome', 'crm', 'especialidade', 'foto_url', 'horarios_atendimento']
+        fields = ['id', 'email', 'nome', 'crm', 'especialidade', 'foto_url', 'horarios_atendimento', 'excecoes_horario']
 
     def get_foto_url(self, obj):
         request = self.context.get('request')
@@ -246,6 +326,13 @@ class MedicoSerializer(serializers.ModelSerializer):
         
         # Preenche com os horários existentes
         for horario in obj.horarios_atendimento.all():
-            horarios[horario.dia_semana] = horario.horarios
+            horarios[horario.dia_semana] = horario.horarios_expandidos()
         
         return horarios
+
+    def get_excecoes_horario(self, obj):
+        # Só as exceções que ainda não terminaram; filtra em Python para aproveitar prefetch
+        hoje = timezone.localdate()
+        excecoes = [e for e in obj.excecoes_horario.all() if e.data_fim >= hoje]
+        excecoes.sort(key=lambda e: e.data_inicio)
+        return ExcecaoHorarioSerializer(excecoes, many=True).data
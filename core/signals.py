@@ -0,0 +1,123 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .cache_versoes import invalidar_agendamentos, invalidar_diretorio_medicos, invalidar_usuario
+from .models import (
+    Agendamento, AgendamentoRemovido, AnexoAgendamento, ExcecaoHorario, HorarioAtendimento, Usuario,
+)
+from .slots import (
+    sincronizar_slots_agendamento, sincronizar_slots_horizonte, sincronizar_slots_periodo,
+    slots_materializados_ativos,
+)
+from .tokens import marcar_revogado
+
+
+@receiver(post_save, sender=Agendamento)
+@receiver(post_delete, sender=Agendamento)
+def agendamento_alterado(sender, instance, **kwargs):
+    invalidar_agendamentos(instance.medico_id, instance.paciente_id)
+
+
+@receiver(post_save, sender=AnexoAgendamento)
+@receiver(post_delete, sender=AnexoAgendamento)
+def anexo_alterado(sender, instance, **kwargs):
+    # Os anexos aparecem aninhados no agendamento (AgendamentoSerializer)
+    participantes = (
+        Agendamento.objects.filter(pk=instance.agendamento_id).values_list('medico_id', 'paciente_id').first()
+    )
+    if participantes is not None:
+        # update() não dispara os signals do agendamento: só marca a alteração para a sincronização
+        Agendamento.objects.filter(pk=instance.agendamento_id).update(updated_at=timezone.now())
+        invalidar_agendamentos(*participantes)
+
+
+@receiver(post_delete, sender=Agendamento)
+def registrar_agendamento_removido(sender, instance, **kwargs):
+    # Também roda nas exclusões em cascata (ex.: exclusão do usuário)
+    AgendamentoRemovido.objects.create(
+        agendamento_id=instance.pk,
+        medico_id=instance.medico_id,
+        paciente_id=instance.paciente_id,
+    )
+
+
+@receiver(pre_save, sender=Agendamento)
+def guardar_data_hora_anterior(sender, instance, **kwargs):
+    # Se a data mudar, os slots do horário antigo também precisam ser liberados
+    if slots_materializados_ativos() and not instance._state.adding:
+        instance._data_hora_anterior = (
+            Agendamento.objects.filter(pk=instance.pk).values_list('data_hora', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Agendamento)
+@receiver(post_delete, sender=Agendamento)
+def atualizar_slots_agendamento(sender, instance, **kwargs):
+    if not slots_materializados_ativos():
+        return
+    sincronizar_slots_agendamento(instance.medico_id, instance.data_hora)
+    anterior = getattr(instance, '_data_hora_anterior', None)
+    if anterior is not None and anterior != instance.data_hora:
+        sincronizar_slots_agendamento(instance.medico_id, anterior)
+
+
+@receiver(post_save, sender=HorarioAtendimento)
+@receiver(post_delete, sender=HorarioAtendimento)
+def horario_atendimento_alterado(sender, instance, **kwargs):
+    invalidar_diretorio_medicos()
+    if slots_materializados_ativos():
+        sincronizar_slots_horizonte(instance.medico_id)
+
+
+@receiver(pre_save, sender=ExcecaoHorario)
+def guardar_periodo_anterior(sender, instance, **kwargs):
+    # Se o período mudar, os dias que saíram da exceção também precisam ser recalculados
+    if slots_materializados_ativos() and not instance._state.adding:
+        instance._periodo_anterior = (
+            ExcecaoHorario.objects.filter(pk=instance.pk).values_list('data_inicio', 'data_fim').first()
+        )
+
+
+@receiver(post_save, sender=ExcecaoHorario)
+@receiver(post_delete, sender=ExcecaoHorario)
+def excecao_horario_alterada(sender, instance, **kwargs):
+    invalidar_diretorio_medicos()
+    if not slots_materializados_ativos():
+        return
+    sincronizar_slots_periodo(instance.medico_id, instance.data_inicio, instance.data_fim)
+    anterior = getattr(instance, '_periodo_anterior', None)
+    if anterior is not None and anterior != (instance.data_inicio, instance.data_fim):
+        sincronizar_slots_periodo(instance.medico_id, *anterior)
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def usuario_alterado(sender, instance, created=False, update_fields=None, **kwargs):
+    # Objeto guardado pela autenticação (core.authentication)
+    invalidar_usuario(instance.pk)
+
+    # O refresh do token só grava last_login, que não aparece nas listagens
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+
+    if instance.tipo == 'medico':
+        invalidar_diretorio_medicos()
+
+    # Os dados do usuário aparecem aninhados nos agendamentos de quem se
+    # relaciona com ele, então as versões dessas pessoas também mudam.
+    if created or kwargs['signal'] is post_delete:
+        invalidar_agendamentos(instance.pk)
+        return
+    if instance.tipo == 'medico':
+        relacionados = Agendamento.objects.filter(medico=instance).values_list('paciente_id', flat=True)
+    else:
+        relacionados = Agendamento.objects.filter(paciente=instance).values_list('medico_id', flat=True)
+    invalidar_agendamentos(instance.pk, *relacionados.distinct())
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def token_revogado(sender, instance, created=False, **kwargs):
+    if created:
+        marcar_revogado(instance.token.jti)
@@ -0,0 +1,172 @@
+"""
+Manutenção da tabela materializada de vagas (Slot).
+
+A tabela é opcional (MEDAGENDA_SLOTS_MATERIALIZADOS). Quando ativa, guarda
+uma linha por médico/início/local até o horizonte configurado, e a leitura
+de disponibilidade vira uma única varredura por faixa no índice.
+
+A manutenção é incremental: `sincronizar_slots` recalcula só o período
+afetado com o motor de disponibilidade e grava apenas a diferença
+(inserções, exclusões e mudanças de estado) em relação ao que já existe.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .disponibilidade import (
+    Vaga, agenda_semanal, calcular_disponibilidade, carregar_excecoes, carregar_reservas,
+    excecoes_por_dia, expandir_vagas, marcar_ocupacao, inicio_do_dia, primeiras_vagas,
+)
+from .models import HorarioAtendimento, Slot
+
+
+def slots_materializados_ativos():
+    return getattr(settings, 'MEDAGENDA_SLOTS_MATERIALIZADOS', False)
+
+
+def horizonte_slots():
+    return timezone.localdate() + timedelta(days=getattr(settings, 'MEDAGENDA_SLOTS_HORIZONTE_DIAS', 90))
+
+
+def _datetime(segundos):
+    return datetime.fromtimestamp(segundos, dt_timezone.utc)
+
+
+def sincronizar_slots(medico_id, de, ate):
+    """
+    Deixa os slots do médico entre as datas `de` e `ate` (inclusive) iguais
+    ao calculado a partir dos horários e agendamentos atuais.
+    Retorna (criados, removidos, atualizados).
+    """
+    tz = timezone.get_current_timezone()
+    inicio = inicio_do_dia(de, tz)
+    fim = inicio_do_dia(ate + timedelta(days=1), tz)
+
+    semana = agenda_semanal(HorarioAtendimento.objects.filter(medico_id=medico_id))
+    excecoes = excecoes_por_dia(carregar_excecoes([medico_id], de, ate)[medico_id], de, ate)
+    desejados = {}
+    if any(semana.values()) or excecoes:
+        reservas = carregar_reservas(medico_id, semana, inicio, fim, excecoes)
+        vagas = expandir_vagas(semana, de, ate, excecoes)
+        for (vaga_inicio, vaga_fim, _, local), livre in marcar_ocupacao(vagas, reservas):
+            desejados[(vaga_inicio, local)] = (vaga_fim, 'livre' if livre else 'ocupado')
+
+    with transaction.atomic():
+        existentes = Slot.objects.filter(
+            medico_id=medico_id, inicio__gte=inicio, inicio__lt=fim,
+        ).values_list('id', 'inicio', 'local', 'fim', 'estado')
+
+        remover = []
+        mudar_estado = {'livre': [], 'ocupado': []}
+        for pk, slot_inicio, local, slot_fim, estado in existentes:
+            chave = (int(slot_inicio.timestamp()), local)
+            desejado = desejados.pop(chave, None)
+            if desejado is None or desejado[0] != int(slot_fim.timestamp()):
+                remover.append(pk)
+                if desejado is not None:
+                    desejados[chave] = desejado
+            elif desejado[1] != estado:
+                mudar_estado[desejado[1]].append(pk)
+
+        if remover:
+            Slot.objects.filter(id__in=remover).delete()
+        for estado, ids in mudar_estado.items():
+            if ids:
+                Slot.objects.filter(id__in=ids).update(estado=estado)
+        if desejados:
+            Slot.objects.bulk_create([
+                Slot(medico_id=medico_id, inicio=_datetime(vaga_inicio), fim=_datetime(vaga_fim), local=local, estado=estado)
+                for (vaga_inicio, local), (vaga_fim, estado) in desejados.items()
+            ], batch_size=1000)
+
+    return len(desejados), len(remover), sum(len(ids) for ids in mudar_estado.values())
+
+
+def sincronizar_slots_horizonte(medico_id):
+    """Recalcula todo o horizonte (usado quando os horários do médico mudam)."""
+    return sincronizar_slots(medico_id, timezone.localdate(), horizonte_slots())
+
+
+def sincronizar_slots_periodo(medico_id, de, ate):
+    """Recalcula as datas [de, ate] que estão dentro do horizonte (exceções por data)."""
+    de = max(de, timezone.localdate())
+    ate = min(ate, horizonte_slots())
+    if de > ate:
+        return None
+    return sincronizar_slots(medico_id, de, ate)
+
+
+def sincronizar_slots_agendamento(medico_id, data_hora):
+    """Recalcula só os dias vizinhos a um agendamento criado, alterado ou removido."""
+    # Agendamentos criados com data_hora em texto ainda não foram convertidos
+    if isinstance(data_hora, str):
+        data_hora = parse_datetime(data_hora)
+    if data_hora is None:
+        return None
+    if timezone.is_naive(data_hora):
+        data_hora = timezone.make_aware(data_hora)
+    # Fora do horizonte não há slots: materializar esses dias deixaria buracos
+    # entre o horizonte e o agendamento que o estender_slots não preencheria
+    de = timezone.localdate(data_hora - timedelta(hours=12))
+    ate = timezone.localdate(data_hora + timedelta(hours=12))
+    return sincronizar_slots_periodo(medico_id, de, ate)
+
+
+def vagas_livres(medico_id, de, ate):
+    """
+    Vagas livres do médico entre `de` e `ate`. Lê da tabela de slots quando
+    ela está ativa e cobre o período; senão calcula na hora.
+    """
+    if not slots_materializados_ativos() or ate > horizonte_slots():
+        return calcular_disponibilidade(medico_id, de, ate)
+
+    tz = timezone.get_current_timezone()
+    inicio = max(inicio_do_dia(de, tz), timezone.now())
+    fim = inicio_do_dia(ate + timedelta(days=1), tz)
+    slots = (
+        Slot.objects.filter(medico_id=medico_id, estado='livre', inicio__gte=inicio, inicio__lt=fim)
+        .order_by('inicio', 'local')
+        .values_list('inicio', 'fim', 'local')
+    )
+    return [
+        Vaga(timezone.localtime(slot_inicio, tz), timezone.localtime(slot_fim, tz), local, None)
+        for slot_inicio, slot_fim, local in slots
+    ]
+
+
+def primeiras_vagas_livres(medicos, k, de, ate, local=None):
+    """
+    As `k` primeiras vagas livres entre os `medicos` (queryset), como lista
+    de (medico_id, Vaga). Com a tabela de slots ativa é uma única consulta
+    ordenada pelo índice de slots livres; senão usa o merge por heap.
+    """
+    if not slots_materializados_ativos() or ate > horizonte_slots():
+        horarios = HorarioAtendimento.objects.filter(medico__in=medicos, indisponivel=False)
+        if local:
+            horarios = horarios.filter(local__icontains=local)
+        excecoes = carregar_excecoes(medicos.values('id'), de, ate)
+        if local:
+            # Extras de outros locais não interessam; bloqueios continuam valendo
+            for medico_id, lista in excecoes.items():
+                excecoes[medico_id] = [
+                    e for e in lista if e.tipo == 'bloqueio' or local.lower() in e.local.lower()
+                ]
+        return primeiras_vagas(horarios, k, de, ate, excecoes=excecoes)
+
+    tz = timezone.get_current_timezone()
+    slots = Slot.objects.filter(
+        medico__in=medicos,
+        estado='livre',
+        inicio__gte=max(inicio_do_dia(de, tz), timezone.now()),
+        inicio__lt=inicio_do_dia(ate + timedelta(days=1), tz),
+    )
+    if local:
+        slots = slots.filter(local__icontains=local)
+    slots = slots.order_by('inicio', 'medico_id').values_list('medico_id', 'inicio', 'fim', 'local')[:k]
+    return [
+        (medico_id, Vaga(timezone.localtime(inicio, tz), timezone.localtime(fim, tz), local, None))
+        for medico_id, inicio, fim, local in slots
+    ]
@@ -1,15 +1,43 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.conf import settings
+from django.core import mail, signing
+from django.core.cache import cache
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from datetime import timedelta
-from rest_framework.test import APIClient
+from datetime import date, datetime, time, timedelta
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
 from rest_framework import status
-from .models import CodigoVerificacao, Agendamento, HorarioAtendimento
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from .models import CodigoVerificacao, Agendamento, AgendamentoRemovido, HorarioAtendimento, AnexoAgendamento, Slot, ExcecaoHorario, EmailOutbox, HorizonteSlots, LembreteEnviado, ResumoEnviado
+from .views import AgendamentoViewSet
+from .views_agendamento import SincronizarAgendamentosView
+from .agendamentos import ConflitoDeHorario, reservar_horario
+from .authentication import usuario_em_cache
+from .checks import checar_cache_compartilhado
+from .disponibilidade import calcular_disponibilidade
+from .slots import horizonte_slots, vagas_livres
+from .emails import enfileirar_email
+from .codigos import MAX_TENTATIVAS, VALIDO, criar_codigo, verificar_codigo
+from .throttling import BaldeDeFichasThrottle
+from .tokens import FiltroBloom, RefreshTokenComFiltro, descartar_filtro, filtro_revogados, intervalo_filtro, renovar_tokens
 import json
+import re
+import sys
+import threading
+import time as relogio
+from io import StringIO
+from unittest import mock
 
 class TestesBasicos(TestCase):
     def setUp(self):
         """Configuração inicial para todos os testes"""
+        cache.clear()
         self.client = APIClient()
         self.Usuario = get_user_model()
         
@@ -91,6 +119,367 @@ class TestesAutenticacao(TestesBasicos):
         self.assertIn('access', response.data)
         self.assertIn('refresh', response.data)
 
+class TestesAutenticacaoSemBanco(TestesBasicos):
+    """O usuário autenticado vem do token ou do cache, não do banco"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        response = self.client.post('/api/token/', {'email': self.usuario.email, 'password': 'senha123'})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+    def test_usuario_em_cache_invalidado_no_save(self):
+        response = self.client.get('/minha-conta/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            response = self.client.get('/minha-conta/')
+        self.assertEqual(response.data['nome'], 'Usuário Teste')
+
+        self.usuario.nome = 'Nome Novo'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario.save()
+        with self.assertNumQueries(1):
+            response = self.client.get('/minha-conta/')
+        self.assertEqual(response.data['nome'], 'Nome Novo')
+
+        self.usuario.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario.save()
+        self.assertEqual(self.client.get('/minha-conta/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_hash_da_senha_fora_do_cache(self):
+        self.client.get('/minha-conta/')
+        usuario = usuario_em_cache(self.usuario.pk)
+        self.assertNotIn('password', usuario.__dict__)
+        # Quem precisa da senha a busca no banco
+        with self.assertNumQueries(1):
+            self.assertTrue(usuario.check_password('senha123'))
+
+    def test_usuario_dos_claims(self):
+        Agendamento.objects.create(
+            paciente=self.usuario, medico=self.medico,
+            data_hora=timezone.now() + timedelta(days=1), status='solicitado',
+        )
+        response = self.client.get('/meus-agendamentos/')
+        self.assertEqual(len(response.data['results']), 1)
+        # Nem o usuário nem os agendamentos: If-None-Match com a ETag atual vira 304 sem banco
+        with self.assertNumQueries(0):
+            response = self.client.get('/meus-agendamentos/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_status_da_sessao_sem_banco(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/usuarios/verificar-sessao/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'valido')
+        self.assertEqual(response.data['usuario']['email'], self.usuario.email)
+        self.assertGreater(response.data['tempo_restante'], 300)
+
+        self.client.credentials()
+        response = self.client.get('/usuarios/verificar-sessao/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.get('/usuarios/verificar-sessao/', HTTP_AUTHORIZATION='Bearer invalido')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.data['status'], 'invalido')
+
+class TestesBlacklistTokens(TestesBasicos):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        descartar_filtro()
+        response = self.client.post('/api/token/', {'email': self.usuario.email, 'password': 'senha123'})
+        self.refresh = response.data['refresh']
+
+    def test_filtro_bloom(self):
+        filtro = FiltroBloom(1000)
+        for i in range(1000):
+            filtro.adicionar(f'jti-{i}')
+        self.assertTrue(all(f'jti-{i}' in filtro for i in range(1000)))
+        falsos_positivos = sum(f'outro-{i}' in filtro for i in range(10000))
+        self.assertLess(falsos_positivos, 300)
+
+    @mock.patch('core.tokens.cache_compartilhado', return_value=True)
+    def test_refresh_rotacionado_recusado(self, _):
+        response = self.client.post('/api/token/refresh/', {'refresh': self.refresh})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        novo = response.data['refresh']
+
+        # O filtro já estava montado: o token antigo é achado pela marca no cache
+        response = self.client.post('/api/token/refresh/', {'refresh': self.refresh})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # Token fora da blacklist: nenhuma consulta para checá-la
+        descartar_filtro()
+        filtro_revogados()
+        cache.clear()
+        with self.assertNumQueries(0):
+            RefreshTokenComFiltro(novo)
+        with self.assertRaises(TokenError):
+            RefreshTokenComFiltro(self.refresh)
+
+    @mock.patch('core.tokens.cache_compartilhado', return_value=True)
+    def test_filtro_vencido_remontado_fora_da_requisicao(self, _):
+        filtro_revogados()
+        agora = relogio.monotonic()
+        with mock.patch('core.tokens._remontar') as remontar:
+            # Passou do intervalo: remonta numa thread e segue com o filtro atual, sem consulta
+            with mock.patch('core.tokens.time.monotonic', return_value=agora + intervalo_filtro() + 1):
+                with self.assertNumQueries(0):
+                    RefreshTokenComFiltro(self.refresh)
+            remontar.assert_called_once()
+            # Remontagem atrasada demais: as marcas do cache já não cobrem, vai ao banco
+            with mock.patch('core.tokens.time.monotonic', return_value=agora + 2 * intervalo_filtro() + 1):
+                with self.assertNumQueries(1):
+                    RefreshTokenComFiltro(self.refresh)
+        descartar_filtro()
+
+    def test_sem_cache_compartilhado_checa_no_banco(self):
+        # Cache local a cada processo (o dos testes): a revogação feita por outro worker não teria marca aqui
+        filtro_revogados()
+        with self.assertNumQueries(1):
+            RefreshTokenComFiltro(self.refresh)
+
+    def test_purgar_tokens_expirados(self):
+        self.client.post('/api/token/refresh/', {'refresh': self.refresh})
+        self.assertEqual(OutstandingToken.objects.count(), 2)
+        OutstandingToken.objects.filter(jti=RefreshToken(self.refresh, verify=False)['jti']).update(
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
+        call_command('purgar_tokens', lote=1, stdout=StringIO())
+        self.assertEqual(OutstandingToken.objects.count(), 1)
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+class TestesRenovacaoCookie(TestesBasicos):
+    """ActivityMiddleware renova o cookie de acesso perto de vencer"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        descartar_filtro()
+        response = self.client.post('/api/token/', {'email': self.usuario.email, 'password': 'senha123'})
+        self.refresh = response.data['refresh']
+        self.access = response.data['access']
+
+    def access_vencendo_em(self, segundos):
+        token = AccessToken(self.access)
+        token.set_exp(lifetime=timedelta(seconds=segundos))
+        return str(token)
+
+    def usar_cookies(self, access, refresh=None):
+        self.client.cookies.clear()
+        self.client.cookies['access_token'] = access
+        if refresh:
+            self.client.cookies['refresh_token'] = refresh
+
+    def test_cookie_valido_nao_renova(self):
+        self.usar_cookies(self.access, self.refresh)
+        response = self.client.get('/minha-conta/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('access_token', response.cookies)
+
+    def test_renova_uma_vez_por_janela(self):
+        vencendo = self.access_vencendo_em(60)
+        self.usar_cookies(vencendo, self.refresh)
+        response = self.client.get('/minha-conta/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        novo_access = response.cookies['access_token'].value
+        novo_refresh = response.cookies['refresh_token'].value
+        self.assertNotEqual(novo_access, vencendo)
+        self.assertNotEqual(novo_refresh, self.refresh)
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+
+        # Outra aba com os cookies antigos recebe o mesmo par, sem rotacionar de novo
+        self.usar_cookies(vencendo, self.refresh)
+        response = self.client.get('/minha-conta/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.cookies['access_token'].value, novo_access)
+        self.assertEqual(response.cookies['refresh_token'].value, novo_refresh)
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+
+    @override_settings(MEDAGENDA_RENOVACAO_GRACA_SEGUNDOS=0)
+    def test_refresh_antigo_nao_rende_par_depois_da_graca(self):
+        self.assertIsNotNone(renovar_tokens(self.refresh, janela=300))
+        self.assertIsNone(renovar_tokens(self.refresh, janela=300))
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+
+    def test_cookie_vencido(self):
+        vencido = self.access_vencendo_em(-1)
+        self.usar_cookies(vencido)
+        self.assertEqual(self.client.get('/minha-conta/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.usar_cookies(vencido, self.refresh)
+        response = self.client.get('/minha-conta/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('access_token', response.cookies)
+        self.assertIn('csrftoken', response.cookies)
+
+    def test_cookie_exige_csrf_para_alterar(self):
+        client = APIClient(enforce_csrf_checks=True)
+        client.cookies['access_token'] = self.access
+        self.assertEqual(client.get('/minha-conta/').status_code, status.HTTP_200_OK)
+        response = client.patch('/minha-conta/', {'nome': 'Outro Nome'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.usuario.refresh_from_db()
+        self.assertEqual(self.usuario.nome, 'Usuário Teste')
+
+    def test_login_com_cookie_e_csrf(self):
+        client = APIClient(enforce_csrf_checks=True)
+        response = client.post('/api/token/cookie/', {'email': self.usuario.email, 'password': 'senha123'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('access_token', response.cookies)
+        csrf = response.cookies['csrftoken'].value
+
+        response = client.patch('/minha-conta/', {'nome': 'Outro Nome'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = client.patch('/minha-conta/', {'nome': 'Outro Nome'}, format='json', HTTP_X_CSRFTOKEN=csrf)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.usuario.refresh_from_db()
+        self.assertEqual(self.usuario.nome, 'Outro Nome')
+
+class TestesInstrumentacao(TestesBasicos):
+    """ActivityMiddleware mede tempo, banco, cache e bytes de cada requisição"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        response = self.client.post('/api/token/', {'email': self.usuario.email, 'password': 'senha123'})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+    def test_server_timing_e_log(self):
+        with self.assertLogs('core.instrumentacao', 'INFO') as logs:
+            response = self.client.get('/minha-conta/')
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="1 consultas", cache;')
+        linha = logs.output[0]
+        self.assertIn('rota=minha-conta/ status=200', linha)
+        self.assertIn(f'bytes={len(response.content)}', linha)
+
+        # Segunda vez: versão e usuário já estão no cache
+        with self.assertLogs('core.instrumentacao', 'INFO') as logs:
+            self.client.get('/minha-conta/')
+        self.assertIn('cache_acertos=2 cache_faltas=0', logs.output[0])
+
+    @override_settings(MEDAGENDA_REQUISICAO_LENTA_MS=0)
+    def test_requisicao_lenta_mostra_sql(self):
+        with self.assertLogs('core.instrumentacao', 'WARNING') as logs:
+            self.client.get('/minha-conta/')
+        self.assertIn('requisicao_lenta', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    def test_streaming_medido_ate_o_fim_do_corpo(self):
+        Agendamento.objects.create(
+            paciente=self.usuario, medico=self.medico,
+            data_hora=timezone.now() + timedelta(days=1), status='agendado',
+        )
+        with self.assertLogs('core.instrumentacao', 'INFO') as logs:
+            response = self.client.get('/meus-agendamentos/export/?formato=ndjson')
+            self.assertIn('Server-Timing', response)
+            self.assertEqual(logs.output, [])
+            corpo = b''.join(response.streaming_content)
+        self.assertEqual(len(logs.output), 1)
+        # A consulta da exportação roda durante o envio do corpo
+        self.assertIn('consultas=1 ', logs.output[0])
+        self.assertIn(f'bytes={len(corpo)}', logs.output[0])
+
+class TestesCodigoVerificacao(TestesBasicos):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def pedir_codigo(self):
+        response = self.client.post('/enviar-codigo/', {'email': self.usuario.email, 'tipo': 'recuperacao'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # O código só existe em texto no email da fila
+        return re.search(r'é: (\d{6})', EmailOutbox.objects.latest('id').mensagem).group(1)
+
+    def test_codigo_guardado_so_como_hash(self):
+        codigo = self.pedir_codigo()
+        registro = CodigoVerificacao.objects.get(email=self.usuario.email)
+        self.assertNotEqual(registro.codigo, codigo)
+        with self.assertNumQueries(0):
+            response = self.client.post('/verificar-codigo/', {'email': self.usuario.email, 'codigo': codigo})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Depois do envio o código some também da fila
+        call_command('enviar_emails', stdout=StringIO())
+        self.assertIn(codigo, mail.outbox[0].body)
+        self.assertNotIn(codigo, EmailOutbox.objects.get().mensagem)
+
+    def test_resetar_senha_consome_codigo(self):
+        codigo = self.pedir_codigo()
+        # Sem o cache, a cópia do banco ainda vale
+        cache.clear()
+        dados = {'email': self.usuario.email, 'codigo': codigo, 'nova_senha': 'novasenha123'}
+        response = self.client.post('/recuperar-senha/', dados)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.usuario.refresh_from_db()
+        self.assertTrue(self.usuario.check_password('novasenha123'))
+
+        response = self.client.post('/recuperar-senha/', dados)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(CodigoVerificacao.objects.exists())
+
+    def test_tentativas_esgotadas(self):
+        codigo = self.pedir_codigo()
+        for _ in range(MAX_TENTATIVAS):
+            response = self.client.post('/verificar-codigo/', {'email': self.usuario.email, 'codigo': '000000x'})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post('/verificar-codigo/', {'email': self.usuario.email, 'codigo': codigo})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_email_com_maiusculas(self):
+        codigo = criar_codigo(' Fulano@Exemplo.com')
+        criar_codigo('fulano@exemplo.com')  # substitui o anterior
+        self.assertEqual(CodigoVerificacao.objects.get().email, 'fulano@exemplo.com')
+
+        codigo = criar_codigo('FULANO@exemplo.com')
+        cache.clear()  # força a cópia do banco
+        self.assertEqual(verificar_codigo('Fulano@Exemplo.COM', codigo, consumir=True), VALIDO)
+        self.assertFalse(CodigoVerificacao.objects.exists())
+
+    def test_codigo_expirado_e_purga(self):
+        codigo = self.pedir_codigo()
+        CodigoVerificacao.objects.update(criado_em=timezone.now() - timedelta(minutes=31))
+        cache.clear()  # o TTL do cache já teria expirado
+        response = self.client.post('/verificar-codigo/', {'email': self.usuario.email, 'codigo': codigo})
+        self.assertEqual(response.data['erro'], 'Código expirado.')
+
+        EmailOutbox.objects.update(criado_em=timezone.now() - timedelta(minutes=31))
+        call_command('purgar_codigos', stdout=StringIO())
+        self.assertFalse(CodigoVerificacao.objects.exists())
+        self.assertFalse(EmailOutbox.objects.exists())
+
+    def test_limite_enviar_codigo_por_email(self):
+        for _ in range(3):
+            self.pedir_codigo()
+        # Recusado antes da view: sem consulta ao banco e sem email na fila
+        with self.assertNumQueries(0):
+            response = self.client.post('/enviar-codigo/', {'email': self.usuario.email, 'tipo': 'recuperacao'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(EmailOutbox.objects.count(), 3)
+
+    def test_limite_validar_email_por_ip_reabastece(self):
+        agora = [1000.0]
+        with mock.patch.object(BaldeDeFichasThrottle, 'timer', lambda self: agora[0]):
+            for i in range(30):
+                response = self.client.post('/validar-email/', {'email': f'novo{i}@exemplo.com'})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+            response = self.client.post('/validar-email/', {'email': 'outro@exemplo.com'})
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            # Um X-Forwarded-For inventado não troca de balde
+            response = self.client.post('/validar-email/', {'email': 'outro@exemplo.com'}, HTTP_X_FORWARDED_FOR='203.0.113.7')
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+            # 30/min: uma ficha nova a cada 2 segundos
+            agora[0] += 2
+            response = self.client.post('/validar-email/', {'email': 'outro@exemplo.com'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(DEBUG=False)
+    def test_avisa_cache_por_processo(self):
+        avisos = checar_cache_compartilhado(None)
+        self.assertEqual([aviso.id for aviso in avisos], ['core.W001'])
+
 class TestesHorarioAtendimento(TestesBasicos):
     def setUp(self):
         super().setUp()
@@ -144,6 +533,92 @@ class TestesHorarioAtendimento(TestesBasicos):
         print(f"Response data: {response.data}")
         
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+    def test_criar_horario_por_faixa(self):
+        """Faixas são guardadas compactas e devolvidas expandidas"""
+        dados = {
+            'dia_semana': 'terca',
+            'horarios': ['08:00-10:00', '14:00'],
+            'local': 'Consultório 1',
+            'duracao_consulta_minutos': 30,
+            'intervalo_consulta_minutos': 10,
+        }
+        response = self.client.post('/horarios-atendimento/', dados, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['horarios'], ['08:00', '08:40', '09:20', '14:00'])
+
+        horario = HorarioAtendimento.objects.get()
+        self.assertEqual(horario.faixas, [[480, 590], [840, 870]])
+
+        # Consultas de 30 min às 09:00 e 09:10 se sobrepõem
+        dados['horarios'] = ['09:00', '09:10']
+        response = self.client.post('/horarios-atendimento/', dados, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_gravar_semana(self):
+        """A semana inteira é aplicada de uma vez e a resposta traz a diferença"""
+        existente = HorarioAtendimento.objects.create(
+            medico=self.medico, dia_semana='segunda', horarios=['09:00'], local='Consultório 1'
+        )
+        sobra = HorarioAtendimento.objects.create(
+            medico=self.medico, dia_semana='sexta', horarios=['09:00'], local='Consultório 1'
+        )
+        padrao = {'local': 'Consultório 1', 'duracao_consulta_minutos': 30, 'intervalo_consulta_minutos': 10}
+        dias = [
+            {**padrao, 'dia_semana': 'segunda', 'horarios': ['08:00-12:00']},
+            {**padrao, 'dia_semana': 'terca', 'horarios': ['08:00-12:00']},
+            {**padrao, 'dia_semana': 'quarta', 'horarios': ['08:00-12:00'], 'local': 'Hospital'},
+        ]
+        response = self.client.put('/horarios-atendimento/semana/', {'dias': dias, 'remover_ausentes': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['criados']), 2)
+        self.assertEqual([h['id'] for h in response.data['atualizados']], [existente.id])
+        self.assertEqual(response.data['removidos'], [sobra.id])
+        existente.refresh_from_db()
+        self.assertEqual(existente.faixas, [[480, 710]])
+
+        # Reenviar a mesma semana não muda nada
+        response = self.client.put('/horarios-atendimento/semana/', {'dias': dias}, format='json')
+        self.assertEqual(response.data['inalterados'], 3)
+        self.assertEqual(response.data['criados'] + response.data['atualizados'], [])
+
+        dias.append({**padrao, 'dia_semana': 'terca', 'horarios': ['14:00']})
+        response = self.client.put('/horarios-atendimento/semana/', {'dias': dias}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(HorarioAtendimento.objects.filter(medico=self.medico).count(), 3)
+
+    def test_criar_excecao_horario(self):
+        dados = {'data_inicio': '2030-12-24', 'data_fim': '2030-12-25', 'tipo': 'bloqueio', 'motivo': 'Natal'}
+        response = self.client.post('/excecoes-horario/', dados, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.get('/excecoes-horario/', {'de': '2030-12-25', 'ate': '2030-12-31'})
+        self.assertEqual(len(response.data), 1)
+
+        response = self.client.post('/excecoes-horario/', {**dados, 'data_fim': '2030-12-01'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(user=self.usuario)
+        response = self.client.post('/excecoes-horario/', dados, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_excecao_de_outro_medico(self):
+        excecao = ExcecaoHorario.objects.create(
+            medico=self.medico, data_inicio=date(2030, 12, 24), data_fim=date(2030, 12, 25), tipo='bloqueio'
+        )
+        horario = HorarioAtendimento.objects.create(medico=self.medico, dia_semana='segunda', horarios=['09:00'], local='Consultório 1')
+        self.client.force_authenticate(user=self.usuario)
+        url = f'/excecoes-horario/{excecao.id}/?medico_id={self.medico.id}'
+        response = self.client.patch(url, {'motivo': 'Outro'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.delete(f'/horarios-atendimento/{horario.id}/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self.client.get('/excecoes-horario/', {'medico_id': self.medico.id, 'de': '2030-13-01'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/excecoes-horario/', {'medico_id': 'nao-e-uuid'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 class TestesAgendamento(TestesBasicos):
     def setUp(self):
@@ -217,6 +692,22 @@ class TestesAgendamento(TestesBasicos):
         agendamento.refresh_from_db()
         self.assertEqual(agendamento.status, 'agendado')
 
+    def test_reativar_agendamento_com_horario_ocupado(self):
+        """Reativar um cancelado não pode sobrepor quem ocupou o horário"""
+        data_hora = timezone.now() + timedelta(days=1)
+        cancelado = Agendamento.objects.create(paciente=self.usuario, medico=self.medico, data_hora=data_hora, status='cancelado')
+        outro_paciente = self.Usuario.objects.create_user(
+            email='outro@exemplo.com', password='senha123', nome='Outro', tipo='comum', cpf='11111111111'
+        )
+        Agendamento.objects.create(paciente=outro_paciente, medico=self.medico, data_hora=data_hora, status='agendado')
+
+        self.client.force_authenticate(user=self.medico)
+        response = self.client.patch(f'/agendamentos/{cancelado.id}/status/', {'status': 'agendado'})
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        cancelado.refresh_from_db()
+        self.assertEqual(cancelado.status, 'cancelado')
+        self.assertFalse(EmailOutbox.objects.exists())
+
     def test_listar_agendamentos(self):
         """Testa a listagem de agendamentos"""
         # Cria alguns agendamentos
@@ -238,7 +729,143 @@ class TestesAgendamento(TestesBasicos):
         response = self.client.get('/meus-agendamentos/')
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_listar_agendamentos_paginacao_cursor(self):
+        """Testa a paginação por cursor da listagem de agendamentos"""
+        base = timezone.now() + timedelta(days=1)
+        for i in range(5):
+            Agendamento.objects.create(
+                paciente=self.usuario,
+                medico=self.medico,
+                data_hora=base + timedelta(hours=i),
+                status='agendado'
+            )
+
+        response = self.client.get('/meus-agendamentos/', {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNone(response.data['previous'])
+        self.assertIsNotNone(response.data['next'])
+
+        # Percorre todas as páginas seguindo o cursor "next"
+        vistos = [a['id'] for a in response.data['results']]
+        proxima = response.data['next']
+        while proxima:
+            response = self.client.get(proxima)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            vistos += [a['id'] for a in response.data['results']]
+            proxima = response.data['next']
+
+        esperados = [str(pk) for pk in Agendamento.objects.order_by('data_hora', 'id').values_list('id', flat=True)]
+        self.assertEqual(vistos, esperados)
+
+        # O cursor "previous" da última página volta para a anterior
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([a['id'] for a in response.data['results']], esperados[2:4])
+
+    def test_exportar_agendamentos(self):
+        """Testa a exportação em streaming (NDJSON e CSV)"""
+        agendamento = Agendamento.objects.create(
+            paciente=self.usuario,
+            medico=self.medico,
+            data_hora=timezone.now() + timedelta(days=1),
+            status='agendado'
+        )
+        AnexoAgendamento.objects.create(agendamento=agendamento, arquivo='anexos_agendamento/teste.pdf', nome_arquivo='teste.pdf')
+
+        response = self.client.get('/meus-agendamentos/export/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        linhas = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(linhas), 1)
+        registro = json.loads(linhas[0])
+        self.assertEqual(registro['id'], str(agendamento.id))
+        self.assertEqual(registro['medico_email'], self.medico.email)
+        self.assertEqual(registro['total_anexos'], 1)
+
+        response = self.client.get('/meus-agendamentos/export/', {'formato': 'csv'})
+        linhas = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(linhas[0].split(',')[0], 'id')
+        self.assertEqual(len(linhas), 2)
+
+    def test_sincronizar_agendamentos(self):
+        """Testa a sincronização incremental com tombstones"""
+        antigo, alterado, removido = [
+            Agendamento.objects.create(
+                paciente=self.usuario,
+                medico=self.medico,
+                data_hora=timezone.now() + timedelta(days=i + 1),
+                status='solicitado'
+            )
+            for i in range(3)
+        ]
+
+        response = self.client.get('/meus-agendamentos/sync/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['alterados']), 3)
+        token = response.data['token']
+
+        # Simula que as linhas já existiam bem antes do último sync
+        Agendamento.objects.update(updated_at=timezone.now() - timedelta(days=1))
+        alterado.status = 'agendado'
+        alterado.save()
+        removido_id = str(removido.id)
+        removido.delete()
+
+        response = self.client.get('/meus-agendamentos/sync/', {'since': token})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([a['id'] for a in response.data['alterados']], [str(alterado.id)])
+        self.assertEqual(response.data['removidos'], [removido_id])
+
+        response = self.client.get('/meus-agendamentos/sync/', {'since': 'adulterado'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sincronizar_em_paginas(self):
+        criados = [
+            Agendamento.objects.create(
+                paciente=self.usuario, medico=self.medico,
+                data_hora=timezone.now() + timedelta(days=i + 1), status='solicitado'
+            )
+            for i in range(5)
+        ]
+        recebidos, token, paginas = [], None, 0
+        with mock.patch.object(SincronizarAgendamentosView, 'limite', 2):
+            while True:
+                response = self.client.get('/meus-agendamentos/sync/', {'since': token} if token else {})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                recebidos += [a['id'] for a in response.data['alterados']]
+                token = response.data['token']
+                paginas += 1
+                if not response.data['mais']:
+                    break
+        self.assertEqual(paginas, 3)
+        self.assertEqual(sorted(recebidos), sorted(str(a.id) for a in criados))
+
+        # Um anexo novo marca o agendamento como alterado
+        Agendamento.objects.update(updated_at=timezone.now() - timedelta(days=1))
+        AnexoAgendamento.objects.create(agendamento=criados[2], arquivo='anexos_agendamento/a.pdf', nome_arquivo='a.pdf')
+        response = self.client.get('/meus-agendamentos/sync/', {'since': token})
+        self.assertEqual([a['id'] for a in response.data['alterados']], [str(criados[2].id)])
+
+    def test_sincronizar_token_alem_da_retencao(self):
+        Agendamento.objects.create(
+            paciente=self.usuario, medico=self.medico,
+            data_hora=timezone.now() + timedelta(days=1), status='solicitado'
+        ).delete()
+        antigo = timezone.now() - timedelta(days=settings.MEDAGENDA_SINCRONIZACAO_RETENCAO_DIAS + 1)
+        AgendamentoRemovido.objects.update(removido_em=antigo)
+        token = signing.dumps(antigo.isoformat(), salt=SincronizarAgendamentosView.salt)
+        response = self.client.get('/meus-agendamentos/sync/', {'since': token})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+
+        call_command('purgar_removidos', stdout=StringIO())
+        self.assertFalse(AgendamentoRemovido.objects.exists())
+
+    def test_listar_agendamentos_cursor_invalido(self):
+        """Testa que um cursor adulterado é rejeitado"""
+        response = self.client.get('/meus-agendamentos/', {'cursor': 'nao-e-um-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
     def test_cancelar_agendamento(self):
         """Testa o cancelamento de um agendamento"""
@@ -293,3 +920,611 @@ class TestesAgendamento(TestesBasicos):
         # Verifica se o status não foi alterado
         agendamento.refresh_from_db()
         self.assertEqual(agendamento.status, 'agendado')
+
+
+class TestesConsultasAgendamento(TestesBasicos):
+    """Garante que as listagens não fazem consultas por agendamento"""
+
+    def criar_agendamentos(self, quantidade):
+        outro_paciente = self.Usuario.objects.create_user(
+            email=f'paciente{quantidade}@exemplo.com',
+            password='senha123',
+            nome='Outro Paciente',
+            tipo='comum',
+            cpf=f'{quantidade:011d}'
+        )
+        base = timezone.now() + timedelta(days=1)
+        for i in range(quantidade):
+            agendamento = Agendamento.objects.create(
+                paciente=self.usuario if i % 2 else outro_paciente,
+                medico=self.medico,
+                data_hora=base + timedelta(hours=i),
+                status='agendado'
+            )
+            AnexoAgendamento.objects.create(
+                agendamento=agendamento,
+                arquivo='anexos_agendamento/teste.pdf',
+                nome_arquivo='teste.pdf'
+            )
+
+    def test_meus_agendamentos_numero_fixo_de_consultas(self):
+        """Listagem: uma consulta para a página e uma para os anexos"""
+        self.client.force_authenticate(user=self.medico)
+        for quantidade in (3, 10):
+            self.criar_agendamentos(quantidade)
+            with self.assertNumQueries(2):
+                response = self.client.get('/meus-agendamentos/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['results'][0]['anexos'][0]['nome_arquivo'], 'teste.pdf')
+
+    def test_agendamento_viewset_list_numero_fixo_de_consultas(self):
+        """AgendamentoViewSet.list: mesmo orçamento de consultas"""
+        view = AgendamentoViewSet.as_view({'get': 'list'})
+        factory = APIRequestFactory()
+        for quantidade in (3, 10):
+            self.criar_agendamentos(quantidade)
+            request = factory.get('/agendamentos/')
+            force_authenticate(request, user=self.medico)
+            with self.assertNumQueries(2):
+                response = view(request)
+                response.render()
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data[0]['medico']['email'], self.medico.email)
+
+
+class TestesETag(TestesBasicos):
+    """GET condicional (ETag / 304) nas listagens"""
+
+    def test_meus_agendamentos_304_sem_consultas(self):
+        self.client.force_authenticate(user=self.usuario)
+        Agendamento.objects.create(
+            paciente=self.usuario,
+            medico=self.medico,
+            data_hora=timezone.now() + timedelta(days=1),
+            status='solicitado'
+        )
+
+        response = self.client.get('/meus-agendamentos/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/meus-agendamentos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Qualquer alteração no agendamento muda a versão e invalida a ETag, mas
+        # só depois do commit: antes dele a listagem ainda mostra o estado antigo
+        with self.captureOnCommitCallbacks() as callbacks:
+            Agendamento.objects.create(
+                paciente=self.usuario,
+                medico=self.medico,
+                data_hora=timezone.now() + timedelta(days=2),
+                status='solicitado'
+            )
+            response = self.client.get('/meus-agendamentos/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        for callback in callbacks:
+            callback()
+        response = self.client.get('/meus-agendamentos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_anexo_invalida_etag(self):
+        self.client.force_authenticate(user=self.usuario)
+        agendamento = Agendamento.objects.create(
+            paciente=self.usuario, medico=self.medico,
+            data_hora=timezone.now() + timedelta(days=1), status='solicitado'
+        )
+        etag = self.client.get('/meus-agendamentos/')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            anexo = AnexoAgendamento.objects.create(
+                agendamento=agendamento, arquivo='anexos_agendamento/exame.pdf', nome_arquivo='exame.pdf'
+            )
+        response = self.client.get('/meus-agendamentos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results'][0]['anexos']), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            anexo.delete()
+        response = self.client.get('/meus-agendamentos/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['anexos'], [])
+
+    def test_listar_medicos_304(self):
+        response = self.client.get('/medicos/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        response = self.client.get('/medicos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            HorarioAtendimento.objects.create(
+                medico=self.medico,
+                dia_semana='segunda',
+                horarios=['09:00'],
+                local='Consultório 1'
+            )
+        response = self.client.get('/medicos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class TestesDiretorioMedicos(TestesBasicos):
+    """Diretório de médicos com prefetch e resposta renderizada em cache"""
+
+    def test_diretorio_em_cache_sem_consultas(self):
+        for i in range(3):
+            outro = self.Usuario.objects.create_user(
+                email=f'medico{i}@exemplo.com', password='senha123', nome=f'Dr. {i}',
+                tipo='medico', crm=f'9{i}', cpf=f'5550000000{i}'
+            )
+            HorarioAtendimento.objects.create(medico=outro, dia_semana='terca', horarios=['08:00'], local='Clínica')
+
+        # Médicos + horários + exceções, independente do número de médicos
+        with self.assertNumQueries(3):
+            response = self.client.get('/medicos/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            em_cache = self.client.get('/medicos/')
+        self.assertEqual(em_cache.content, response.content)
+        self.assertEqual(em_cache['Content-Type'], 'application/json')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            HorarioAtendimento.objects.create(medico=self.medico, dia_semana='segunda', horarios=['09:00'], local='Consultório 1')
+        medicos = json.loads(self.client.get('/medicos/').content)
+        medico = next(m for m in medicos if m['id'] == str(self.medico.id))
+        self.assertEqual(medico['horarios_atendimento']['segunda'], ['09:00'])
+
+    def test_busca_nao_vai_para_o_cache(self):
+        self.client.get('/medicos/', {'q': 'teste'})
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get('/medicos/', {'q': 'teste'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(len(consultas), 0)
+
+    def test_etag_muda_na_virada_do_dia(self):
+        etag = self.client.get('/medicos/')['ETag']
+        amanha = timezone.localdate() + timedelta(days=1)
+        with mock.patch('django.utils.timezone.localdate', return_value=amanha):
+            response = self.client.get('/medicos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_busca_medicos(self):
+        cardiologista = self.Usuario.objects.create_user(
+            email='cardio@exemplo.com', password='senha123', nome='Dra. Helena Prado', tipo='medico',
+            crm='54321', especialidade='Cardiologia', cidade='Campo Grande', cpf='11122233344'
+        )
+        HorarioAtendimento.objects.create(medico=self.medico, dia_semana='terca', horarios=['08:00'], local='Hospital Regional')
+
+        resultados = json.loads(self.client.get('/medicos/', {'q': 'cardiologia'}).content)
+        self.assertEqual([m['id'] for m in resultados['results']], [str(cardiologista.id)])
+
+        # Busca também pelo local de atendimento
+        resultados = json.loads(self.client.get('/medicos/', {'q': 'Regional'}).content)
+        self.assertEqual([m['id'] for m in resultados['results']], [str(self.medico.id)])
+
+        resultados = json.loads(self.client.get('/medicos/', {'q': 'dr', 'page_size': 1}).content)
+        self.assertEqual(len(resultados['results']), 1)
+        self.assertIsNotNone(resultados['next'])
+
+class TestesDisponibilidade(TestesBasicos):
+    def setUp(self):
+        super().setUp()
+        HorarioAtendimento.objects.create(
+            medico=self.medico,
+            dia_semana='segunda',
+            horarios=['09:00', '10:00', '11:00'],
+            local='Consultório 1',
+            duracao_consulta_minutos=30,
+            intervalo_consulta_minutos=10
+        )
+        hoje = timezone.localdate()
+        self.segunda = hoje + timedelta(days=(7 - hoje.weekday()) % 7 or 7)
+
+    def em(self, hhmm):
+        hora, minuto = map(int, hhmm.split(':'))
+        return timezone.make_aware(datetime.combine(self.segunda, time(hora, minuto)))
+
+    def test_disponibilidade_desconta_agendamentos_ativos(self):
+        """Agendamentos ativos ocupam a vaga; cancelados não"""
+        Agendamento.objects.create(paciente=self.usuario, medico=self.medico, data_hora=self.em('09:00'), status='agendado')
+        Agendamento.objects.create(paciente=self.usuario, medico=self.medico, data_hora=self.em('10:00'), status='cancelado')
+        # Começa 20 min antes das 11:00: a consulta + intervalo invade a vaga das 11:00
+        Agendamento.objects.create(paciente=self.usuario, medico=self.medico, data_hora=self.em('10:40'), status='solicitado')
+
+        response = self.client.get(f'/medicos/{self.medico.id}/disponibilidade/', {
+            'de': self.segunda.isoformat(),
+            'ate': self.segunda.isoformat(),
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([h['inicio'] for h in response.data['horarios']], [self.em('10:00')])
+
+    def test_disponibilidade_periodo_invalido(self):
+        response = self.client.get(f'/medicos/{self.medico.id}/disponibilidade/', {
+            'de': self.segunda.isoformat(),
+            'ate': (self.segunda + timedelta(days=120)).isoformat(),
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(f'/medicos/{self.usuario.id}/disponibilidade/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+    def test_agendamento_sobreposto_retorna_409(self):
+        self.client.force_authenticate(user=self.usuario)
+        response = self.client.post('/agendamentos/', {
+            'medico_id': str(self.medico.id), 'data_hora': self.em('09:00').isoformat(),
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # 09:30 cai no intervalo de 10 min depois da consulta das 09:00
+        response = self.client.post('/agendamentos/', {
+            'medico_id': str(self.medico.id), 'data_hora': self.em('09:30').isoformat(),
+        })
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        # Cancelado libera o horário
+        Agendamento.objects.update(status='cancelado')
+        response = self.client.post('/agendamentos/', {
+            'medico_id': str(self.medico.id), 'data_hora': self.em('09:30').isoformat(),
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_primeiras_vagas_entre_medicos(self):
+        cardiologista = self.Usuario.objects.create_user(
+            email='cardio@exemplo.com', password='senha123', nome='Dra. Cardio', tipo='medico',
+            crm='54321', especialidade='Cardiologia', cidade='Campo Grande', cpf='11122233344'
+        )
+        HorarioAtendimento.objects.create(
+            medico=cardiologista, dia_semana='segunda', horarios=['08:30', '09:00'], local='Hospital Central'
+        )
+        Agendamento.objects.create(paciente=self.usuario, medico=self.medico, data_hora=self.em('09:00'), status='agendado')
+
+        periodo = {'de': self.segunda.isoformat(), 'ate': self.segunda.isoformat()}
+        response = self.client.get('/medicos/primeiras-vagas/', {**periodo, 'limite': 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(h['medico']['id'], h['inicio']) for h in response.data['horarios']],
+            [(str(cardiologista.id), self.em('08:30')), (str(cardiologista.id), self.em('09:00')),
+             (str(self.medico.id), self.em('10:00'))]
+        )
+
+        response = self.client.get('/medicos/primeiras-vagas/', {**periodo, 'especialidade': 'clínico'})
+        self.assertEqual([h['inicio'] for h in response.data['horarios']], [self.em('10:00'), self.em('11:00')])
+
+        response = self.client.get('/medicos/primeiras-vagas/', {**periodo, 'cidade': 'campo grande', 'local': 'hospital'})
+        self.assertEqual(len(response.data['horarios']), 2)
+
+    def test_excecoes_por_data(self):
+        periodo = {'de': self.segunda.isoformat(), 'ate': self.segunda.isoformat()}
+        url = f'/medicos/{self.medico.id}/disponibilidade/'
+        bloqueio = ExcecaoHorario.objects.create(
+            medico=self.medico, data_inicio=self.segunda, data_fim=self.segunda,
+            tipo='bloqueio', horarios=['09:00-10:00'], motivo='Reunião'
+        )
+        response = self.client.get(url, periodo)
+        self.assertEqual([h['inicio'] for h in response.data['horarios']], [self.em('10:00'), self.em('11:00')])
+
+        # Feriado: dia todo bloqueado, com um plantão extra à tarde
+        bloqueio.horarios = []
+        bloqueio.save()
+        ExcecaoHorario.objects.create(
+            medico=self.medico, data_inicio=self.segunda - timedelta(days=1), data_fim=self.segunda,
+            tipo='extra', horarios=['14:00-15:00'], local='Plantão', duracao_consulta_minutos=20,
+            intervalo_consulta_minutos=10
+        )
+        response = self.client.get(url, periodo)
+        self.assertEqual(
+            [(h['inicio'], h['local']) for h in response.data['horarios']],
+            [(self.em('14:00'), 'Plantão'), (self.em('14:30'), 'Plantão')]
+        )
+
+        medicos = json.loads(self.client.get('/medicos/').content)
+        medico = next(m for m in medicos if m['id'] == str(self.medico.id))
+        self.assertEqual([e['tipo'] for e in medico['excecoes_horario']], ['extra', 'bloqueio'])
+
+@override_settings(MEDAGENDA_SLOTS_MATERIALIZADOS=True, MEDAGENDA_SLOTS_HORIZONTE_DIAS=14)
+class TestesSlotsMaterializados(TestesDisponibilidade):
+    """Os mesmos cenários, lendo da tabela de slots"""
+
+    def test_slots_acompanham_horarios_e_agendamentos(self):
+        # 3 horários por segunda dentro do horizonte de 14 dias
+        self.assertEqual(Slot.objects.filter(inicio=self.em('09:00')).count(), 1)
+        segundas = Slot.objects.filter(medico=self.medico).count() // 3
+        self.assertIn(segundas, (2, 3))
+
+        agendamento = Agendamento.objects.create(
+            paciente=self.usuario, medico=self.medico, data_hora=self.em('09:00'), status='agendado'
+        )
+        self.assertEqual(Slot.objects.get(inicio=self.em('09:00')).estado, 'ocupado')
+
+        # Remarcação libera o horário antigo e ocupa o novo
+        agendamento.data_hora = self.em('11:00')
+        agendamento.save()
+        self.assertEqual(Slot.objects.get(inicio=self.em('09:00')).estado, 'livre')
+        self.assertEqual(Slot.objects.get(inicio=self.em('11:00')).estado, 'ocupado')
+
+        agendamento.status = 'cancelado'
+        agendamento.save()
+        self.assertEqual(Slot.objects.get(inicio=self.em('11:00')).estado, 'livre')
+
+        # Mudança nos horários: só a diferença é gravada
+        horario = HorarioAtendimento.objects.get(medico=self.medico)
+        id_09 = Slot.objects.get(inicio=self.em('09:00')).id
+        horario.horarios = ['09:00', '10:00']
+        horario.save()
+        self.assertFalse(Slot.objects.filter(inicio=self.em('11:00')).exists())
+        self.assertEqual(Slot.objects.get(inicio=self.em('09:00')).id, id_09)
+
+    def test_estender_slots(self):
+        Slot.objects.all().delete()
+        call_command('estender_slots', stdout=StringIO())
+        self.assertTrue(Slot.objects.filter(inicio=self.em('09:00')).exists())
+
+    def test_agendamento_alem_do_horizonte(self):
+        HorizonteSlots.objects.create(ate=horizonte_slots())  # execução anterior do estender_slots
+        distante = self.em('09:00') + timedelta(weeks=10)
+        Agendamento.objects.create(paciente=self.usuario, medico=self.medico, data_hora=distante, status='agendado')
+        # Fora do horizonte nada é materializado
+        self.assertFalse(Slot.objects.filter(inicio__gte=distante - timedelta(days=1)).exists())
+
+        with self.settings(MEDAGENDA_SLOTS_HORIZONTE_DIAS=30):
+            call_command('estender_slots', stdout=StringIO())
+            dia = self.segunda + timedelta(weeks=3)
+            inicios = [vaga.inicio for vaga in vagas_livres(self.medico.id, dia, dia)]
+            self.assertEqual(len(inicios), 3)
+            self.assertEqual(inicios, [vaga.inicio for vaga in calcular_disponibilidade(self.medico.id, dia, dia)])
+
+
+class BackendEmailComFalha(BaseEmailBackend):
+    """Backend de testes que recusa todas as mensagens"""
+    def send_messages(self, email_messages):
+        raise ConnectionError('servidor SMTP fora do ar')
+
+
+class BackendEmailQueAnota(BaseEmailBackend):
+    """Backend de testes que guarda o estado da fila no momento de cada envio"""
+    estados = []
+
+    def send_messages(self, email_messages):
+        BackendEmailQueAnota.estados.append(list(EmailOutbox.objects.values_list('estado', flat=True)))
+        return len(email_messages)
+
+
+class TestesFilaEmails(TestesBasicos):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.usuario)
+
+    def criar_agendamento(self):
+        data_hora = (timezone.now() + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+        return self.client.post('/agendamentos/', {
+            'medico_id': str(self.medico.id),
+            'data_hora': data_hora.isoformat(),
+        })
+
+    def test_agendamento_enfileira_email(self):
+        response = self.criar_agendamento()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # A view só grava na fila; nada é enviado durante a requisição
+        self.assertEqual(len(mail.outbox), 0)
+        email = EmailOutbox.objects.get()
+        self.assertEqual(email.destinatarios, [self.medico.email])
+        self.assertEqual(email.estado, 'pendente')
+
+        saida = StringIO()
+        call_command('enviar_emails', stdout=saida)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'Nova solicitação de agendamento')
+        email.refresh_from_db()
+        self.assertEqual(email.estado, 'enviado')
+        self.assertIn('1 emails enviados', saida.getvalue())
+
+    def test_conflito_nao_enfileira_email(self):
+        self.criar_agendamento()
+        response = self.criar_agendamento()
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+
+    @override_settings(
+        EMAIL_BACKEND='core.tests.BackendEmailComFalha',
+        MEDAGENDA_EMAIL_MAX_TENTATIVAS=2,
+        MEDAGENDA_EMAIL_BACKOFF_SEGUNDOS=60,
+    )
+    def test_falhas_reagendam_e_descartam(self):
+        self.criar_agendamento()
+        call_command('enviar_emails', stdout=StringIO())
+        email = EmailOutbox.objects.get()
+        self.assertEqual((email.estado, email.tentativas), ('pendente', 1))
+        self.assertIn('SMTP', email.ultimo_erro)
+        self.assertGreater(email.proxima_tentativa, timezone.now() + timedelta(seconds=50))
+
+        # Ainda não chegou a hora da próxima tentativa
+        call_command('enviar_emails', stdout=StringIO())
+        email.refresh_from_db()
+        self.assertEqual(email.tentativas, 1)
+
+        EmailOutbox.objects.update(proxima_tentativa=timezone.now())
+        call_command('enviar_emails', stdout=StringIO())
+        email.refresh_from_db()
+        self.assertEqual((email.estado, email.tentativas), ('falhou', 2))
+
+
+    @override_settings(EMAIL_BACKEND='core.tests.BackendEmailQueAnota', MEDAGENDA_EMAIL_RESERVA_SEGUNDOS=600)
+    def test_envio_com_lote_reservado(self):
+        BackendEmailQueAnota.estados = []
+        self.criar_agendamento()
+        call_command('enviar_emails', stdout=StringIO())
+        # Durante o envio o email já estava reservado (e a reserva gravada)
+        self.assertEqual(BackendEmailQueAnota.estados, [['enviando']])
+        self.assertEqual(EmailOutbox.objects.get().estado, 'enviado')
+
+        # Reserva de um worker que morreu: só volta para a fila quando vence
+        EmailOutbox.objects.update(estado='enviando', proxima_tentativa=timezone.now() + timedelta(minutes=5))
+        call_command('enviar_emails', stdout=StringIO())
+        self.assertEqual(len(BackendEmailQueAnota.estados), 1)
+        EmailOutbox.objects.update(proxima_tentativa=timezone.now())
+        call_command('enviar_emails', stdout=StringIO())
+        self.assertEqual(len(BackendEmailQueAnota.estados), 2)
+        self.assertEqual(EmailOutbox.objects.get().estado, 'enviado')
+
+    @override_settings(MEDAGENDA_EMAIL_RETENCAO_DIAS=30)
+    def test_purgar_emails_enviados(self):
+        self.criar_agendamento()
+        call_command('enviar_emails', stdout=StringIO())
+        antigo = EmailOutbox.objects.get()
+        pendente = enfileirar_email('Pendente', 'texto', ['a@exemplo.com'])
+        call_command('purgar_emails', stdout=StringIO())
+        self.assertEqual(EmailOutbox.objects.count(), 2)
+
+        EmailOutbox.objects.filter(pk=antigo.pk).update(enviado_em=timezone.now() - timedelta(days=31))
+        EmailOutbox.objects.filter(pk=pendente.pk).update(criado_em=timezone.now() - timedelta(days=31))
+        call_command('purgar_emails', lote=1, stdout=StringIO())
+        self.assertEqual(list(EmailOutbox.objects.values_list('pk', flat=True)), [pendente.pk])
+
+    def test_resumo_diario_para_medico(self):
+        self.medico.preferencia_notificacao = 'resumo'
+        self.medico.save()
+        self.assertEqual(self.criar_agendamento().status_code, status.HTTP_201_CREATED)
+        # Sem email imediato: a solicitação entra no resumo do dia
+        self.assertFalse(EmailOutbox.objects.exists())
+
+        hoje = timezone.localdate()
+        with self.assertNumQueries(6):  # solicitações + resumos já enviados + inserções em lote (com savepoint)
+            call_command('enviar_resumo_medicos', data=hoje.isoformat(), stdout=StringIO())
+        email = EmailOutbox.objects.get()
+        self.assertEqual(email.destinatarios, [self.medico.email])
+        self.assertIn('Agendamento Solicitado (1):', email.mensagem)
+        self.assertIn(self.usuario.nome, email.mensagem)
+
+        # Rodar de novo não repete o resumo
+        call_command('enviar_resumo_medicos', data=hoje.isoformat(), stdout=StringIO())
+        call_command('enviar_resumo_medicos', data=(hoje - timedelta(days=1)).isoformat(), stdout=StringIO())
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+        self.assertTrue(ResumoEnviado.objects.filter(medico=self.medico, data=hoje).exists())
+
+    def test_resumo_pelo_dia_da_solicitacao(self):
+        self.medico.preferencia_notificacao = 'resumo'
+        self.medico.save()
+        ontem = timezone.localdate() - timedelta(days=1)
+        anteontem = ontem - timedelta(days=1)
+        agora = timezone.now()
+        def pedido(dias_atras):
+            agendamento = Agendamento.objects.create(
+                paciente=self.usuario, medico=self.medico, data_hora=agora + timedelta(days=1, hours=dias_atras),
+            )
+            # Pedido há `dias_atras` dias e alterado agora: conta no resumo do dia do pedido
+            Agendamento.objects.filter(pk=agendamento.pk).update(created_at=agora - timedelta(days=dias_atras))
+        pedido(1)
+        pedido(2)
+        # O último resumo foi de três dias atrás: a execução cobre anteontem e ontem
+        ResumoEnviado.objects.create(medico=self.usuario, data=ontem - timedelta(days=2))
+
+        call_command('enviar_resumo_medicos', stdout=StringIO())
+        self.assertEqual(
+            sorted(ResumoEnviado.objects.filter(medico=self.medico).values_list('data', flat=True)),
+            [anteontem, ontem],
+        )
+        self.assertEqual(EmailOutbox.objects.count(), 2)
+
+        call_command('enviar_resumo_medicos', stdout=StringIO())
+        self.assertEqual(EmailOutbox.objects.count(), 2)
+
+    def test_lembretes_de_consulta(self):
+        agora = timezone.now()
+        def agendar(horas, status_agendamento='agendado'):
+            return Agendamento.objects.create(
+                paciente=self.usuario, medico=self.medico,
+                data_hora=agora + timedelta(hours=horas), status=status_agendamento,
+            )
+        amanha = agendar(23)
+        daqui_a_pouco = agendar(1)
+        agendar(30)
+        agendar(1, 'solicitado')
+
+        call_command('enviar_lembretes', stdout=StringIO())
+        self.assertEqual(
+            set(LembreteEnviado.objects.values_list('agendamento_id', 'tipo')),
+            {(amanha.id, '24h'), (daqui_a_pouco.id, '2h')},
+        )
+        self.assertEqual(EmailOutbox.objects.filter(destinatarios=[self.usuario.email]).count(), 2)
+
+        # Rodar de novo não repete nenhum lembrete
+        call_command('enviar_lembretes', stdout=StringIO())
+        self.assertEqual(LembreteEnviado.objects.count(), 2)
+        self.assertEqual(EmailOutbox.objects.count(), 2)
+
+@skipUnlessDBFeature('has_select_for_update')
+class TestesConcorrenciaAgendamento(TransactionTestCase):
+    """Reservas simultâneas não podem ocupar o mesmo horário"""
+    threads = 8
+    tentativas_por_thread = 10
+
+    def setUp(self):
+        Usuario = get_user_model()
+        self.medico = Usuario.objects.create_user(
+            email='medico@exemplo.com', password='senha123', nome='Dr. Teste',
+            tipo='medico', crm='12345', cpf='98765432100'
+        )
+        self.pacientes = [
+            Usuario.objects.create_user(
+                email=f'paciente{i}@exemplo.com', password='senha123', nome=f'Paciente {i}',
+                tipo='comum', cpf=f'{i:011d}'
+            )
+            for i in range(self.threads)
+        ]
+        HorarioAtendimento.objects.create(
+            medico=self.medico, dia_semana='segunda', horarios=['09:00'],
+            duracao_consulta_minutos=30, intervalo_consulta_minutos=0
+        )
+        hoje = timezone.localdate()
+        self.segunda = hoje + timedelta(days=(7 - hoje.weekday()) % 7 or 7)
+
+    def test_sem_reserva_dupla(self):
+        # Todas as threads disputam os mesmos horários, de 10 em 10 minutos
+        inicio = timezone.make_aware(datetime.combine(self.segunda, time(8, 0)))
+        horarios = [inicio + timedelta(minutes=10 * i) for i in range(self.tentativas_por_thread)]
+        barreira = threading.Barrier(self.threads)
+        resultados = {'criados': 0, 'conflitos': 0, 'erros': []}
+        trava = threading.Lock()
+
+        def reservar(paciente):
+            try:
+                barreira.wait()
+                for data_hora in horarios:
+                    try:
+                        reservar_horario(paciente, self.medico, data_hora)
+                        chave = 'criados'
+                    except ConflitoDeHorario:
+                        chave = 'conflitos'
+                    with trava:
+                        resultados[chave] += 1
+            except Exception as e:
+                with trava:
+                    resultados['erros'].append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=reservar, args=(p,)) for p in self.pacientes]
+        comeco = relogio.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        duracao = relogio.perf_counter() - comeco
+
+        self.assertEqual(resultados['erros'], [])
+        total = self.threads * self.tentativas_por_thread
+        self.assertEqual(resultados['criados'] + resultados['conflitos'], total)
+
+        datas = sorted(Agendamento.objects.filter(medico=self.medico).values_list('data_hora', flat=True))
+        self.assertEqual(len(datas), resultados['criados'])
+        for anterior, proxima in zip(datas, datas[1:]):
+            self.assertGreaterEqual(proxima - anterior, timedelta(minutes=30))
+        sys.stderr.write(
+            f"\n{total} tentativas de reserva em {duracao:.2f}s "
+            f"({total / duracao:.0f}/s), {resultados['criados']} criadas\n"
+        )
@@ -0,0 +1,108 @@
+"""
+Limite de requisições por balde de fichas (token bucket) para os endpoints
+públicos de cadastro e verificação.
+
+Cada chave (IP, ou email/CPF enviado no corpo) tem um balde com capacidade
+para N requisições, reabastecido continuamente à razão de N por período.
+As taxas seguem o formato do DRF ("5/min") em
+REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], uma por escopo.
+
+O IP vem do get_ident do DRF, limitado por REST_FRAMEWORK['NUM_PROXIES']:
+um X-Forwarded-For escolhido pelo cliente não troca a chave do balde.
+
+O estado fica no cache padrão, que precisa ser compartilhado entre os
+workers em produção (REDIS_URL). Sem ele o cache é local a cada processo e
+cada worker tem os próprios baldes: o limite efetivo vira N vezes o número
+de workers (o check core.W001 avisa quando DEBUG está desligado). A leitura e a gravação do balde não são
+atômicas: requisições simultâneas na mesma chave podem passar uma ou outra
+ficha do limite, o que é aceitável aqui. A recusa (429) acontece antes da
+view rodar, sem consultar o banco.
+"""
+import hashlib
+
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class BaldeDeFichasThrottle(SimpleRateThrottle):
+    cache_format = 'limite:%(scope)s:%(ident)s'
+
+    def identificador(self, request):
+        raise NotImplementedError
+
+    def get_cache_key(self, request, view):
+        ident = self.identificador(request)
+        if not ident:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def allow_request(self, request, view):
+        self.espera = None
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        capacidade, periodo = self.num_requests, self.duration
+        por_segundo = capacidade / periodo
+        agora = self.timer()
+        fichas, ultimo = self.cache.get(self.key, (capacidade, agora))
+        fichas = min(capacidade, fichas + (agora - ultimo) * por_segundo)
+        if fichas < 1:
+            self.espera = (1 - fichas) / por_segundo
+            return False
+        # Depois de um período sem uso o balde estaria cheio de novo: a chave pode expirar
+        self.cache.set(self.key, (fichas - 1, agora), periodo)
+        return True
+
+    def wait(self):
+        return self.espera
+
+
+class PorIPThrottle(BaldeDeFichasThrottle):
+    def identificador(self, request):
+        return self.get_ident(request)
+
+
+class PorCampoThrottle(BaldeDeFichasThrottle):
+    """Limita pelo valor de um campo do corpo (ex.: email), em qualquer IP."""
+    campo = None
+
+    def identificador(self, request):
+        valor = request.data.get(self.campo) if hasattr(request.data, 'get') else None
+        if not valor:
+            return None
+        # Hash: a chave não guarda o dado pessoal e tem tamanho fixo
+        return hashlib.sha256(str(valor).strip().lower().encode()).hexdigest()
+
+
+class EnviarCodigoPorIPThrottle(PorIPThrottle):
+    scope = 'enviar_codigo_ip'
+
+
+class EnviarCodigoPorEmailThrottle(PorCampoThrottle):
+    scope = 'enviar_codigo_email'
+    campo = 'email'
+
+
+class VerificarCodigoPorIPThrottle(PorIPThrottle):
+    scope = 'verificar_codigo_ip'
+
+
+class VerificarCodigoPorEmailThrottle(PorCampoThrottle):
+    scope = 'verificar_codigo_email'
+    campo = 'email'
+
+
+class ValidarCadastroPorIPThrottle(PorIPThrottle):
+    scope = 'validar_cadastro_ip'
+
+
+class ValidarEmailThrottle(PorCampoThrottle):
+    scope = 'validar_cadastro_valor'
+    campo = 'email'
+
+
+class ValidarCPFThrottle(PorCampoThrottle):
+    scope = 'validar_cadastro_valor'
+    campo = 'cpf'
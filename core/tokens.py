@@ -0,0 +1,216 @@
+"""
+Checagem da blacklist de refresh tokens sem consultar o banco.
+
+Com ROTATE_REFRESH_TOKENS + BLACKLIST_AFTER_ROTATION, todo refresh pergunta
+ao banco se o token recebido está na blacklist. Quase sempre a resposta é
+"não", então cada processo mantém um filtro de Bloom com os jti da
+blacklist ainda não expirados. Um jti fora do filtro certamente não estava
+na blacklist quando o filtro foi montado; dentro dele (ou em caso de falso
+positivo) a checagem vai ao banco, como antes.
+
+O filtro é montado na hora só na primeira vez em cada processo. Depois de
+MEDAGENDA_FILTRO_TOKENS_SEGUNDOS ele é remontado numa thread, sem segurar a
+requisição que percebeu o atraso; se a remontagem não terminar a tempo
+(filtro com mais que o dobro do intervalo), a checagem volta ao banco.
+
+Tokens colocados na blacklist depois da montagem ficam marcados no cache
+(signal em BlacklistedToken) por mais tempo que o filtro é usado. Essa
+marca só é vista pelos outros workers se o cache for compartilhado
+(REDIS_URL): com o cache local a cada processo o filtro fica desligado e
+toda checagem vai ao banco. A marca também não pode ser despejada: se o
+Redis apagar chaves por falta de memória, um token revogado passa até a
+próxima montagem. Use `maxmemory-policy noeviction` (ou memória de sobra).
+
+renovar_tokens é a renovação feita pelo ActivityMiddleware a partir do cookie
+do refresh token (AUTH_COOKIE_REFRESH).
+"""
+import hashlib
+import math
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from rest_framework.exceptions import APIException
+from rest_framework_simplejwt.exceptions import TokenBackendError, TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.state import token_backend
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+from .checks import cache_compartilhado
+from .models import Usuario
+
+logger = logging.getLogger(__name__)
+
+
+class FiltroBloom:
+    """Conjunto probabilístico: pode dar falso positivo, nunca falso negativo."""
+
+    def __init__(self, capacidade, taxa_erro=0.01):
+        capacidade = max(capacidade, 1)
+        self.tamanho = max(64, math.ceil(-capacidade * math.log(taxa_erro) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.tamanho / capacidade * math.log(2)))
+        self.bits = bytearray((self.tamanho + 7) // 8)
+
+    def _posicoes(self, valor):
+        # Duas metades de um único hash geram as k posições (double hashing)
+        digest = hashlib.blake2b(valor.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.tamanho for i in range(self.hashes)]
+
+    def adicionar(self, valor):
+        for posicao in self._posicoes(valor):
+            self.bits[posicao >> 3] |= 1 << (posicao & 7)
+
+    def __contains__(self, valor):
+        return all(self.bits[posicao >> 3] & (1 << (posicao & 7)) for posicao in self._posicoes(valor))
+
+
+_filtro = None
+_montado_em = 0.0
+_remontando = False
+_trava = threading.Lock()
+
+
+def intervalo_filtro():
+    return getattr(settings, 'MEDAGENDA_FILTRO_TOKENS_SEGUNDOS', 300)
+
+
+def _chave_revogado(jti):
+    return f'token_revogado:{jti}'
+
+
+def montar_filtro():
+    """Filtro com os jti de todos os tokens da blacklist que ainda não expiraram (uma consulta)."""
+    jtis = list(
+        BlacklistedToken.objects.filter(token__expires_at__gt=aware_utcnow()).values_list('token__jti', flat=True)
+    )
+    # Folga para os tokens que este processo colocar na blacklist até a próxima montagem
+    filtro = FiltroBloom(int(len(jtis) * 1.2) + 1000)
+    for jti in jtis:
+        filtro.adicionar(jti)
+    return filtro
+
+
+def _remontar():
+    global _filtro, _montado_em, _remontando
+    # O início conta como momento da montagem: revogações feitas durante a consulta ficam cobertas pela marca no cache
+    inicio = time.monotonic()
+    try:
+        filtro = montar_filtro()
+        with _trava:
+            _filtro, _montado_em = filtro, inicio
+    except Exception as e:
+        logger.warning(f"Falha ao remontar o filtro de tokens revogados: {e}")
+    finally:
+        _remontando = False
+        connection.close()
+
+
+def filtro_revogados():
+    """
+    Filtro atual deste processo, ou None se ele já passou do tempo em que
+    as marcas do cache cobrem as revogações mais novas.
+    """
+    global _filtro, _montado_em, _remontando
+    if _filtro is None:
+        with _trava:
+            if _filtro is None:
+                inicio = time.monotonic()
+                _filtro, _montado_em = montar_filtro(), inicio
+        return _filtro
+
+    idade = time.monotonic() - _montado_em
+    if idade > intervalo_filtro() and not _remontando:
+        with _trava:
+            if not _remontando:
+                _remontando = True
+                threading.Thread(target=_remontar, name='filtro-tokens', daemon=True).start()
+    return _filtro if idade <= 2 * intervalo_filtro() else None
+
+
+def descartar_filtro():
+    global _filtro, _remontando
+    _filtro = None
+    _remontando = False
+
+
+def marcar_revogado(jti):
+    """Chamado quando um token entra na blacklist."""
+    cache.set(_chave_revogado(jti), True, 2 * intervalo_filtro() + 60)
+    if _filtro is not None:
+        _filtro.adicionar(jti)
+
+
+def talvez_revogado(jti):
+    if not cache_compartilhado():
+        # Outro worker pode ter revogado o token depois da montagem do filtro sem que este veja a marca
+        return True
+    filtro = filtro_revogados()
+    if filtro is None:
+        return True
+    return jti in filtro or cache.get(_chave_revogado(jti)) is not None
+
+
+class RefreshTokenComFiltro(RefreshToken):
+    def check_blacklist(self):
+        if talvez_revogado(self.payload[api_settings.JTI_CLAIM]):
+            super().check_blacklist()
+
+
+class RenovarTokenSerializer(TokenRefreshSerializer):
+    token_class = RefreshTokenComFiltro
+
+
+RENOVACAO_EM_ANDAMENTO = 'em_andamento'
+RENOVACAO_FEITA = 'feita'
+RENOVACAO_RECUSADA = 'recusada'
+
+
+def graca_renovacao():
+    return getattr(settings, 'MEDAGENDA_RENOVACAO_GRACA_SEGUNDOS', 10)
+
+
+def renovar_tokens(refresh, janela):
+    """
+    Novo par {'access', 'refresh'} a partir do refresh token, ou None se ele
+    não vale mais (expirado, na blacklist, usuário inativo).
+
+    Com ROTATE_REFRESH_TOKENS cada renovação põe o refresh token antigo na
+    blacklist: duas abas renovando ao mesmo tempo derrubariam uma à outra.
+    Por isso cada refresh token é renovado no máximo uma vez por `janela`
+    segundos (cache.add é atômico). As requisições que chegam logo depois
+    recebem o par já gerado, mas só por MEDAGENDA_RENOVACAO_GRACA_SEGUNDOS:
+    passado esse tempo o token antigo (já na blacklist) não rende mais nada.
+    """
+    try:
+        # Só assinatura e validade: o token pode já estar na blacklist por esta mesma renovação
+        jti = token_backend.decode(refresh, verify=True)[api_settings.JTI_CLAIM]
+    except (TokenBackendError, KeyError):
+        return None
+
+    chave = f'renovacao_token:{jti}'
+    chave_par = f'renovacao_token_par:{jti}'
+    if not cache.add(chave, RENOVACAO_EM_ANDAMENTO, janela):
+        # Outra requisição ainda está renovando (segue com o token atual) ou a graça acabou
+        return cache.get(chave_par)
+
+    serializer = RenovarTokenSerializer(data={'refresh': refresh})
+    try:
+        serializer.is_valid(raise_exception=True)
+    except (APIException, TokenError, Usuario.DoesNotExist):
+        cache.set(chave, RENOVACAO_RECUSADA, janela)
+        return None
+    tokens = {
+        'access': serializer.validated_data['access'],
+        'refresh': serializer.validated_data.get('refresh', refresh),
+    }
+    cache.set(chave, RENOVACAO_FEITA, janela)
+    cache.set(chave_par, tokens, graca_renovacao())
+    return tokens
@@ -1,13 +1,13 @@
 from django.urls import path
 from .views_auth import register, login_view, MinhaContaView, validar_cpf, validar_email, MedicoMeView, FotoUsuarioView, verificar_senha, verificar_sessao
-from .views_agendamento import CriarAgendamentoView, AtualizarAgendamentoView, DeletarAgendamentoView, MeusAgendamentosView, UploadAnexoView, DownloadAnexoEspecificoView, DeletarAnexoView, AtualizarStatusAgendamentoView
+from .views_agendamento import CriarAgendamentoView, AtualizarAgendamentoView, DeletarAgendamentoView, MeusAgendamentosView, UploadAnexoView, DownloadAnexoEspecificoView, DeletarAnexoView, AtualizarStatusAgendamentoView, ExportarAgendamentosView, SincronizarAgendamentosView
 from .views_google import google_login, google_redirect, criar_evento_google
 from .views import CustomTokenObtainPairView
 from .views import enviar_codigo as enviar_codigo_verificacao, validar_codigo as verificar_codigo
 from .views import resetar_senha
 from .views_verificacao import send_code_view
 from rest_framework.routers import DefaultRouter
-from .views import HorarioAtendimentoViewSet, TestViewSet, ListarMedicosView
+from .views import HorarioAtendimentoViewSet, TestViewSet, ListarMedicosView, DisponibilidadeMedicoView, PrimeirasVagasView, ExcecaoHorarioViewSet
 from .views import criar_superusuario
 from django.conf import settings
 from django.conf.urls.static import static
@@ -15,6 +15,7 @@ from django.views.decorators.csrf import csrf_exempt
 
 router = DefaultRouter()
 router.register(r'horarios-atendimento', HorarioAtendimentoViewSet, basename='horarios-atendimento')
+router.register(r'excecoes-horario', ExcecaoHorarioViewSet, basename='excecoes-horario')
 router.register(r'test', TestViewSet, basename='test')
 
 # Rotas do aplicativo core (diretas)
@@ -25,6 +26,8 @@ core_urlpatterns = [
     path('usuarios/verificar-senha/', verificar_senha, name='verificar_senha'),
     path('usuarios/verificar-sessao/', verificar_sessao, name='verificar_sessao'),
     path('meus-agendamentos/', MeusAgendamentosView.as_view(), name='meus_agendamentos'),
+    path('meus-agendamentos/export/', ExportarAgendamentosView.as_view(), name='exportar_agendamentos'),
+    path('meus-agendamentos/sync/', SincronizarAgendamentosView.as_view(), name='sincronizar_agendamentos'),
     path('agendamentos/criar/', CriarAgendamentoView.as_view(), name='criar_agendamento'),
     path('agendamentos/<uuid:pk>/atualizar/', AtualizarAgendamentoView.as_view(), name='atualizar-agendamento'),
     path('agendamentos/<int:pk>/status/', AtualizarStatusAgendamentoView.as_view(), name='atualizar-status-agendamento'),
@@ -35,6 +38,8 @@ core_urlpatterns = [
     path('agendamentos/anexos/<int:pk>/deletar/', csrf_exempt(DeletarAnexoView.as_view()), name='deletar-anexo'),
     path('medico/me/', MedicoMeView.as_view(), name='medico_me'),
     path('medicos/', ListarMedicosView.as_view(), name='listar_medicos'),
+    path('medicos/primeiras-vagas/', PrimeirasVagasView.as_view(), name='primeiras_vagas'),
+    path('medicos/<uuid:pk>/disponibilidade/', DisponibilidadeMedicoView.as_view(), name='disponibilidade_medico'),
     # Google Calendar
     path('google/login/', google_login, name='google_login'),
     path('google/redirect/', google_redirect, name='google_redirect'),
@@ -2,26 +2,45 @@ from django.shortcuts import render
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .serializers import CustomTokenObtainPairSerializer, AgendamentoSerializer
 from django.core.management import call_command
-from django.utils.crypto import get_random_string
-from django.core.mail import send_mail
-from .models import CodigoVerificacao, Agendamento
-from rest_framework.decorators import api_view, action
+from .models import Agendamento
+from rest_framework.decorators import api_view, action, authentication_classes, throttle_classes
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
-from .models import CodigoVerificacao
 import random
 from django.core.cache import cache
 from django.http import HttpResponse
 from rest_framework import viewsets, permissions, generics
 from rest_framework.permissions import AllowAny
+from rest_framework.exceptions import PermissionDenied, ValidationError
 import logging
+from uuid import UUID
 from rest_framework import status
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from .cache_versoes import gerar_etag, invalidar_diretorio_medicos, versao_diretorio_medicos
+from .slots import primeiras_vagas_livres, sincronizar_slots_horizonte, slots_materializados_ativos, vagas_livres
+from .agendamentos import ConflitoDeHorario, alterar_status, reservar_horario
+from .emails import enfileirar_email
+from .throttling import (
+    EnviarCodigoPorEmailThrottle, EnviarCodigoPorIPThrottle,
+    VerificarCodigoPorEmailThrottle, VerificarCodigoPorIPThrottle,
+)
+from .codigos import BLOQUEADO, EXPIRADO, VALIDO, criar_codigo, verificar_codigo
+from .busca_medicos import buscar_medicos
+from .pagination import BuscaMedicosPagination
+from rest_framework.views import APIView
+from rest_framework.generics import get_object_or_404
+from django.utils import timezone
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils.dateparse import parse_date
+from datetime import timedelta
 
 
 # views.py
-from .models import HorarioAtendimento
-from .serializers import HorarioAtendimentoSerializer
+from .models import HorarioAtendimento, ExcecaoHorario
+from .serializers import HorarioAtendimentoSerializer, ExcecaoHorarioSerializer
 
 # ViewSet de teste
 class TestViewSet(viewsets.ViewSet):
@@ -45,6 +64,8 @@ class CustomTokenObtainPairView(TokenObtainPairView):
 
 
 @api_view(['POST'])
+@authentication_classes([])
+@throttle_classes([EnviarCodigoPorIPThrottle, EnviarCodigoPorEmailThrottle])
 def enviar_codigo(request):
     """
     Endpoint para enviar código de verificação.
@@ -73,53 +94,47 @@ def enviar_codigo(request):
             return Response({"erro": "E-mail já cadastrado."}, status=400)
 
     try:
-        # Remove códigos anteriores
-        CodigoVerificacao.objects.filter(email=email).delete()
-
-        # Gera novo código
-        novo_codigo = get_random_string(length=6, allowed_chars='0123456789')
-
-        # Salva novo código
-        CodigoVerificacao.objects.create(email=email, codigo=novo_codigo)
-
-        # Prepara a mensagem baseada no tipo
-        if tipo == "recuperacao":
-            subject = 'Código de verificação - Recuperação de Senha'
-            message = f"""
-            Olá {usuario.nome or 'Usuário'},
-
-            Você solicitou a recuperação de senha no MedAgenda.
-            Seu código de verificação é: {novo_codigo}
-
-            Este código é válido por 30 minutos.
-            Se você não solicitou esta recuperação de senha, por favor ignore este email.
-
-            Atenciosamente,
-            Equipe MedAgenda
-            """
-        else:  # registro
-            subject = 'Código de verificação - Cadastro'
-            message = f"""
-            Olá,
-
-            Bem-vindo ao MedAgenda!
-            Seu código de verificação para completar o cadastro é: {novo_codigo}
-
-            Este código é válido por 30 minutos.
-            Use-o para confirmar seu cadastro em nossa plataforma.
-
-            Atenciosamente,
-            Equipe MedAgenda
-            """
-
-        # Envia o código
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email='medagendasistema@gmail.com',
-            recipient_list=[email],
-            fail_silently=False,
-        )
+        with transaction.atomic():
+            # Gera novo código (o anterior deixa de valer)
+            novo_codigo = criar_codigo(email)
+
+            # Prepara a mensagem baseada no tipo
+            if tipo == "recuperacao":
+                subject = 'Código de verificação - Recuperação de Senha'
+                message = f"""
+                Olá {usuario.nome or 'Usuário'},
+
+                Você solicitou a recuperação de senha no MedAgenda.
+                Seu código de verificação é: {novo_codigo}
+
+                Este código é válido por 30 minutos.
+                Se você não solicitou esta recuperação de senha, por favor ignore este email.
+
+                Atenciosamente,
+                Equipe MedAgenda
+                """
+            else:  # registro
+                subject = 'Código de verificação - Cadastro'
+                message = f"""
+                Olá,
+
+                Bem-vindo ao MedAgenda!
+                Seu código de verificação para completar o cadastro é: {novo_codigo}
+
+                Este código é válido por 30 minutos.
+                Use-o para confirmar seu cadastro em nossa plataforma.
+
+                Atenciosamente,
+                Equipe MedAgenda
+                """
+
+            # Coloca o código na fila de envio, na mesma transação
+            enfileirar_email(
+                assunto=subject,
+                mensagem=message,
+                destinatarios=[email],
+                confidencial=True,
+            )
 
         return Response({
             "mensagem": "Código enviado com sucesso para o e-mail.",
@@ -132,19 +147,20 @@ def enviar_codigo(request):
         return Response({"erro": "Erro ao enviar código de verificação. Tente novamente mais tarde."}, status=500)
 
 @api_view(['POST'])
+@authentication_classes([])
+@throttle_classes([VerificarCodigoPorIPThrottle, VerificarCodigoPorEmailThrottle])
 def validar_codigo(request):
     email = request.data.get("email")
     codigo = request.data.get("codigo")
 
-    try:
-        registro = CodigoVerificacao.objects.get(email=email, codigo=codigo)
-        if not registro.esta_valido():
-            return Response({"erro": "Código expirado."}, status=400)
-
+    situacao = verificar_codigo(email, codigo)
+    if situacao == VALIDO:
         return Response({"mensagem": "Código válido!"})
-
-    except CodigoVerificacao.DoesNotExist:
-        return Response({"erro": "Código inválido."}, status=400)
+    if situacao == EXPIRADO:
+        return Response({"erro": "Código expirado."}, status=400)
+    if situacao == BLOQUEADO:
+        return Response({"erro": "Muitas tentativas. Solicite um novo código."}, status=429)
+    return Response({"erro": "Código inválido."}, status=400)
 
 
 
@@ -172,6 +188,8 @@ def criar_superusuario(request):
 
 
 @api_view(['POST'])
+@authentication_classes([])
+@throttle_classes([VerificarCodigoPorIPThrottle, VerificarCodigoPorEmailThrottle])
 def resetar_senha(request):
     """
     Endpoint para resetar a senha do usuário.
@@ -197,10 +215,14 @@ def resetar_senha(request):
         return Response({"erro": "A senha deve ter pelo menos 8 caracteres."}, status=400)
 
     try:
-        # Verifica se o código é válido
-        codigo_verificacao = CodigoVerificacao.objects.get(email=email, codigo=codigo)
-        if not codigo_verificacao.esta_valido():
+        # Verifica o código e o descarta se for válido (uso único)
+        situacao = verificar_codigo(email, codigo, consumir=True)
+        if situacao == EXPIRADO:
             return Response({"erro": "Código expirado. Por favor, solicite um novo código."}, status=400)
+        if situacao == BLOQUEADO:
+            return Response({"erro": "Muitas tentativas. Por favor, solicite um novo código."}, status=429)
+        if situacao != VALIDO:
+            return Response({"erro": "Código inválido. Verifique o código e tente novamente."}, status=400)
 
         # Busca o usuário
         Usuario = get_user_model()
@@ -213,16 +235,11 @@ def resetar_senha(request):
         usuario.password = make_password(nova_senha)
         usuario.save()
 
-        # Remove o código de verificação usado
-        codigo_verificacao.delete()
-
         return Response({
             "mensagem": "Senha atualizada com sucesso!",
             "email": email
         })
 
-    except CodigoVerificacao.DoesNotExist:
-        return Response({"erro": "Código inválido. Verifique o código e tente novamente."}, status=400)
     except Exception as e:
         logger.error(f"Erro ao resetar senha: {str(e)}")
         return Response({"erro": "Erro ao processar a solicitação. Tente novamente mais tarde."}, status=500)
@@ -306,7 +323,7 @@ class HorarioAtendimentoViewSet(viewsets.ModelViewSet):
         horario = self.get_object()
         if request.user != horario.medico:
             logger.error(f"Usuário {request.user} não tem permissão para atualizar este horário")
-            raise permissions.PermissionDenied("Você só pode atualizar seus próprios horários")
+            raise PermissionDenied("Você só pode atualizar seus próprios horários")
         
         response = super().update(request, *args, **kwargs)
         logger.info(f"Horário atualizado com sucesso: {response.data}")
@@ -321,26 +338,326 @@ class HorarioAtendimentoViewSet(viewsets.ModelViewSet):
         horario = self.get_object()
         if request.user != horario.medico:
             logger.error(f"Usuário {request.user} não tem permissão para deletar este horário")
-            raise permissions.PermissionDenied("Você só pode deletar seus próprios horários")
+            raise PermissionDenied("Você só pode deletar seus próprios horários")
         
         response = super().destroy(request, *args, **kwargs)
         logger.info("Horário deletado com sucesso")
         return response
 
+    @action(detail=False, methods=['put'], url_path='semana')
+    def semana(self, request):
+        """
+        Grava a semana inteira do médico em uma transação.
+
+        Recebe {"dias": [{dia_semana, local, horarios, ...}, ...], "remover_ausentes": false}.
+        Cada item é identificado por (dia_semana, local): cria os novos, atualiza
+        os que mudaram e, com remover_ausentes, exclui os que não vieram.
+        Devolve a diferença aplicada.
+        """
+        if getattr(request.user, 'tipo', None) != 'medico':
+            return Response(
+                {"erro": "Apenas médicos podem criar horários de atendimento"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        dias = request.data.get('dias')
+        if not isinstance(dias, list) or not dias:
+            return Response({'erro': 'O campo dias deve ser uma lista não vazia.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer(data=dias, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        recebidos = {}
+        for dados in serializer.validated_data:
+            chave = (dados['dia_semana'], dados['local'])
+            if chave in recebidos:
+                return Response(
+                    {'erro': f'Dia {chave[0]} repetido para o local {chave[1]}.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            recebidos[chave] = dados
+
+        campos = ['horarios', 'indisponivel', 'duracao_consulta_minutos', 'intervalo_consulta_minutos']
+        criar, atualizar, remover = [], [], []
+        inalterados = 0
+        with transaction.atomic():
+            existentes = {}
+            for horario in HorarioAtendimento.objects.select_for_update().filter(medico=request.user).order_by('id'):
+                chave = (horario.dia_semana, horario.local)
+                if chave in existentes or chave not in recebidos:
+                    remover.append(horario)
+                else:
+                    existentes[chave] = horario
+
+            for chave, dados in recebidos.items():
+                horario = existentes.get(chave)
+                if horario is None:
+                    horario = HorarioAtendimento(medico=request.user, **dados)
+                    horario.atualizar_faixas()
+                    criar.append(horario)
+                    continue
+                alterado = False
+                for campo in campos:
+                    if campo in dados and getattr(horario, campo) != dados[campo]:
+                        setattr(horario, campo, dados[campo])
+                        alterado = True
+                if alterado:
+                    horario.atualizar_faixas()
+                    atualizar.append(horario)
+                else:
+                    inalterados += 1
+
+            if not request.data.get('remover_ausentes'):
+                remover = []
+
+            HorarioAtendimento.objects.bulk_create(criar)
+            HorarioAtendimento.objects.bulk_update(atualizar, campos + ['faixas'])
+            removidos = [horario.id for horario in remover]
+            if removidos:
+                HorarioAtendimento.objects.filter(id__in=removidos).delete()
+
+        # bulk_create/bulk_update não disparam os signals de HorarioAtendimento
+        if criar or atualizar or removidos:
+            invalidar_diretorio_medicos()
+            if slots_materializados_ativos():
+                sincronizar_slots_horizonte(request.user.id)
+
+        logger.info(
+            f"Semana de {request.user} gravada: {len(criar)} criados, "
+            f"{len(atualizar)} atualizados, {len(removidos)} removidos"
+        )
+        return Response({
+            'criados': self.get_serializer(criar, many=True).data,
+            'atualizados': self.get_serializer(atualizar, many=True).data,
+            'removidos': removidos,
+            'inalterados': inalterados,
+        })
+
+class ExcecaoHorarioViewSet(viewsets.ModelViewSet):
+    """
+    Exceções por data da agenda do médico: bloqueios (feriados, férias)
+    e horários extras. Filtros opcionais `de` e `ate` (YYYY-MM-DD) trazem
+    só as exceções que cruzam o período.
+    """
+    serializer_class = ExcecaoHorarioSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = ExcecaoHorario.objects.order_by('data_inicio', 'id')
+        # Médico vê as suas; os demais podem consultar as de um médico específico
+        if getattr(self.request.user, 'tipo', None) == 'medico':
+            queryset = queryset.filter(medico=self.request.user)
+        else:
+            medico_id = self.request.query_params.get('medico_id')
+            if not medico_id:
+                return queryset.none()
+            try:
+                queryset = queryset.filter(medico_id=UUID(medico_id))
+            except ValueError:
+                raise ValidationError({'erro': 'medico_id inválido.'})
+
+        try:
+            de = parse_date(self.request.query_params.get('de') or '')
+            ate = parse_date(self.request.query_params.get('ate') or '')
+        except ValueError:
+            # Formato certo, data inexistente (ex.: mês 13)
+            raise ValidationError({'erro': 'Datas inválidas. Use o formato YYYY-MM-DD.'})
+        if de:
+            queryset = queryset.filter(data_fim__gte=de)
+        if ate:
+            queryset = queryset.filter(data_inicio__lte=ate)
+        return queryset
+
+    def check_object_permissions(self, request, obj):
+        super().check_object_permissions(request, obj)
+        if request.method not in permissions.SAFE_METHODS and request.user != obj.medico:
+            raise PermissionDenied("Você só pode alterar suas próprias exceções")
+
+    def create(self, request, *args, **kwargs):
+        if getattr(request.user, 'tipo', None) != 'medico':
+            return Response(
+                {"erro": "Apenas médicos podem cadastrar exceções de horário"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        return super().create(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        serializer.save(medico=self.request.user)
+
+def etag_diretorio_medicos(request, *args, **kwargs):
+    # A data entra porque as exceções vencidas saem da resposta na virada do dia
+    return gerar_etag(request, versao_diretorio_medicos(), timezone.localdate())
+
+
+@method_decorator(condition(etag_func=etag_diretorio_medicos), name='get')
 class ListarMedicosView(generics.ListAPIView):
+    """
+    Diretório público de médicos. Com `?q=`, busca por nome, especialidade,
+    cidade e local de atendimento, ordenada por relevância e paginada.
+
+    A listagem completa (sem parâmetros) em JSON já renderizada fica no cache
+    com a versão do diretório na chave; os signals de Usuario,
+    HorarioAtendimento e ExcecaoHorario trocam a versão. Sem autenticação, um
+    acerto no cache não consulta o banco. Buscas não vão para o cache: cada
+    termo livre viraria uma entrada nova.
+    """
     permission_classes = [AllowAny]
+    authentication_classes = []
+    pagination_class = BuscaMedicosPagination
     serializer_class = None  # Vamos criar o serializer depois
+    cache_timeout = 60 * 60
+    tamanho_maximo_busca = 100
 
     def get_queryset(self):
         User = get_user_model()
-        return User.objects.filter(tipo='medico', is_active=True).select_related()
+        excecoes = ExcecaoHorario.objects.filter(data_fim__gte=timezone.localdate())
+        return (
+            User.objects.filter(tipo='medico', is_active=True)
+            .only('id', 'email', 'nome', 'crm', 'especialidade', 'foto')
+            .prefetch_related('horarios_atendimento', Prefetch('excecoes_horario', queryset=excecoes))
+            .order_by('nome', 'id')
+        )
 
     def get_serializer_class(self):
         from .serializers import MedicoSerializer
         return MedicoSerializer
 
+    def termo_busca(self):
+        return ' '.join(self.request.query_params.get('q', '').split())[:self.tamanho_maximo_busca]
+
+    def filter_queryset(self, queryset):
+        termo = self.termo_busca()
+        return buscar_medicos(queryset, termo) if termo else queryset
+
+    def paginate_queryset(self, queryset):
+        # Sem busca, a listagem completa continua sendo uma lista simples
+        if not self.termo_busca():
+            return None
+        return super().paginate_queryset(queryset)
+
+    def chave_cache(self, request):
+        # Host e esquema entram por causa das URLs absolutas das fotos; a data, pelas exceções vencidas
+        return 'diretorio_medicos:' + gerar_etag(
+            request, versao_diretorio_medicos(), timezone.localdate(), request.accepted_media_type
+        )
+
+    def get(self, request, *args, **kwargs):
+        # O navegador da API (HTML) depende do usuário e do CSRF: só o JSON sem parâmetros vai para o cache
+        if request.accepted_renderer.format != 'json' or request.query_params:
+            return super().get(request, *args, **kwargs)
+
+        chave = self.chave_cache(request)
+        em_cache = cache.get(chave)
+        if em_cache is not None:
+            conteudo, content_type = em_cache
+            return HttpResponse(conteudo, content_type=content_type)
+
+        response = super().get(request, *args, **kwargs)
+
+        def guardar(response):
+            if response.status_code == 200:
+                cache.set(chave, (response.content, response['Content-Type']), self.cache_timeout)
+
+        response.add_post_render_callback(guardar)
+        return response
+
+def ler_periodo(params, dias_padrao, dias_maximo):
+    """Lê `de` e `ate` (YYYY-MM-DD) da query string. Retorna (de, ate, erro)."""
+    de = params.get('de')
+    ate = params.get('ate')
+    try:
+        de = parse_date(de) if de else timezone.localdate()
+        ate = parse_date(ate) if ate else de + timedelta(days=dias_padrao)
+    except ValueError:
+        de = ate = None
+    if de is None or ate is None:
+        return None, None, 'Datas inválidas. Use o formato YYYY-MM-DD.'
+    if ate < de:
+        return None, None, 'A data final deve ser posterior à inicial.'
+    if (ate - de).days > dias_maximo:
+        return None, None, f'O período máximo é de {dias_maximo} dias.'
+    return de, ate, None
+
+class DisponibilidadeMedicoView(APIView):
+    """
+    Horários livres de um médico entre `de` e `ate` (YYYY-MM-DD, inclusive),
+    já descontados os agendamentos ativos.
+    """
+    permission_classes = [AllowAny]
+    dias_padrao = 30
+    dias_maximo = 90
+
+    def get(self, request, pk):
+        medico = get_object_or_404(get_user_model(), pk=pk, tipo='medico', is_active=True)
+
+        de, ate, erro = ler_periodo(request.query_params, self.dias_padrao, self.dias_maximo)
+        if erro:
+            return Response({'erro': erro}, status=status.HTTP_400_BAD_REQUEST)
+
+        vagas = vagas_livres(medico.pk, de, ate)
+        return Response({
+            'medico_id': str(medico.pk),
+            'de': de,
+            'ate': ate,
+            'horarios': [
+                {'inicio': vaga.inicio, 'fim': vaga.fim, 'local': vaga.local}
+                for vaga in vagas
+            ],
+        })
+
+class PrimeirasVagasView(APIView):
+    """
+    Primeiros horários livres entre todos os médicos que atendem aos filtros
+    `especialidade`, `cidade` e `local`. Ex.: o primeiro cardiologista livre em Campo Grande.
+    """
+    permission_classes = [AllowAny]
+    limite_padrao = 10
+    limite_maximo = 50
+    dias_padrao = 30
+    dias_maximo = 90
+
+    def get(self, request):
+        de, ate, erro = ler_periodo(request.query_params, self.dias_padrao, self.dias_maximo)
+        if erro:
+            return Response({'erro': erro}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limite = int(request.query_params.get('limite', self.limite_padrao))
+        except ValueError:
+            return Response({'erro': 'O limite deve ser um número inteiro.'}, status=status.HTTP_400_BAD_REQUEST)
+        limite = max(1, min(limite, self.limite_maximo))
+
+        medicos = get_user_model().objects.filter(tipo='medico', is_active=True)
+        especialidade = request.query_params.get('especialidade')
+        if especialidade:
+            medicos = medicos.filter(especialidade__icontains=especialidade)
+        cidade = request.query_params.get('cidade')
+        if cidade:
+            medicos = medicos.filter(cidade__icontains=cidade)
+
+        vagas = primeiras_vagas_livres(medicos, limite, de, ate, local=request.query_params.get('local'))
+        dados_medicos = get_user_model().objects.in_bulk({medico_id for medico_id, _ in vagas})
+        return Response({
+            'de': de,
+            'ate': ate,
+            'horarios': [
+                {
+                    'medico': {
+                        'id': str(medico_id),
+                        'nome': dados_medicos[medico_id].nome,
+                        'especialidade': dados_medicos[medico_id].especialidade,
+                        'cidade': dados_medicos[medico_id].cidade,
+                    },
+                    'inicio': vaga.inicio,
+                    'fim': vaga.fim,
+                    'local': vaga.local,
+                }
+                for medico_id, vaga in vagas
+            ],
+        })
+
 class AgendamentoViewSet(viewsets.ModelViewSet):
-    queryset = Agendamento.objects.all()
+    queryset = Agendamento.objects.com_relacionados()
     serializer_class = AgendamentoSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -358,38 +675,37 @@ class AgendamentoViewSet(viewsets.ModelViewSet):
             if not data_hora:
                 return Response({'erro': 'O campo data_hora é obrigatório.'}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Cria o agendamento
-            agendamento = Agendamento.objects.create(
-                paciente=request.user,
-                medico=medico,
-                data_hora=data_hora,
-                status='solicitado'
-            )
-
-            # Envia email de notificação para o médico
+            # Cria o agendamento (recusa se o horário já estiver ocupado) e coloca
+            # a notificação do médico na fila, na mesma transação
             try:
-                # Envia email diretamente
-                send_mail(
-                    subject='Nova solicitação de agendamento',
-                    message=f"""
-                    Olá Dr(a). {medico.nome},
+                with transaction.atomic():
+                    agendamento = reservar_horario(
+                        paciente=request.user,
+                        medico=medico,
+                        data_hora=data_hora,
+                        status='solicitado'
+                    )
+                    # Médicos com resumo diário recebem tudo em enviar_resumo_medicos
+                    if medico.preferencia_notificacao == 'imediato':
+                        enfileirar_email(
+                            assunto='Nova solicitação de agendamento',
+                            mensagem=f"""
+                            Olá Dr(a). {medico.nome},
                     
-                    Você recebeu uma nova solicitação de agendamento:
+                            Você recebeu uma nova solicitação de agendamento:
                     
-                    Paciente: {request.user.nome}
-                    Data e Hora: {data_hora}
+                            Paciente: {request.user.nome}
+                            Data e Hora: {data_hora}
                     
-                    Acesse sua agenda para confirmar ou recusar este agendamento.
+                            Acesse sua agenda para confirmar ou recusar este agendamento.
                     
-                    Atenciosamente,
-                    Equipe MedAgenda
-                    """,
-                    from_email='medagendasistema@gmail.com',
-                    recipient_list=[medico.email],
-                    fail_silently=False,
-                )
-            except Exception as e:
-                logger.error(f"Erro ao enviar email de solicitação: {str(e)}")
+                            Atenciosamente,
+                            Equipe MedAgenda
+                            """,
+                            destinatarios=[medico.email],
+                        )
+            except ConflitoDeHorario as e:
+                return Response({'erro': str(e)}, status=status.HTTP_409_CONFLICT)
 
             serializer = self.get_serializer(agendamento)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -405,14 +721,14 @@ class AgendamentoViewSet(viewsets.ModelViewSet):
         Aceita um agendamento e envia email para o paciente.
         """
         agendamento = self.get_object()
-        agendamento.status = 'agendado'
-        agendamento.save()
-        
-        # Envia email de confirmação para o paciente
-        try:
-            send_mail(
-                subject='Seu agendamento foi confirmado',
-                message=f"""
+        with transaction.atomic():
+            try:
+                alterar_status(agendamento, 'agendado')
+            except ConflitoDeHorario as e:
+                return Response({'erro': str(e)}, status=status.HTTP_409_CONFLICT)
+            enfileirar_email(
+                assunto='Seu agendamento foi confirmado',
+                mensagem=f"""
                 Olá {agendamento.paciente.nome},
                 
                 Seu agendamento foi confirmado:
@@ -425,12 +741,8 @@ class AgendamentoViewSet(viewsets.ModelViewSet):
                 Atenciosamente,
                 Equipe MedAgenda
                 """,
-                from_email='medagendasistema@gmail.com',
-                recipient_list=[agendamento.paciente.email],
-                fail_silently=False,
+                destinatarios=[agendamento.paciente.email],
             )
-        except Exception as e:
-            logger.error(f"Erro ao enviar email de confirmação: {str(e)}")
         
         return Response({'status': 'agendamento aceito'})
 
@@ -445,14 +757,12 @@ class AgendamentoViewSet(viewsets.ModelViewSet):
         if request.user != agendamento.medico and request.user != agendamento.paciente:
             return Response({'erro': 'Você não tem permissão para cancelar este agendamento.'}, status=status.HTTP_403_FORBIDDEN)
         
-        agendamento.status = 'cancelado'
-        agendamento.save()
-        
-        # Envia email de cancelamento para o paciente
-        try:
-            send_mail(
-                subject='Seu agendamento foi cancelado',
-                message=f"""
+        with transaction.atomic():
+            agendamento.status = 'cancelado'
+            agendamento.save()
+            enfileirar_email(
+                assunto='Seu agendamento foi cancelado',
+                mensagem=f"""
                 Olá {agendamento.paciente.nome},
                 
                 Seu agendamento foi cancelado:
@@ -465,12 +775,8 @@ class AgendamentoViewSet(viewsets.ModelViewSet):
                 Atenciosamente,
                 Equipe MedAgenda
                 """,
-                from_email='medagendasistema@gmail.com',
-                recipient_list=[agendamento.paciente.email],
-                fail_silently=False,
+                destinatarios=[agendamento.paciente.email],
             )
-        except Exception as e:
-            logger.error(f"Erro ao enviar email de cancelamento: {str(e)}")
         
         return Response({'status': 'agendamento cancelado'})
 
@@ -535,15 +841,9 @@ def enviar_email_agendamento(request):
     else:
         return Response({"erro": "Tipo de email inválido"}, status=400)
     
-    try:
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email='medagendasistema@gmail.com',
-            recipient_list=[recipient],
-            fail_silently=False,
-        )
-        return Response({"mensagem": "Email enviado com sucesso"})
-    except Exception as e:
-        logger.error(f"Erro ao enviar email: {str(e)}")
-        return Response({"erro": "Falha ao enviar email"}, status=500)
+    enfileirar_email(
+        assunto=subject,
+        mensagem=message,
+        destinatarios=[recipient],
+    )
+    return Response({"mensagem": "Email colocado na fila de envio"})
@@ -1,48 +1,248 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import Agendamento, Usuario, AnexoAgendamento
+from .models import Agendamento, AgendamentoRemovido, Usuario, AnexoAgendamento
 from .serializers import AgendamentoSerializer, AnexoAgendamentoSerializer
+from .pagination import AgendamentoCursorPagination
+from .cache_versoes import gerar_etag, versao_agendamentos
+from .agendamentos import ConflitoDeHorario, alterar_status, reservar_horario
+from .emails import enfileirar_email
+from .authentication import JWTClaimsAuthentication
 from rest_framework import status
 from rest_framework.generics import get_object_or_404
 from django.utils.dateparse import parse_datetime
+from django.utils import timezone
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from datetime import timedelta
 from uuid import UUID
-from django.http import FileResponse, Http404
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+import csv
+import json
 import os
 from django.views.decorators.csrf import csrf_exempt
-from django.core.mail import send_mail
+from django.views.decorators.http import condition
+from django.utils.decorators import method_decorator
 import logging
 
 logger = logging.getLogger(__name__)
 
+def filtrar_agendamentos_do_usuario(request):
+    """Agendamentos do usuário autenticado com os filtros de status e data."""
+    user = request.user
+
+    # Base: paciente ou médico
+    if user.tipo == 'medico':
+        agendamentos = Agendamento.objects.filter(medico=user)
+    else:
+        agendamentos = Agendamento.objects.filter(paciente=user)
+
+    # Filtro por status
+    status_param = request.query_params.get('status')
+    if status_param:
+        agendamentos = agendamentos.filter(status=status_param)
+
+    # Filtro por faixa de data
+    data_inicial = request.query_params.get('data_inicial')
+    data_final = request.query_params.get('data_final')
+    if data_inicial:
+        agendamentos = agendamentos.filter(data_hora__gte=parse_datetime(data_inicial))
+    if data_final:
+        agendamentos = agendamentos.filter(data_hora__lte=parse_datetime(data_final))
+
+    return agendamentos
+
+
+def etag_meus_agendamentos(request, *args, **kwargs):
+    # Só lê o contador de versão no cache: um If-None-Match válido vira 304 sem consultar o banco
+    return gerar_etag(request, request.user.pk, versao_agendamentos(request.user.pk))
+
+
+@method_decorator(condition(etag_func=etag_meus_agendamentos), name='get')
 class MeusAgendamentosView(APIView):
+    # Só precisa de id e tipo do usuário: vêm do token, sem consulta
+    authentication_classes = [JWTClaimsAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = AgendamentoCursorPagination
+
+    def get(self, request):
+        agendamentos = filtrar_agendamentos_do_usuario(request).com_relacionados()
+
+        # Paginação por cursor em (data_hora, id): custo constante por página
+        paginator = self.pagination_class()
+        pagina = paginator.paginate_queryset(agendamentos, request, view=self)
+        serializer = AgendamentoSerializer(pagina, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
+    
+class SincronizarAgendamentosView(APIView):
+    """
+    Sincronização incremental: devolve só os agendamentos alterados e os
+    removidos desde o último token recebido pelo cliente.
+
+    Sem `since`, devolve todos os agendamentos (carga inicial). As respostas
+    vêm em páginas de até `limite` agendamentos, em ordem de updated_at:
+    enquanto `mais` for true, o cliente chama de novo com o token recebido.
+    O token é opaco e assinado; o cliente deve guardar o da última página e
+    enviá-lo na próxima sincronização. Tokens mais antigos que a retenção dos
+    registros de remoção (MEDAGENDA_SINCRONIZACAO_RETENCAO_DIAS) recebem 410:
+    o cliente precisa refazer a carga inicial.
+    """
+    authentication_classes = [JWTClaimsAuthentication]
+    permission_classes = [IsAuthenticated]
+    salt = 'core.sincronizar_agendamentos'
+    # Cobre transações que gravaram updated_at antes do token mas só commitaram depois
+    margem = timedelta(seconds=30)
+    limite = 500
+
+    def ler_token(self, token):
+        """(desde, inicio, apos) do token; desde é None na carga inicial."""
+        dados = signing.loads(token, salt=self.salt)
+        if isinstance(dados, str):
+            # Token de sincronização concluída: {desde}
+            dados = {'desde': dados}
+        desde = parse_datetime(dados['desde']) if dados.get('desde') else None
+        inicio = parse_datetime(dados['inicio']) if dados.get('inicio') else None
+        apos = None
+        if dados.get('apos'):
+            apos = (parse_datetime(dados['apos'][0]), UUID(dados['apos'][1]))
+        return desde, inicio, apos
 
     def get(self, request):
         user = request.user
+        agora = timezone.now()
 
-        # Base: paciente ou médico
-        if user.tipo == 'medico':
-            agendamentos = Agendamento.objects.filter(medico=user)
+        desde = inicio = apos = None
+        token = request.query_params.get('since')
+        if token:
+            try:
+                desde, inicio, apos = self.ler_token(token)
+            except (signing.BadSignature, TypeError, ValueError, KeyError, IndexError):
+                return Response({'erro': 'Token de sincronização inválido.'}, status=status.HTTP_400_BAD_REQUEST)
+            if desde is None and inicio is None:
+                return Response({'erro': 'Token de sincronização inválido.'}, status=status.HTTP_400_BAD_REQUEST)
+            retencao = timedelta(days=settings.MEDAGENDA_SINCRONIZACAO_RETENCAO_DIAS)
+            if (inicio or desde) < agora - retencao:
+                return Response(
+                    {'erro': 'Token de sincronização expirado. Refaça a carga inicial.'},
+                    status=status.HTTP_410_GONE
+                )
+        # Início desta sincronização: vira o `desde` da próxima quando a última página sair
+        inicio = inicio or agora
+
+        campo = 'medico' if user.tipo == 'medico' else 'paciente'
+        alterados = Agendamento.objects.filter(**{campo: user}).com_relacionados().order_by('updated_at', 'id')
+        removidos = []
+        if desde is not None:
+            corte = desde - self.margem
+            alterados = alterados.filter(updated_at__gte=corte)
+            if apos is None:
+                # Só na primeira página; remoções durante a paginação saem na próxima sincronização
+                removidos = (
+                    AgendamentoRemovido.objects.filter(**{campo: user}, removido_em__gte=corte)
+                    .values_list('agendamento_id', flat=True)
+                )
+        if apos is not None:
+            alterados = alterados.filter(Q(updated_at__gt=apos[0]) | Q(updated_at=apos[0], id__gt=apos[1]))
+
+        pagina = list(alterados[:self.limite + 1])
+        mais = len(pagina) > self.limite
+        pagina = pagina[:self.limite]
+
+        if mais:
+            ultimo = pagina[-1]
+            proximo = {
+                'desde': desde.isoformat() if desde is not None else None,
+                'inicio': inicio.isoformat(),
+                'apos': [ultimo.updated_at.isoformat(), str(ultimo.pk)],
+            }
         else:
-            agendamentos = Agendamento.objects.filter(paciente=user)
-
-        # Filtro por status
-        status_param = request.query_params.get('status')
-        if status_param:
-            agendamentos = agendamentos.filter(status=status_param)
-
-        # Filtro por faixa de data
-        data_inicial = request.query_params.get('data_inicial')
-        data_final = request.query_params.get('data_final')
-        if data_inicial:
-            agendamentos = agendamentos.filter(data_hora__gte=parse_datetime(data_inicial))
-        if data_final:
-            agendamentos = agendamentos.filter(data_hora__lte=parse_datetime(data_final))
-
-        serializer = AgendamentoSerializer(agendamentos, many=True, context={'request': request})
-        return Response(serializer.data)
-    
+            proximo = {'desde': inicio.isoformat()}
+
+        serializer = AgendamentoSerializer(pagina, many=True, context={'request': request})
+        return Response({
+            'alterados': serializer.data,
+            'removidos': [str(pk) for pk in removidos],
+            'token': signing.dumps(proximo, salt=self.salt),
+            'mais': mais,
+        })
+
+
+class Echo:
+    """Pseudo-buffer para o csv.writer: devolve a linha em vez de guardá-la."""
+    def write(self, value):
+        return value
+
+
+class ExportarAgendamentosView(APIView):
+    """
+    Exporta o histórico completo de agendamentos do usuário em NDJSON ou CSV.
+
+    As linhas são lidas com um cursor no servidor (iterator) e enviadas
+    conforme são geradas, então o uso de memória não depende do total exportado.
+    """
+    authentication_classes = [JWTClaimsAuthentication]
+    permission_classes = [IsAuthenticated]
+    chunk_size = 2000
+    campos = [
+        'id', 'paciente_nome', 'paciente_email', 'medico_nome', 'medico_email',
+        'status', 'data_hora', 'total_anexos',
+    ]
+
+    def get(self, request):
+        formato = request.query_params.get('formato', 'ndjson')
+        if formato not in ('ndjson', 'csv'):
+            return Response({'erro': 'Formato inválido. Use ndjson ou csv.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Contagem de anexos por subconsulta: evita GROUP BY sobre todo o histórico
+        total_anexos = (
+            AnexoAgendamento.objects.filter(agendamento=OuterRef('pk'))
+            .order_by()
+            .values('agendamento')
+            .annotate(total=Count('id'))
+            .values('total')
+        )
+        linhas = (
+            filtrar_agendamentos_do_usuario(request)
+            .order_by('data_hora', 'id')
+            .values_list(
+                'id',
+                F('paciente__nome'),
+                F('paciente__email'),
+                F('medico__nome'),
+                F('medico__email'),
+                'status',
+                'data_hora',
+                Coalesce(Subquery(total_anexos), 0),
+            )
+            .iterator(chunk_size=self.chunk_size)
+        )
+
+        if formato == 'csv':
+            response = StreamingHttpResponse(self.gerar_csv(linhas), content_type='text/csv; charset=utf-8')
+            response['Content-Disposition'] = 'attachment; filename="agendamentos.csv"'
+        else:
+            response = StreamingHttpResponse(self.gerar_ndjson(linhas), content_type='application/x-ndjson')
+            response['Content-Disposition'] = 'attachment; filename="agendamentos.ndjson"'
+        return response
+
+    def formatar(self, linha):
+        agendamento_id, *meio, data_hora, total = linha
+        return [str(agendamento_id), *meio, data_hora.isoformat(), total]
+
+    def gerar_csv(self, linhas):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.campos)
+        for linha in linhas:
+            yield writer.writerow(self.formatar(linha))
+
+    def gerar_ndjson(self, linhas):
+        for linha in linhas:
+            yield json.dumps(dict(zip(self.campos, self.formatar(linha))), ensure_ascii=False) + '\n'
+
+
 class CriarAgendamentoView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -65,38 +265,38 @@ class CriarAgendamentoView(APIView):
             except Usuario.DoesNotExist:
                 return Response({'erro': 'Médico não encontrado.'}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Cria o agendamento
-            agendamento = Agendamento.objects.create(
-                paciente=user,
-                medico=medico,
-                data_hora=data_hora,
-                status='solicitado',
-                observacoes=request.data.get('observacoes', '')
-            )
-
-            # Envia email de notificação para o médico
+            # Cria o agendamento (recusa se o horário já estiver ocupado) e coloca
+            # a notificação do médico na fila, na mesma transação
             try:
-                send_mail(
-                    subject='Nova solicitação de agendamento',
-                    message=f"""
-                    Olá Dr(a). {medico.nome},
+                with transaction.atomic():
+                    agendamento = reservar_horario(
+                        paciente=user,
+                        medico=medico,
+                        data_hora=data_hora,
+                        status='solicitado',
+                        observacoes=request.data.get('observacoes', '')
+                    )
+                    # Médicos com resumo diário recebem tudo em enviar_resumo_medicos
+                    if medico.preferencia_notificacao == 'imediato':
+                        enfileirar_email(
+                            assunto='Nova solicitação de agendamento',
+                            mensagem=f"""
+                            Olá Dr(a). {medico.nome},
                     
-                    Você recebeu uma nova solicitação de agendamento:
+                            Você recebeu uma nova solicitação de agendamento:
                     
-                    Paciente: {user.nome}
-                    Data e Hora: {data_hora}
+                            Paciente: {user.nome}
+                            Data e Hora: {data_hora}
                     
-                    Acesse sua agenda para confirmar ou recusar este agendamento.
+                            Acesse sua agenda para confirmar ou recusar este agendamento.
                     
-                    Atenciosamente,
-                    Equipe MedAgenda
-                    """,
-                    from_email='medagendasistema@gmail.com',
-                    recipient_list=[medico.email],
-                    fail_silently=False,
-                )
-            except Exception as e:
-                logger.error(f"Erro ao enviar email de solicitação: {str(e)}")
+                            Atenciosamente,
+                            Equipe MedAgenda
+                            """,
+                            destinatarios=[medico.email],
+                        )
+            except ConflitoDeHorario as e:
+                return Response({'erro': str(e)}, status=status.HTTP_409_CONFLICT)
 
             serializer = AgendamentoSerializer(agendamento, context={'request': request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -237,59 +437,56 @@ class AtualizarStatusAgendamentoView(APIView):
             if novo_status not in dict(Agendamento.STATUS_CHOICES):
                 return Response({'erro': 'Status inválido.'}, status=400)
 
-            # Atualiza apenas o status
-            agendamento.status = novo_status
-            agendamento.save()
+            # Email para o paciente conforme o novo status
+            recipient = None
+            if novo_status == 'agendado':
+                # Email de confirmação para o paciente
+                subject = 'Seu agendamento foi confirmado'
+                message = f"""
+                Olá {agendamento.paciente.nome},
+                
+                Seu agendamento foi confirmado:
+                
+                Médico: Dr(a). {agendamento.medico.nome}
+                Data e Hora: {agendamento.data_hora}
+                
+                Não se esqueça de sua consulta!
+                
+                Atenciosamente,
+                Equipe MedAgenda
+                """
+                recipient = agendamento.paciente.email
+            
+            elif novo_status == 'cancelado':
+                # Email de cancelamento para o paciente
+                subject = 'Seu agendamento foi cancelado'
+                message = f"""
+                Olá {agendamento.paciente.nome},
+                
+                Seu agendamento foi cancelado:
+                
+                Médico: Dr(a). {agendamento.medico.nome}
+                Data e Hora: {agendamento.data_hora}
+                
+                Caso queira reagendar, acesse nossa plataforma.
+                
+                Atenciosamente,
+                Equipe MedAgenda
+                """
+                recipient = agendamento.paciente.email
 
-            # Envia email baseado no novo status
+            # Atualiza apenas o status; o email vai para a fila na mesma transação
             try:
-                if novo_status == 'agendado':
-                    # Email de confirmação para o paciente
-                    subject = 'Seu agendamento foi confirmado'
-                    message = f"""
-                    Olá {agendamento.paciente.nome},
-                    
-                    Seu agendamento foi confirmado:
-                    
-                    Médico: Dr(a). {agendamento.medico.nome}
-                    Data e Hora: {agendamento.data_hora}
-                    
-                    Não se esqueça de sua consulta!
-                    
-                    Atenciosamente,
-                    Equipe MedAgenda
-                    """
-                    recipient = agendamento.paciente.email
-                
-                elif novo_status == 'cancelado':
-                    # Email de cancelamento para o paciente
-                    subject = 'Seu agendamento foi cancelado'
-                    message = f"""
-                    Olá {agendamento.paciente.nome},
-                    
-                    Seu agendamento foi cancelado:
-                    
-                    Médico: Dr(a). {agendamento.medico.nome}
-                    Data e Hora: {agendamento.data_hora}
-                    
-                    Caso queira reagendar, acesse nossa plataforma.
-                    
-                    Atenciosamente,
-                    Equipe MedAgenda
-                    """
-                    recipient = agendamento.paciente.email
-
-                # Envia o email se houver um destinatário definido
-                if 'recipient' in locals():
-                    send_mail(
-                        subject=subject,
-                        message=message,
-                        from_email='medagendasistema@gmail.com',
-                        recipient_list=[recipient],
-                        fail_silently=False,
-                    )
-            except Exception as e:
-                logger.error(f"Erro ao enviar email: {str(e)}")
+                with transaction.atomic():
+                    alterar_status(agendamento, novo_status)
+                    if recipient:
+                        enfileirar_email(
+                            assunto=subject,
+                            mensagem=message,
+                            destinatarios=[recipient],
+                        )
+            except ConflitoDeHorario as e:
+                return Response({'erro': str(e)}, status=status.HTTP_409_CONFLICT)
 
             serializer = AgendamentoSerializer(agendamento, context={'request': request})
             return Response(serializer.data)
@@ -314,15 +511,13 @@ class CancelarAgendamentoView(APIView):
             if request.user != agendamento.medico and request.user != agendamento.paciente:
                 return Response({'erro': 'Você não tem permissão para cancelar este agendamento.'}, status=status.HTTP_403_FORBIDDEN)
 
-            # Atualiza o status para cancelado
-            agendamento.status = 'cancelado'
-            agendamento.save()
-
-            # Envia email de cancelamento para o paciente
-            try:
-                send_mail(
-                    subject='Seu agendamento foi cancelado',
-                    message=f"""
+            # Atualiza o status para cancelado e coloca o email do paciente na fila
+            with transaction.atomic():
+                agendamento.status = 'cancelado'
+                agendamento.save()
+                enfileirar_email(
+                    assunto='Seu agendamento foi cancelado',
+                    mensagem=f"""
                     Olá {agendamento.paciente.nome},
                     
                     Seu agendamento foi cancelado:
@@ -335,12 +530,8 @@ class CancelarAgendamentoView(APIView):
                     Atenciosamente,
                     Equipe MedAgenda
                     """,
-                    from_email='medagendasistema@gmail.com',
-                    recipient_list=[agendamento.paciente.email],
-                    fail_silently=False,
+                    destinatarios=[agendamento.paciente.email],
                 )
-            except Exception as e:
-                logger.error(f"Erro ao enviar email de cancelamento: {str(e)}")
 
             return Response({'status': 'agendamento cancelado'})
 
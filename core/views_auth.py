@@ -1,5 +1,5 @@
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes, throttle_classes
 from rest_framework.response import Response
 from django.contrib.auth import authenticate, login
 from .models import Usuario
@@ -9,11 +9,16 @@ from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.permissions import IsAuthenticated
 from .serializers import MeuTokenSerializer
 from django.db import IntegrityError
+from django.middleware.csrf import get_token
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
 from django.utils import timezone
+from .throttling import ValidarCadastroPorIPThrottle, ValidarCPFThrottle, ValidarEmailThrottle
 
 @api_view(['POST'])
 def register(request):
@@ -123,10 +128,15 @@ class LoginComCookieView(TokenObtainPairView):
                 httponly=True,
                 samesite="Lax"
             )
+            # Com o cookie, POST/PUT/PATCH/DELETE exigem o token CSRF: o CsrfViewMiddleware
+            # grava o cookie csrftoken na resposta e o cliente o devolve no header X-CSRFToken
+            get_token(request)
         
         return response
     
 @api_view(["POST"])
+@authentication_classes([])
+@throttle_classes([ValidarCadastroPorIPThrottle, ValidarCPFThrottle])
 def validar_cpf(request):
     cpf = request.data.get("cpf")
 
@@ -139,6 +149,8 @@ def validar_cpf(request):
     return Response({"mensagem": "CPF válido."}, status=status.HTTP_200_OK)
 
 @api_view(["POST"])
+@authentication_classes([])
+@throttle_classes([ValidarCadastroPorIPThrottle, ValidarEmailThrottle])
 def validar_email(request):
     email = request.data.get("email")
 
@@ -232,69 +244,50 @@ def verificar_senha(request):
         return Response({'erro': 'Senha incorreta'}, status=400)
 
 @api_view(['GET'])
-@permission_classes([IsAuthenticated])
+@authentication_classes([])
+@permission_classes([])
 def verificar_sessao(request):
     """
-    Verifica o status da sessão do usuário e retorna informações sobre o tempo restante
+    Verifica o status da sessão do usuário e retorna informações sobre o tempo restante.
+
+    O frontend chama este endpoint a cada poucos segundos em cada aba, então ele
+    só confere a assinatura e a expiração do token de acesso (uma vez) e responde
+    com os claims, sem consultar o banco.
     """
-    try:
-        # Log para debug
-        print(f"Headers recebidos: {request.headers}")
-        print(f"Cookies recebidos: {request.COOKIES}")
-        
-        # Tenta obter o token do cookie primeiro
-        access_token = request.COOKIES.get('access_token')
-        
-        # Se não encontrar no cookie, tenta no header
-        if not access_token:
-            auth_header = request.headers.get('Authorization', '')
-            if auth_header.startswith('Bearer '):
-                access_token = auth_header.split(' ')[1]
-        
-        if not access_token:
-            print("Token não encontrado (nem no cookie nem no header)")
-            return Response({
-                'status': 'invalido',
-                'mensagem': 'Token não encontrado'
-            }, status=401)
-            
-        # Decodifica o token de acesso
-        from rest_framework_simplejwt.tokens import AccessToken
-        token = AccessToken(access_token)
-        
-        # Calcula o tempo restante
-        tempo_restante = token.lifetime - (timezone.now() - token.current_time)
-        
-        # Log para debug
-        print(f"Token válido. Tempo restante: {tempo_restante.total_seconds()} segundos")
-        
-        # Se o tempo restante for menor que 5 minutos, retorna um aviso
-        if tempo_restante.total_seconds() < 300:  # 5 minutos
-            return Response({
-                'status': 'proximo_expirar',
-                'tempo_restante': tempo_restante.total_seconds(),
-                'ultimo_acesso': request.user.last_login,
-                'usuario': {
-                    'id': str(request.user.id),
-                    'email': request.user.email,
-                    'tipo': request.user.tipo
-                }
-            })
-        
+    # Tenta obter o token do cookie primeiro; se não houver, do header
+    access_token = request.COOKIES.get('access_token')
+    if not access_token:
+        auth_header = request.headers.get('Authorization', '')
+        if auth_header.startswith('Bearer '):
+            access_token = auth_header.split(' ', 1)[1]
+
+    if not access_token:
         return Response({
-            'status': 'valido',
-            'tempo_restante': tempo_restante.total_seconds(),
-            'ultimo_acesso': request.user.last_login,
-            'usuario': {
-                'id': str(request.user.id),
-                'email': request.user.email,
-                'tipo': request.user.tipo
-            }
-        })
+            'status': 'invalido',
+            'mensagem': 'Token não encontrado'
+        }, status=401)
 
-    except Exception as e:
-        print(f"Erro ao verificar sessão: {str(e)}")
+    try:
+        token = AccessToken(access_token)
+    except TokenError as e:
         return Response({
             'status': 'invalido',
             'mensagem': str(e)
         }, status=401)
+
+    agora = timezone.now()
+    tempo_restante = (datetime_from_epoch(token['exp']) - agora).total_seconds()
+    # Sem o banco não há last_login: a emissão do token marca o último login ou renovação
+    emitido_em = token.get('iat')
+
+    return Response({
+        # Menos de 5 minutos: avisa o frontend para renovar
+        'status': 'proximo_expirar' if tempo_restante < 300 else 'valido',
+        'tempo_restante': tempo_restante,
+        'ultimo_acesso': datetime_from_epoch(emitido_em) if emitido_em else None,
+        'usuario': {
+            'id': str(token.get(api_settings.USER_ID_CLAIM, '')),
+            'email': token.get('email'),
+            'tipo': token.get('tipo')
+        }
+    })
@@ -1,6 +1,5 @@
 import random
 from django.core.cache import cache
-from django.core.mail import send_mail
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status